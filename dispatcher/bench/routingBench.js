@@ -0,0 +1,155 @@
+// -----------------------------
+// Routing table benchmark
+// -----------------------------
+// Replays a connect storm (device connect -> interface link -> disconnect for N devices)
+// against the old per-event SQL and against the in-memory RoutingTable, using the same
+// pg pool, and reports per-event latency and how long the write-behind took to persist.
+//
+//   POSTGRES_URL=... node bench/routingBench.js [devices=2000] [concurrency=200]
+
+import { randomUUID } from "crypto";
+import { pool } from "../src/db.js";
+import { RoutingTable } from "../src/routing.js";
+
+const DEVICES = Number(process.argv[2] || 2000);
+const CONCURRENCY = Number(process.argv[3] || 200);
+const PREFIX = "RB";
+
+function percentile(values, pct) {
+    const sorted = [...values].sort((a, b) => a - b);
+    return sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * pct / 100))];
+}
+
+async function forEachLimited(items, limit, fn) {
+    let next = 0;
+    const workers = Array.from({ length: Math.min(limit, items.length) }, async () => {
+        while (next < items.length) await fn(items[next++]);
+    });
+    await Promise.all(workers);
+}
+
+async function timed(samples, fn) {
+    const t0 = process.hrtime.bigint();
+    await fn();
+    samples.push(Number(process.hrtime.bigint() - t0) / 1e6);
+}
+
+// ---- fixtures ----
+async function seed() {
+    const fleet = Array.from({ length: DEVICES }, (_, i) => ({
+        deviceId: randomUUID(), interfaceId: randomUUID(), socketId: `bench-${i}`,
+        code: PREFIX + i.toString(36).toUpperCase().padStart(6, "0")
+    }));
+    for (let i = 0; i < fleet.length; i += 1000) {
+        const chunk = fleet.slice(i, i + 1000);
+        await pool.query(
+            `INSERT INTO devices (device_id, type, ip, port, subnet, is_public, connection_code)
+             SELECT d, 'bench', '127.0.0.1', 10000 + n, '10.99.0.0/16', false, c
+             FROM unnest($1::uuid[], $2::text[], $3::int[]) AS t(d, c, n)`,
+            [chunk.map((f) => f.deviceId), chunk.map((f) => f.code), chunk.map((_, j) => i + j)]
+        );
+        await pool.query(
+            `INSERT INTO interfaces (interface_id, name, email, device_code)
+             SELECT u, 'bench', 'routing-bench@example.com', c FROM unnest($1::uuid[], $2::text[]) AS t(u, c)`,
+            [chunk.map((f) => f.interfaceId), chunk.map((f) => f.code)]
+        );
+    }
+    return fleet;
+}
+
+async function cleanup(fleet) {
+    const ids = fleet.map((f) => f.deviceId);
+    await pool.query(`DELETE FROM sessions WHERE device_id = ANY($1)`, [ids]);
+    await pool.query(`DELETE FROM interfaces WHERE interface_id = ANY($1)`, [fleet.map((f) => f.interfaceId)]);
+    await pool.query(`DELETE FROM devices WHERE device_id = ANY($1)`, [ids]);
+}
+
+// ---- the two implementations ----
+const legacy = {
+    async connect(f) {
+        await pool.query(
+            `INSERT INTO sessions (device_id, socket_id) VALUES ($1, $2)
+             ON CONFLICT (device_id) DO UPDATE SET socket_id = EXCLUDED.socket_id, updated_at = NOW()`,
+            [f.deviceId, f.socketId]
+        );
+    },
+    async link(f) {
+        const iface = await pool.query(
+            `SELECT i.interface_id, i.device_code, d.device_id, d.type
+             FROM interfaces i LEFT JOIN devices d ON i.device_code = d.connection_code
+             WHERE i.interface_id = $1`,
+            [f.interfaceId]
+        );
+        const deviceId = iface.rows[0].device_id;
+        const session = await pool.query(`SELECT * FROM sessions WHERE device_id = $1`, [deviceId]);
+        if (session.rows.length === 0) throw new Error("no session");
+        await pool.query(`UPDATE sessions SET interface_id = $1, updated_at = NOW() WHERE device_id = $2`, [f.interfaceId, deviceId]);
+    },
+    async disconnect(f) {
+        const res = await pool.query(`SELECT device_id FROM sessions WHERE socket_id = $1`, [f.socketId]);
+        for (const row of res.rows) await pool.query(`DELETE FROM sessions WHERE device_id = $1`, [row.device_id]);
+    }
+};
+
+function inMemory(routing) {
+    return {
+        async connect(f) {
+            routing.upsertDevice(f.deviceId, f.socketId);
+        },
+        async link(f) {
+            const iface = routing.lookupInterface(f.interfaceId);
+            if (!routing.linkInterface(iface.device_id, f.interfaceId)) throw new Error("no session");
+        },
+        async disconnect(f) {
+            routing.removeSocket(f.socketId);
+        }
+    };
+}
+
+async function storm(name, impl, fleet, routing) {
+    const result = {};
+    let peakWaiting = 0;
+    const sampler = setInterval(() => { peakWaiting = Math.max(peakWaiting, pool.waitingCount); }, 1);
+    for (const event of ["connect", "link", "disconnect"]) {
+        const samples = [];
+        const t0 = Date.now();
+        await forEachLimited(fleet, CONCURRENCY, (f) => timed(samples, () => impl[event](f)));
+        const wall = Date.now() - t0;
+        let persist = 0;
+        if (routing) {
+            const p0 = Date.now();
+            await routing.close();
+            persist = Date.now() - p0;
+        }
+        result[event] = { samples, wall, persist };
+    }
+    clearInterval(sampler);
+
+    console.log(`\n[BENCH] ${name}: ${DEVICES} devices, concurrency ${CONCURRENCY}, peak pg waiters ${peakWaiting}`);
+    for (const [event, { samples, wall, persist }] of Object.entries(result)) {
+        console.log(`[BENCH]   ${event.padEnd(10)} p50=${percentile(samples, 50).toFixed(3)}ms ` +
+            `p99=${percentile(samples, 99).toFixed(3)}ms max=${Math.max(...samples).toFixed(3)}ms ` +
+            `${(DEVICES / wall * 1000).toFixed(0)} events/s` + (routing ? `, persisted in ${persist}ms` : ""));
+    }
+}
+
+async function main() {
+    const fleet = await seed();
+    try {
+        await storm("per-event queries", legacy, fleet, null);
+
+        const routing = new RoutingTable(pool);
+        await routing.load();
+        await storm("routing table + write-behind", inMemory(routing), fleet, routing);
+        console.log(`[BENCH]   write-behind: ${routing.stats.flushes} flushes, ${routing.stats.upserts} upserts, ` +
+            `${routing.stats.deletes} deletes, ${routing.stats.errors} errors`);
+    } finally {
+        await cleanup(fleet);
+        await pool.end();
+    }
+}
+
+main().catch((err) => {
+    console.error(err);
+    process.exit(1);
+});
@@ -12,6 +12,11 @@ import { pool } from "./db.js"; // centralized DB connection
 import passport from "passport";
 import session from "express-session";
 import { getGoogleAuthUrl, getGoogleUser } from './auth.js';
+import { FrameRelay, interfaceRoom } from "./relay.js";
+import { RoutingTable, isUuid } from "./routing.js";
+import { SubnetIndex } from "./subnets.js";
+import { CONTENT_TYPE, captureProfile, httpTimer, instrumentPool, instrumentSocket, registry, trackEventLoop, trackProcess } from "./metrics.js";
+import { ChangeJournal, isPaged, notModified, pageLimit, sendDelta } from "./journal.js";
 import path from "path";
 import { fileURLToPath } from "url";
 const __filename = fileURLToPath(import.meta.url);
@@ -29,6 +34,8 @@ const PORT = process.env.PORT || 3000;
 const app = express();
 const httpServer = http.createServer(app);
 
+instrumentPool(pool); // pg_query_seconds per statement
+app.use(httpTimer);
 app.use(express.json());
 app.use(cookieParser());
 app.use("/admin", express.static(path.join(__dirname, "public")));
@@ -40,6 +47,61 @@ app.use(cors({
 
 
 const io = new Server(httpServer, { cors: { origin: "*" } });
+const relay = new FrameRelay(io);
+const journals = { devices: new ChangeJournal(), interfaces: new ChangeJournal(), sessions: new ChangeJournal() };
+const routing = new RoutingTable(pool, { journal: journals.sessions }); // in-memory sessions, persisted write-behind
+const subnets = new SubnetIndex(); // device visibility by subnet / public flag
+
+// -----------------------------
+// Metrics
+// -----------------------------
+registry.gauge("socket_connections", "Open Socket.IO connections").setFunction(() => io.engine.clientsCount);
+registry.gauge("device_sessions", "Device sessions in the routing table").setFunction(() => routing.sessions.size);
+registry.gauge("routing_pending_writes", "Session rows waiting for the write-behind").setFunction(() => routing.dirty.size);
+registry.counter("routing_flush_errors_total", "Failed write-behind flushes").setFunction(() => routing.stats.errors);
+registry.counter("routing_rejected_writes_total", "Session rows dropped by the write-behind after failing on their own")
+    .setFunction(() => routing.stats.rejected);
+registry.gauge("relay_streams", "Relay sessions with a linked interface").setFunction(() =>
+    [...relay.sessions.values()].filter((s) => s.interfaceId).length);
+registry.counter("relay_bytes_total", "Frame bytes through the relay", ["direction"]).setFunction(() =>
+    [[["in"], relay.totals.bytesIn], [["out"], relay.totals.bytesOut]]);
+registry.counter("relay_frames_total", "Frames through the relay", ["outcome"]).setFunction(() =>
+    [[["in"], relay.totals.framesIn], [["out"], relay.totals.framesOut], [["dropped"], relay.totals.dropped]]);
+registry.gauge("index_entries", "Entries in the in-memory indexes", ["index"]).setFunction(() => indexSizes());
+trackEventLoop();
+trackProcess();
+
+// Every long-lived map the session lifecycle adds to; each should return to its baseline
+// once devices and interfaces are disconnected and deleted
+function indexSizes() {
+    return [
+        [["routing.sessions"], routing.sessions.size],
+        [["routing.byInterface"], routing.byInterface.size],
+        [["routing.bySocket"], routing.bySocket.size],
+        [["routing.devicesByCode"], routing.devicesByCode.size],
+        [["routing.interfaces"], routing.interfaces.size],
+        [["relay.sessions"], relay.sessions.size],
+        [["relay.byInterface"], relay.byInterface.size],
+        [["relay.bySocket"], relay.bySocket.size],
+        [["subnets.devices"], subnets.devices.size],
+        [["socket.rooms"], io.sockets.adapter.rooms.size],
+        ...Object.entries(journals).map(([table, journal]) => [[`journal.${table}`], journal.entries.length])
+    ];
+}
+
+app.get("/metrics", (req, res) => {
+    res.set("Content-Type", CONTENT_TYPE).send(registry.render());
+});
+
+// Opt-in (PROFILER=1): V8 sampling profile of the live process, ?seconds=N
+app.get("/admin/profile", async (req, res) => {
+    try {
+        const profile = await captureProfile(Number(req.query.seconds || 10));
+        res.set("Content-Disposition", `attachment; filename="dispatcher-${Date.now()}.cpuprofile"`).json(profile);
+    } catch (err) {
+        res.status(err.status || 500).json({ reason: err.message });
+    }
+});
 
 app.get("/admin", (req, res) => {
     res.sendFile(path.join(__dirname, "./public/admin.html"));
@@ -111,6 +173,9 @@ app.post("/api/register_device", async (req, res) => {
         );
 
         const deviceRow = insertResult.rows[0];
+        routing.addDevice(deviceRow);
+        subnets.add(deviceRow);
+        journals.devices.record(deviceRow.device_id, deviceRow);
         console.log("[SERVER] Device registered:", deviceRow);
         io.emit("device_registered", deviceRow);
         res.json(deviceRow);
@@ -130,7 +195,11 @@ app.delete("/api/delete_device/:deviceId", async (req, res) => {
         if (result.rows.length === 0) return res.status(404).json({ reason: "Device not found" });
 
         await pool.query(`DELETE FROM devices WHERE device_id = $1`, [deviceId]);
-        await pool.query(`DELETE FROM sessions WHERE device_id = $1`, [deviceId]);
+        routing.removeDeviceRow(deviceId);
+        subnets.remove(deviceId);
+        journals.devices.record(deviceId, null);
+        routing.removeDevice(deviceId);
+        relay.removeDevice(deviceId);
 
         io.emit("device_deleted", { deviceId });
         res.json({ success: true, deviceId });
@@ -140,6 +209,19 @@ app.delete("/api/delete_device/:deviceId", async (req, res) => {
     }
 });
 
+// -----------------------------
+// Browse devices visible from a subnet
+// -----------------------------
+// ?subnet=<CIDR or IP>: devices whose subnet overlaps it, then public devices.
+// ?public=0 leaves out public devices from other subnets; ?limit= caps the result.
+app.get("/api/visible_devices", (req, res) => {
+    const { subnet } = req.query;
+    if (!subnet) return res.status(400).json({ reason: "subnet is required" });
+    const limit = req.query.limit !== undefined ? pageLimit(req.query) : Infinity;
+    const devices = subnets.visible(subnet, { includePublic: req.query.public !== "0", limit });
+    res.json({ subnet, count: devices.length, devices });
+});
+
 // -----------------------------
 // Register interface
 // -----------------------------
@@ -158,6 +240,8 @@ app.post("/api/register_interface", async (req, res) => {
         );
 
         const interfaceRow = insertResult.rows[0];
+        routing.addInterface(interfaceRow);
+        journals.interfaces.record(interfaceRow.interface_id, interfaceRow);
         const deviceResult = await pool.query(`SELECT type, subnet FROM devices WHERE connection_code = $1`, [deviceCode]);
         const deviceInfo = deviceResult.rows[0] || { type: null, subnet: null };
 
@@ -175,18 +259,24 @@ app.post("/api/register_interface", async (req, res) => {
 // -----------------------------
 app.post("/api/register_device_session", async (req, res) => {
     const { deviceId, socketId } = req.body;
-    try {
-        await pool.query(
-            `INSERT INTO sessions (device_id, socket_id) VALUES ($1, $2)
-             ON CONFLICT (device_id) DO UPDATE SET socket_id = EXCLUDED.socket_id, updated_at = NOW()`,
-            [deviceId, socketId]
-        );
-        console.log(`[SERVER] Device session created in DB: ${deviceId}`);
-        res.json({ deviceId, status: "registered" });
-    } catch (err) {
-        console.error("[SERVER] Error creating device session:", err);
-        res.status(500).json({ reason: "Server error" });
-    }
+    if (!isUuid(deviceId)) return res.status(400).json({ reason: "deviceId must be a UUID" });
+    if (!routing.upsertDevice(deviceId, socketId)) return res.status(404).json({ reason: "Device not found" });
+    console.log(`[SERVER] Device session created: ${deviceId}`);
+    res.json({ deviceId, status: "registered" });
+});
+
+// -----------------------------
+// Register many device sessions on one socket (reconnect storms)
+// -----------------------------
+app.post("/api/register_device_sessions", (req, res) => {
+    const { deviceIds, socketId } = req.body;
+    if (!Array.isArray(deviceIds)) return res.status(400).json({ reason: "deviceIds must be an array" });
+    // Unknown or malformed ids are reported back rather than failing the rest of the storm
+    const rejected = deviceIds.filter((deviceId) => !routing.upsertDevice(deviceId, socketId));
+    const count = deviceIds.length - rejected.length;
+    console.log(`[SERVER] ${count} device sessions created for socket ${socketId}` +
+        (rejected.length ? `, ${rejected.length} unknown devices rejected` : ""));
+    res.json({ count, rejected, status: "registered" });
 });
 
 // -----------------------------
@@ -200,7 +290,10 @@ app.delete("/api/delete_interface/:interfaceId", async (req, res) => {
         if (result.rows.length === 0) return res.status(404).json({ reason: "Interface not found" });
 
         await pool.query(`DELETE FROM interfaces WHERE interface_id = $1`, [interfaceId]);
-        await pool.query(`UPDATE sessions SET interface_id = NULL WHERE interface_id = $1`, [interfaceId]);
+        routing.removeInterfaceRow(interfaceId);
+        journals.interfaces.record(interfaceId, null);
+        routing.unlinkInterface(interfaceId);
+        relay.unlinkInterface(interfaceId);
 
         io.emit("interface_deleted", { interfaceId });
         res.json({ success: true, interfaceId });
@@ -216,69 +309,119 @@ app.delete("/api/delete_interface/:interfaceId", async (req, res) => {
 app.post("/api/register_full_session", async (req, res) => {
     const { deviceId, interfaceId } = req.body;
 
-    try {
-        const sessionResult = await pool.query(`SELECT * FROM sessions WHERE device_id = $1`, [deviceId]);
-        if (sessionResult.rows.length === 0) return res.status(404).json({ reason: "Session not found" });
-
-        await pool.query(
-            `UPDATE sessions SET interface_id = $1, updated_at = NOW() WHERE device_id = $2`,
-            [interfaceId, deviceId]
-        );
+    if (!routing.linkInterface(deviceId, interfaceId)) return res.status(404).json({ reason: "Session not found" });
+    relay.link(deviceId, interfaceId);
 
-        console.log(`[SERVER] Full session registered:`, { deviceId, interfaceId });
-        res.json({ deviceId, interfaceId });
-    } catch (err) {
-        console.error("[SERVER] Error registering full session:", err);
-        res.status(500).json({ reason: "Server error" });
-    }
+    console.log(`[SERVER] Full session registered:`, { deviceId, interfaceId });
+    res.json({ deviceId, interfaceId });
 });
 
 // -----------------------------
 // Admin API
 // -----------------------------
-app.get("/admin/devices", async (req, res) => {
+// Listings answer three shapes: no query -> the whole table (as before),
+// ?cursor=&limit= -> { rows, next, version } keyset pages, ?since=<version> -> { changes, version }.
+// Every response carries an ETag of the table version; If-None-Match on it gives 304.
+async function listTable(req, res, table, key) {
+    const journal = journals[table];
     try {
-        const result = await pool.query(`SELECT * FROM devices`);
-        res.json(result.rows);
+        if (sendDelta(req, res, journal)) return;
+        if (!isPaged(req.query) && notModified(req, res, journal)) return res.status(304).end();
+        // Both listed keys are uuid columns; anything else would be a SQL error
+        if (req.query.cursor && !isUuid(req.query.cursor)) return res.status(400).json({ reason: "cursor must be a UUID" });
+        const version = journal.token(); // taken before the read, so a following delta can't miss a change
+        if (!isPaged(req.query)) {
+            const result = await pool.query(`SELECT * FROM ${table}`);
+            return res.json(result.rows);
+        }
+        const limit = pageLimit(req.query);
+        const result = req.query.cursor
+            ? await pool.query(`SELECT * FROM ${table} WHERE ${key} > $1 ORDER BY ${key} LIMIT $2`, [req.query.cursor, limit + 1])
+            : await pool.query(`SELECT * FROM ${table} ORDER BY ${key} LIMIT $1`, [limit + 1]);
+        const rows = result.rows.slice(0, limit);
+        res.json({ rows, next: result.rows.length > limit ? rows[rows.length - 1][key] : null, version });
     } catch (err) {
-        console.error("[SERVER] Error fetching devices:", err);
+        console.error(`[SERVER] Error fetching ${table}:`, err);
         res.status(500).json({ reason: "Server error" });
     }
-});
+}
 
-app.get("/admin/interfaces", async (req, res) => {
+async function getRow(res, table, column, value) {
     try {
-        const result = await pool.query(`SELECT * FROM interfaces`);
-        res.json(result.rows);
+        const result = await pool.query(`SELECT * FROM ${table} WHERE ${column} = $1`, [value]);
+        if (result.rows.length === 0) return res.status(404).json({ reason: "Not found" });
+        res.json(result.rows[0]);
     } catch (err) {
-        console.error("[SERVER] Error fetching interfaces:", err);
+        console.error(`[SERVER] Error fetching ${table} row:`, err);
         res.status(500).json({ reason: "Server error" });
     }
-});
+}
 
-app.get("/admin/sessions", async (req, res) => {
-    try {
-        const result = await pool.query(`SELECT * FROM sessions`);
-        res.json(result.rows);
-    } catch (err) {
-        console.error("[SERVER] Error fetching sessions:", err);
-        res.status(500).json({ reason: "Server error" });
+app.get("/admin/devices", (req, res) => listTable(req, res, "devices", "device_id"));
+app.get("/admin/devices/by_code/:code", (req, res) => getRow(res, "devices", "connection_code", req.params.code));
+app.get("/admin/devices/:deviceId", (req, res) => getRow(res, "devices", "device_id", req.params.deviceId));
+app.get("/admin/interfaces", (req, res) => listTable(req, res, "interfaces", "interface_id"));
+app.get("/admin/interfaces/:interfaceId", (req, res) => getRow(res, "interfaces", "interface_id", req.params.interfaceId));
+
+// Sessions are served from the routing table; the sessions table trails it by one flush
+app.get("/admin/sessions", (req, res) => {
+    if (sendDelta(req, res, journals.sessions)) return;
+    if (isPaged(req.query)) {
+        return res.json({ ...routing.page(req.query.cursor, pageLimit(req.query)), version: journals.sessions.token() });
     }
+    if (notModified(req, res, journals.sessions)) return res.status(304).end();
+    res.json(routing.all());
+});
+
+app.get("/admin/session/:deviceId", (req, res) => {
+    const s = routing.getByDevice(req.params.deviceId);
+    if (!s) return res.status(404).json({ reason: "Session not found" });
+    res.json(RoutingTable.row(s));
+});
+
+app.get("/admin/routing", (req, res) => {
+    res.json({ sessions: routing.sessions.size, pending: routing.dirty.size, ...routing.stats });
+});
+
+app.get("/admin/subnets", (req, res) => {
+    res.json(subnets.stats());
+});
+
+app.get("/admin/relay", (req, res) => {
+    res.json(relay.stats());
 });
 
-app.get("/admin/session/:deviceId", async (req, res) => {
+// Row counts plus sessions nothing owns any more: in memory on a socket that is gone, or in
+// the table for a deleted device. The sessions table trails the routing table by one flush.
+app.get("/admin/audit", async (req, res) => {
     try {
-        const result = await pool.query(`SELECT * FROM sessions WHERE device_id = $1`, [req.params.deviceId]);
-        if (result.rows.length === 0) return res.status(404).json({ reason: "Session not found" });
-        res.json(result.rows[0]);
+        const { rows: [rows] } = await pool.query(`SELECT
+            (SELECT count(*) FROM devices)::int AS devices,
+            (SELECT count(*) FROM interfaces)::int AS interfaces,
+            (SELECT count(*) FROM sessions)::int AS sessions,
+            (SELECT count(*) FROM sessions s LEFT JOIN devices d ON d.device_id = s.device_id
+              WHERE d.device_id IS NULL)::int AS sessions_without_device,
+            (SELECT count(*) FROM interfaces i LEFT JOIN devices d ON d.connection_code = i.device_code
+              WHERE d.device_id IS NULL)::int AS interfaces_without_device`);
+        const sockets = io.sockets.sockets;
+        const withoutSocket = [...routing.sessions.values()].filter((s) => !sockets.has(s.socketId)).map((s) => s.deviceId);
+        res.json({
+            rows,
+            routing: { sessions: routing.sessions.size, pending: routing.dirty.size },
+            sockets: sockets.size,
+            orphans: { sessionsWithoutSocket: withoutSocket.length, deviceIds: withoutSocket.slice(0, 100) },
+            indexes: Object.fromEntries(indexSizes().map(([[name], n]) => [name, n]))
+        });
     } catch (err) {
-        console.error("[SERVER] Error fetching session:", err);
+        console.error("[SERVER] Audit failed:", err);
         res.status(500).json({ reason: "Server error" });
     }
 });
 
 async function cleanupSessions() {
     try {
+        await routing.close();
+        routing.clear();
         await pool.query(`DELETE FROM sessions`);
         console.log("[SERVER] Cleaned up all device sessions from DB");
     } catch (err) {
@@ -315,26 +458,36 @@ process.on("uncaughtException", (err) => {
 // WebSocket handlers
 // -----------------------------
 io.on("connection", (socket) => {
+    instrumentSocket(socket);
     console.log(`[SOCKET] New connection: ${socket.id}`);
 
-    socket.on("device_connect_to_dispatcher", async (data) => {
+    socket.on("device_connect_to_dispatcher", (data, callback) => {
         const { deviceId } = data;
         if (!deviceId) return console.log(`[ERROR] Device tried to connect without an ID`);
-
-        try {
-            await pool.query(
-                `INSERT INTO sessions (device_id, socket_id) VALUES ($1, $2)
-                 ON CONFLICT (device_id) DO UPDATE SET socket_id = EXCLUDED.socket_id, updated_at = NOW()`,
-                [deviceId, socket.id]
-            );
-            console.log(`[DEVICE CONNECTED] ${deviceId} on socket ${socket.id}`);
-            io.emit("device_connected", { deviceId });
-        } catch (err) {
-            console.error(`[SERVER ERROR] device_connect_to_dispatcher: ${err.message}`);
+        if (!routing.upsertDevice(deviceId, socket.id)) {
+            console.log(`[ERROR] Unknown device ${deviceId} tried to connect`);
+            if (callback) callback({ success: false, reason: "Device not found" });
+            return;
         }
+        relay.attachDevice(deviceId, socket.id);
+        console.log(`[DEVICE CONNECTED] ${deviceId} on socket ${socket.id}`);
+        io.emit("device_connected", { deviceId });
+        if (callback) callback({ success: true });
+    });
+
+    // Bulk form for sockets that carry many devices: one event and one broadcast
+    socket.on("devices_connect_to_dispatcher", (data, callback) => {
+        const requested = Array.isArray(data?.deviceIds) ? data.deviceIds.filter(Boolean) : [];
+        const deviceIds = requested.filter((deviceId) => routing.upsertDevice(deviceId, socket.id));
+        for (const deviceId of deviceIds) relay.attachDevice(deviceId, socket.id);
+        const rejected = requested.filter((deviceId) => !routing.hasDevice(deviceId));
+        console.log(`[DEVICES CONNECTED] ${deviceIds.length} devices on socket ${socket.id}` +
+            (rejected.length ? `, ${rejected.length} unknown rejected` : ""));
+        io.emit("devices_connected", { deviceIds });
+        if (callback) callback({ success: true, count: deviceIds.length, rejected });
     });
 
-    socket.on("interface_connect_to_device", async (data) => {
+    socket.on("interface_connect_to_device", (data) => {
         const { interfaceId, connectionCode } = data;
 
         // 🔹 Debug log to confirm the event is received
@@ -342,21 +495,14 @@ io.on("connection", (socket) => {
 
         try {
             // Look up the interface
-            const ifaceRes = await pool.query(
-                `SELECT i.interface_id, i.device_code, d.device_id, d.type
-             FROM interfaces i
-             LEFT JOIN devices d ON i.device_code = d.connection_code
-             WHERE i.interface_id = $1`,
-                [interfaceId]
-            );
+            const iface = routing.lookupInterface(interfaceId);
 
-            if (ifaceRes.rows.length === 0) {
-                console.warn(`[BROKER] Interface ${interfaceId} not found in DB`);
+            if (!iface) {
+                console.warn(`[BROKER] Interface ${interfaceId} not found`);
                 return socket.emit("interface_connect_to_device_response", { error: true, message: "Interface not found" });
             }
 
-            const iface = ifaceRes.rows[0];
-            console.log(`[BROKER] Found interface in DB: ${JSON.stringify(iface)}`);
+            console.log(`[BROKER] Found interface: ${JSON.stringify(iface)}`);
 
             // Check connection code matches
             if (iface.device_code !== connectionCode) {
@@ -367,20 +513,24 @@ io.on("connection", (socket) => {
             // Use the actual UUID device_id for sessions
             const deviceId = iface.device_id; // UUID
 
-            // Check session exists
-            const sessionRes = await pool.query(`SELECT * FROM sessions WHERE device_id = $1`, [deviceId]);
-            if (sessionRes.rows.length === 0) {
+            // Clients that report their subnet only reach devices they can see
+            if (data.subnet && !subnets.canSee(data.subnet, deviceId)) {
+                console.warn(`[BROKER] Device ${deviceId} not visible from subnet ${data.subnet}`);
+                return socket.emit("interface_connect_to_device_response", { error: true, message: "Device not visible from your subnet" });
+            }
+
+            // Check session exists and link it
+            if (!routing.linkInterface(deviceId, interfaceId)) {
                 console.warn(`[BROKER] Device ${deviceId} has no active session`);
                 return socket.emit("interface_connect_to_device_response", { error: true, message: `Device ${deviceId} not connected` });
             }
 
-            // Update session
-            await pool.query(
-                `UPDATE sessions SET interface_id = $1, updated_at = NOW() WHERE device_id = $2`,
-                [interfaceId, deviceId]
-            );
+            // Frames for this session are relayed only to the linked interface's room
+            socket.join(interfaceRoom(interfaceId));
+            relay.link(deviceId, interfaceId);
 
             console.log(`[BROKER] Linked interface ${interfaceId} to device ${deviceId}`);
+            io.emit("interface_connected", { interfaceId, deviceId });
 
             socket.emit("interface_connect_to_device_response", {
                 deviceType: iface.type,
@@ -393,21 +543,18 @@ io.on("connection", (socket) => {
         }
     });
 
-   socket.on("interface_disconnect_from_dispatcher", async (data, callback) => {
+   socket.on("interface_disconnect_from_dispatcher", (data, callback) => {
     const { interfaceId } = data;
 
     try {
-        const sessionRes = await pool.query(
-            `SELECT * FROM sessions WHERE interface_id = $1`,
-            [interfaceId]
-        );
+        const session = routing.unlinkInterface(interfaceId);
 
-        if (sessionRes.rows.length === 0) {
+        if (!session) {
             console.log(`[WARN] Interface ${interfaceId} not connected`);
         } else {
-            const socketId = sessionRes.rows[0].socket_id;
-            io.to(socketId).emit("interface_disconnect_from_dispatcher", { interfaceId });
-            await pool.query(`UPDATE sessions SET interface_id = NULL WHERE interface_id = $1`, [interfaceId]);
+            io.to(session.socketId).emit("interface_disconnect_from_dispatcher", { interfaceId });
+            socket.leave(interfaceRoom(interfaceId));
+            relay.unlinkInterface(interfaceId);
             io.emit("interface_disconnected", { interfaceId });
             console.log(`[INTERFACE DISCONNECTED] ${interfaceId} (client requested)`);
         }
@@ -423,39 +570,52 @@ io.on("connection", (socket) => {
 
 
 
-    socket.on("disconnect", async () => {
-        try {
-            const res = await pool.query(`SELECT device_id FROM sessions WHERE socket_id = $1`, [socket.id]);
-            for (const row of res.rows) {
-                await pool.query(`DELETE FROM sessions WHERE device_id = $1`, [row.device_id]);
-                io.emit("device_disconnected", { deviceId: row.device_id });
-                console.log(`[DEVICE DISCONNECTED] ${row.device_id} (socket disconnect)`);
-            }
-        } catch (err) {
-            console.error(`[SERVER ERROR] disconnect: ${err.message}`);
+    socket.on("device_frame", (meta, frame) => {
+        relay.push(socket, meta, frame);
+    });
+
+    socket.on("disconnect", () => {
+        relay.removeSocket(socket.id);
+        for (const deviceId of routing.removeSocket(socket.id)) {
+            io.emit("device_disconnected", { deviceId });
+            console.log(`[DEVICE DISCONNECTED] ${deviceId} (socket disconnect)`);
         }
     });
 
-    socket.on("device_disconnect_from_dispatcher", async (data) => {
+    socket.on("device_disconnect_from_dispatcher", (data) => {
         const { deviceId } = data;
-        try {
-            const sessionRes = await pool.query(`SELECT * FROM sessions WHERE device_id = $1`, [deviceId]);
-            if (sessionRes.rows.length === 0) return console.log(`[WARN] Device ${deviceId} not connected`);
+        const session = routing.removeDevice(deviceId);
+        if (!session) return console.log(`[WARN] Device ${deviceId} not connected`);
 
-            const socketId = sessionRes.rows[0].socket_id;
-            io.to(socketId).emit("device_disconnect_from_dispatcher", { deviceId });
-            await pool.query(`DELETE FROM sessions WHERE device_id = $1`, [deviceId]);
-            io.emit("device_disconnected", { deviceId });
-            console.log(`[DEVICE DISCONNECTED] ${deviceId} (client requested)`);
-        } catch (err) {
-            console.error(`[SERVER ERROR] device_disconnect_from_dispatcher: ${err.message}`);
-        }
+        io.to(session.socketId).emit("device_disconnect_from_dispatcher", { deviceId });
+        relay.removeDevice(deviceId);
+        io.emit("device_disconnected", { deviceId });
+        console.log(`[DEVICE DISCONNECTED] ${deviceId} (client requested)`);
     });
 });
 
 // -----------------------------
 // Start server
 // -----------------------------
-httpServer.listen(PORT, () => {
-    console.log(`[SERVER] Broker running on http://localhost:${PORT}`);
+// The in-memory tables are the source of truth for lookups, so don't serve from empty ones:
+// keep retrying the load (the database may still be starting) before listening
+async function loadUntilReady(tag, what, load) {
+    for (let attempt = 0; ; attempt++) {
+        try {
+            return await load();
+        } catch (err) {
+            const delay = Math.min(30000, 1000 * 2 ** attempt);
+            console.error(`[${tag}] Failed to load ${what}, retrying in ${delay / 1000}s:`, err.message);
+            await new Promise((resolve) => setTimeout(resolve, delay));
+        }
+    }
+}
+
+Promise.all([
+    loadUntilReady("ROUTING", "sessions", () => routing.load()),
+    loadUntilReady("SUBNETS", "devices", () => subnets.load(pool))
+]).then(() => {
+    httpServer.listen(PORT, () => {
+        console.log(`[SERVER] Broker running on http://localhost:${PORT}`);
+    });
 });
@@ -0,0 +1,85 @@
+// -----------------------------
+// Change journal for delta sync
+// -----------------------------
+// One journal per admin table. Every insert, update or delete the dispatcher makes is
+// recorded with a monotonically increasing version, so clients can ask for "changes
+// since version N" instead of downloading the whole table. Tokens are
+// "<epoch>.<version>"; a token from before a restart, or older than the retained
+// window, cannot be answered and the client falls back to a paged full load.
+
+export const JOURNAL_LIMIT = Number(process.env.JOURNAL_LIMIT || 10000); // changes kept per table
+export const PAGE_LIMIT = Number(process.env.ADMIN_PAGE_LIMIT || 500);    // default rows per page
+export const PAGE_MAX = 5000;
+
+export class ChangeJournal {
+    constructor(limit = JOURNAL_LIMIT) {
+        this.limit = limit;
+        this.epoch = Date.now().toString(36);
+        this.version = 0;
+        this.entries = [];   // { version, key, row } in version order; row === null means deleted
+    }
+
+    record(key, row) {
+        this.version++;
+        this.entries.push({ version: this.version, key, row });
+        if (this.entries.length > this.limit * 2) this.entries = this.entries.slice(-this.limit);
+    }
+
+    token() {
+        return `${this.epoch}.${this.version}`;
+    }
+
+    etag() {
+        return `W/"${this.token()}"`;
+    }
+
+    // Latest change per key after `token`, or null when the token can't be answered
+    since(token) {
+        const [epoch, raw] = String(token).split(".");
+        const version = Number(raw);
+        if (epoch !== this.epoch || !Number.isInteger(version) || version > this.version) return null;
+        const first = this.entries.length ? this.entries[0].version : this.version + 1;
+        if (version < first - 1) return null;
+
+        const latest = new Map();
+        for (let i = version - first + 1; i < this.entries.length; i++) {
+            const { key, row } = this.entries[i];
+            latest.delete(key);
+            latest.set(key, row);
+        }
+        return [...latest].map(([key, row]) => ({ key, row }));
+    }
+}
+
+// Shared query-string handling for the admin listings: ?since= delta, ?cursor=/&limit= page
+export function pageLimit(query) {
+    const limit = Number(query.limit || PAGE_LIMIT);
+    return Math.max(1, Math.min(PAGE_MAX, Number.isFinite(limit) ? Math.floor(limit) : PAGE_LIMIT));
+}
+
+export function isPaged(query) {
+    return query.cursor !== undefined || query.limit !== undefined;
+}
+
+// 304 when the client already holds the current version; otherwise tag the response
+export function notModified(req, res, journal) {
+    const etag = journal.etag();
+    res.set("ETag", etag);
+    return req.get("If-None-Match") === etag;
+}
+
+// Answer ?since=<token>; returns false when the request isn't a delta query
+export function sendDelta(req, res, journal) {
+    if (req.query.since === undefined) return false;
+    if (notModified(req, res, journal)) {
+        res.status(304).end();
+        return true;
+    }
+    const changes = journal.since(req.query.since);
+    if (!changes) {
+        res.status(410).json({ reason: "Token expired, reload with ?cursor=", version: journal.token() });
+        return true;
+    }
+    res.json({ changes, version: journal.token() });
+    return true;
+}
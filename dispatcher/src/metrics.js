@@ -0,0 +1,274 @@
+// -----------------------------
+// Prometheus metrics and profiler hook
+// -----------------------------
+// Text exposition for /metrics without prom-client: counters, gauges and fixed-bucket
+// histograms, plus wrappers that time socket event handlers, pg queries and express
+// routes. The CPU profiler is opt-in (PROFILER=1) and uses V8's sampling profiler through
+// node:inspector, so it can be switched on against a live process.
+
+import fs from "node:fs";
+import inspector from "node:inspector";
+import { monitorEventLoopDelay } from "node:perf_hooks";
+
+export const LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10];
+export const PROFILER_ENABLED = process.env.PROFILER === "1";
+const PROFILE_MAX_SECONDS = 60;
+
+function labelText(names, values, extra = []) {
+    const pairs = names.map((n, i) => [n, values[i]]).concat(extra);
+    if (!pairs.length) return "";
+    const escape = (v) => String(v).replace(/\\/g, "\\\\").replace(/"/g, '\\"').replace(/\n/g, "\\n");
+    return "{" + pairs.map(([k, v]) => `${k}="${escape(v)}"`).join(",") + "}";
+}
+
+function numberText(value) {
+    return value === Infinity ? "+Inf" : String(value);
+}
+
+class Metric {
+    constructor(name, help, labels = []) {
+        this.name = name;
+        this.help = help;
+        this.labelNames = labels;
+        this.values = new Map();   // JSON label values -> value
+        this.fn = null;            // scrape-time callback: number or [[labelValues], number]
+    }
+
+    key(labels) {
+        return JSON.stringify(this.labelNames.map((n) => String(labels[n] ?? "")));
+    }
+
+    setFunction(fn) {
+        this.fn = fn;
+        return this;
+    }
+
+    samples() {
+        if (this.fn) {
+            const value = this.fn();
+            return Array.isArray(value) ? value.map(([labels, v]) => [this.name, labels, [], v]) : [[this.name, [], [], value]];
+        }
+        return [...this.values].map(([key, v]) => [this.name, JSON.parse(key), [], v]);
+    }
+
+    render() {
+        const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} ${this.type}`];
+        for (const [name, labels, extra, value] of this.samples()) {
+            lines.push(`${name}${labelText(this.labelNames, labels, extra)} ${numberText(value)}`);
+        }
+        return lines;
+    }
+}
+
+export class Counter extends Metric {
+    get type() { return "counter"; }
+
+    inc(labels = {}, amount = 1) {
+        const key = this.key(labels);
+        this.values.set(key, (this.values.get(key) || 0) + amount);
+    }
+}
+
+export class Gauge extends Metric {
+    get type() { return "gauge"; }
+
+    set(labels, value) {
+        this.values.set(this.key(labels), value);
+    }
+}
+
+export class Histogram extends Metric {
+    constructor(name, help, labels = [], buckets = LATENCY_BUCKETS) {
+        super(name, help, labels);
+        this.buckets = buckets;
+    }
+
+    get type() { return "histogram"; }
+
+    observe(labels, seconds) {
+        const key = this.key(labels);
+        let entry = this.values.get(key);
+        if (!entry) {
+            entry = { counts: new Array(this.buckets.length + 1).fill(0), sum: 0, count: 0 };
+            this.values.set(key, entry);
+        }
+        let i = 0;
+        while (i < this.buckets.length && seconds > this.buckets[i]) i++;
+        entry.counts[i]++;
+        entry.sum += seconds;
+        entry.count++;
+    }
+
+    samples() {
+        const out = [];
+        for (const [key, { counts, sum, count }] of this.values) {
+            const labels = JSON.parse(key);
+            let cumulative = 0;
+            [...this.buckets, Infinity].forEach((bound, i) => {
+                cumulative += counts[i];
+                out.push([`${this.name}_bucket`, labels, [["le", numberText(bound)]], cumulative]);
+            });
+            out.push([`${this.name}_sum`, labels, [], sum]);
+            out.push([`${this.name}_count`, labels, [], count]);
+        }
+        return out;
+    }
+}
+
+export class Registry {
+    constructor() {
+        this.metrics = new Map();
+    }
+
+    _get(Type, name, help, labels, ...rest) {
+        let metric = this.metrics.get(name);
+        if (!metric) {
+            metric = new Type(name, help, labels, ...rest);
+            this.metrics.set(name, metric);
+        }
+        return metric;
+    }
+
+    counter(name, help, labels) { return this._get(Counter, name, help, labels); }
+    gauge(name, help, labels) { return this._get(Gauge, name, help, labels); }
+    histogram(name, help, labels, buckets) { return this._get(Histogram, name, help, labels, buckets); }
+
+    render() {
+        const lines = [];
+        for (const metric of this.metrics.values()) lines.push(...metric.render());
+        return lines.join("\n") + "\n";
+    }
+}
+
+export const registry = new Registry();
+export const CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8";
+
+const seconds = (t0) => Number(process.hrtime.bigint() - t0) / 1e9;
+
+// -----------------------------
+// Hot-path wrappers
+// -----------------------------
+const socketSeconds = registry.histogram("socket_event_seconds", "Socket.IO event handler time", ["event", "outcome"]);
+
+// Time every handler registered on this socket afterwards (async handlers until they settle)
+export function instrumentSocket(socket) {
+    const on = socket.on.bind(socket);
+    socket.on = (event, handler) => on(event, (...args) => {
+        const t0 = process.hrtime.bigint();
+        let result;
+        try {
+            result = handler(...args);
+        } catch (err) {
+            socketSeconds.observe({ event, outcome: "error" }, seconds(t0));
+            throw err;
+        }
+        if (result && typeof result.then === "function") {
+            return result.then(
+                (v) => { socketSeconds.observe({ event, outcome: "ok" }, seconds(t0)); return v; },
+                (err) => { socketSeconds.observe({ event, outcome: "error" }, seconds(t0)); throw err; }
+            );
+        }
+        socketSeconds.observe({ event, outcome: "ok" }, seconds(t0));
+        return result;
+    });
+    return socket;
+}
+
+const querySeconds = registry.histogram("pg_query_seconds", "PostgreSQL query time per statement", ["statement", "outcome"]);
+
+// Statement label: whitespace collapsed and multi-row VALUES lists folded, so batched
+// upserts of any size share one series
+export function statementLabel(text) {
+    return String(text)
+        .replace(/\s+/g, " ")
+        .replace(/VALUES (\(\$\d+(, \$\d+)*\)(, )?)+/gi, "VALUES (...)")
+        .trim()
+        .slice(0, 120);
+}
+
+// Wrap pool.query (promise form, which is the only one the dispatcher uses)
+export function instrumentPool(pool) {
+    const query = pool.query.bind(pool);
+    pool.query = async (text, params) => {
+        const statement = statementLabel(typeof text === "string" ? text : text?.text);
+        const t0 = process.hrtime.bigint();
+        try {
+            const result = await query(text, params);
+            querySeconds.observe({ statement, outcome: "ok" }, seconds(t0));
+            return result;
+        } catch (err) {
+            querySeconds.observe({ statement, outcome: "error" }, seconds(t0));
+            throw err;
+        }
+    };
+    return pool;
+}
+
+const httpSeconds = registry.histogram("http_request_seconds", "Express handler time", ["method", "route", "status"]);
+
+// Express middleware: latency per matched route pattern (not per URL)
+export function httpTimer(req, res, next) {
+    const t0 = process.hrtime.bigint();
+    res.on("finish", () => {
+        const route = req.route ? (req.baseUrl || "") + req.route.path : "unmatched";
+        httpSeconds.observe({ method: req.method, route, status: res.statusCode }, seconds(t0));
+    });
+    next();
+}
+
+// -----------------------------
+// Opt-in sampling profiler
+// -----------------------------
+let profiling = false;
+
+// V8 CPU profile of the live process for `duration` seconds (.cpuprofile JSON for DevTools / speedscope)
+export async function captureProfile(duration, intervalUs = 1000) {
+    if (!PROFILER_ENABLED) throw Object.assign(new Error("Profiler disabled; start with PROFILER=1"), { status: 403 });
+    if (profiling) throw Object.assign(new Error("A profile is already running"), { status: 409 });
+    profiling = true;
+    const session = new inspector.Session();
+    const post = (method, params) => new Promise((resolve, reject) =>
+        session.post(method, params, (err, result) => (err ? reject(err) : resolve(result))));
+    try {
+        session.connect();
+        await post("Profiler.enable");
+        await post("Profiler.setSamplingInterval", { interval: intervalUs });
+        await post("Profiler.start");
+        await new Promise((resolve) => setTimeout(resolve, Math.min(duration, PROFILE_MAX_SECONDS) * 1000));
+        const { profile } = await post("Profiler.stop");
+        return profile;
+    } finally {
+        session.disconnect();
+        profiling = false;
+    }
+}
+
+// Event-loop delay (p50/p99/max over the last scrape interval), the first sign of a hot handler
+export function trackEventLoop() {
+    const histogram = monitorEventLoopDelay({ resolution: 10 });
+    histogram.enable();
+    registry.gauge("event_loop_delay_seconds", "Event loop delay since the previous scrape", ["quantile"]).setFunction(() => {
+        const out = [[["0.5"], histogram.percentile(50) / 1e9], [["0.99"], histogram.percentile(99) / 1e9], [["1"], histogram.max / 1e9]];
+        histogram.reset();
+        return out;
+    });
+}
+
+// Process resources, named as prom-client's defaults; the soak test (tests/soak.py) watches
+// these for growth. Open descriptors come from /proc, so they read NaN off Linux.
+export function trackProcess() {
+    registry.gauge("process_resident_memory_bytes", "Resident set size").setFunction(() => process.memoryUsage.rss());
+    registry.gauge("nodejs_heap_used_bytes", "V8 heap in use").setFunction(() => process.memoryUsage().heapUsed);
+    registry.gauge("process_open_fds", "Open file descriptors").setFunction(() => {
+        try {
+            return fs.readdirSync("/proc/self/fd").length - 1; // minus the one readdir itself holds
+        } catch {
+            return NaN;
+        }
+    });
+    registry.gauge("nodejs_active_resources", "Live libuv handles and requests", ["type"]).setFunction(() => {
+        const counts = new Map();
+        for (const type of process.getActiveResourcesInfo()) counts.set(type, (counts.get(type) || 0) + 1);
+        return [...counts].map(([type, n]) => [[type], n]);
+    });
+}
@@ -0,0 +1,177 @@
+// -----------------------------
+// Frame relay
+// -----------------------------
+// Devices push encoded frames over their dispatcher socket ("device_frame", meta, bytes).
+// Each session keeps a capped ring of undelivered frames and forwards them only to the
+// room of the interface linked to it in `sessions`. When that interface falls behind,
+// the ring overwrites its oldest frames and catch-up sends only the newest ones, so the
+// broker never builds an unbounded backlog.
+
+export const RING_CAPACITY = Number(process.env.RELAY_RING_CAPACITY || 8);
+export const MAX_PENDING_PACKETS = Number(process.env.RELAY_MAX_PENDING || 4); // per interface socket
+export const RETRY_MS = 10;
+
+export const interfaceRoom = (interfaceId) => `interface:${interfaceId}`;
+
+export class FrameRelay {
+    constructor(io, { capacity = RING_CAPACITY, maxPending = MAX_PENDING_PACKETS } = {}) {
+        this.io = io;
+        this.capacity = capacity;
+        this.maxPending = maxPending;
+        this.sessions = new Map();    // deviceId -> relay session
+        this.byInterface = new Map(); // interfaceId -> deviceId
+        this.bySocket = new Map();    // device socketId -> Set(deviceId)
+        this.cpuNs = 0n;              // time spent in push/flush
+        this.totals = { framesIn: 0, bytesIn: 0, framesOut: 0, bytesOut: 0, dropped: 0 }; // survive session removal
+        this.started = Date.now();
+    }
+
+    _session(deviceId) {
+        let s = this.sessions.get(deviceId);
+        if (!s) {
+            s = {
+                deviceId, socketId: null, interfaceId: null,
+                ring: new Array(this.capacity), written: 0, next: 0,
+                framesIn: 0, bytesIn: 0, framesOut: 0, bytesOut: 0, dropped: 0, ignored: 0,
+                flushScheduled: false, retry: null
+            };
+            this.sessions.set(deviceId, s);
+        }
+        return s;
+    }
+
+    // ---- session lifecycle (mirrors the sessions table) ----
+    attachDevice(deviceId, socketId) {
+        const s = this._session(deviceId);
+        if (s.socketId) this.bySocket.get(s.socketId)?.delete(deviceId);
+        s.socketId = socketId;
+        if (!this.bySocket.has(socketId)) this.bySocket.set(socketId, new Set());
+        this.bySocket.get(socketId).add(deviceId);
+        if (s.interfaceId) this.io.to(socketId).emit("relay_start", { deviceId, interfaceId: s.interfaceId });
+    }
+
+    link(deviceId, interfaceId) {
+        const s = this._session(deviceId);
+        if (s.interfaceId && s.interfaceId !== interfaceId) this.byInterface.delete(s.interfaceId);
+        const previous = this.byInterface.get(interfaceId);
+        if (previous && previous !== deviceId) this.unlinkInterface(interfaceId);
+        s.interfaceId = interfaceId;
+        this.byInterface.set(interfaceId, deviceId);
+        // Replay the newest buffered frame so the viewer has a picture straight away
+        s.next = Math.max(s.next, s.written - 1);
+        if (s.written) this._schedule(s);
+        if (s.socketId) this.io.to(s.socketId).emit("relay_start", { deviceId, interfaceId });
+    }
+
+    unlinkInterface(interfaceId) {
+        const deviceId = this.byInterface.get(interfaceId);
+        if (!deviceId) return;
+        this.byInterface.delete(interfaceId);
+        const s = this.sessions.get(deviceId);
+        if (!s) return;
+        s.interfaceId = null;
+        s.next = s.written;
+        if (s.socketId) this.io.to(s.socketId).emit("relay_stop", { deviceId });
+    }
+
+    removeDevice(deviceId) {
+        const s = this.sessions.get(deviceId);
+        if (!s) return;
+        if (s.interfaceId) this.byInterface.delete(s.interfaceId);
+        if (s.socketId) this.bySocket.get(s.socketId)?.delete(deviceId);
+        clearTimeout(s.retry);
+        this.sessions.delete(deviceId);
+    }
+
+    removeSocket(socketId) {
+        for (const deviceId of this.bySocket.get(socketId) || []) this.removeDevice(deviceId);
+        this.bySocket.delete(socketId);
+    }
+
+    // ---- data plane ----
+    push(socket, meta, frame) {
+        const t0 = process.hrtime.bigint();
+        const s = meta && this.sessions.get(meta.deviceId);
+        if (!s || s.socketId !== socket.id || !Buffer.isBuffer(frame)) return false;
+        if (!s.interfaceId) {
+            s.ignored++; // nobody watching: never buffer
+            return false;
+        }
+        s.ring[s.written % this.capacity] = { meta, frame };
+        s.written++;
+        s.framesIn++;
+        s.bytesIn += frame.length;
+        this.totals.framesIn++;
+        this.totals.bytesIn += frame.length;
+        if (s.written - s.next > this.capacity) {
+            s.dropped += s.written - this.capacity - s.next;
+            this.totals.dropped += s.written - this.capacity - s.next;
+            s.next = s.written - this.capacity;
+        }
+        this._schedule(s);
+        this.cpuNs += process.hrtime.bigint() - t0;
+        return true;
+    }
+
+    _schedule(s) {
+        if (s.flushScheduled || s.retry) return;
+        s.flushScheduled = true;
+        setImmediate(() => this._flush(s));
+    }
+
+    _flush(s) {
+        const t0 = process.hrtime.bigint();
+        s.flushScheduled = false;
+        s.retry = null;
+        if (!this.sessions.has(s.deviceId) || !s.interfaceId || s.next >= s.written) return;
+
+        const room = interfaceRoom(s.interfaceId);
+        const ids = this.io.sockets.adapter.rooms.get(room);
+        if (!ids || ids.size === 0) {
+            s.next = s.written; // linked over REST but no interface socket in the room yet
+            return;
+        }
+        let backlog = 0;
+        for (const id of ids) {
+            const pending = this.io.sockets.sockets.get(id)?.conn?.writeBuffer?.length || 0;
+            if (pending > backlog) backlog = pending;
+        }
+        const allowance = this.maxPending - backlog;
+        if (allowance <= 0) {
+            s.retry = setTimeout(() => this._flush(s), RETRY_MS);
+            this.cpuNs += process.hrtime.bigint() - t0;
+            return;
+        }
+        // Skip straight to the newest frames the slowest interface socket can take now
+        const start = Math.max(s.next, s.written - allowance);
+        s.dropped += start - s.next;
+        this.totals.dropped += start - s.next;
+        for (let i = start; i < s.written; i++) {
+            const { meta, frame } = s.ring[i % this.capacity];
+            this.io.to(room).emit("device_frame", meta, frame);
+            s.framesOut += ids.size;
+            s.bytesOut += frame.length * ids.size;
+            this.totals.framesOut += ids.size;
+            this.totals.bytesOut += frame.length * ids.size;
+        }
+        s.next = s.written;
+        this.cpuNs += process.hrtime.bigint() - t0;
+    }
+
+    stats() {
+        const sessions = [...this.sessions.values()].map((s) => ({
+            deviceId: s.deviceId, interfaceId: s.interfaceId,
+            framesIn: s.framesIn, bytesIn: s.bytesIn, framesOut: s.framesOut, bytesOut: s.bytesOut,
+            dropped: s.dropped, ignored: s.ignored, buffered: s.written - s.next
+        }));
+        const streams = sessions.filter((s) => s.interfaceId).length;
+        const cpu = process.cpuUsage();
+        return {
+            uptimeMs: Date.now() - this.started,
+            streams,
+            relayCpuMs: Number(this.cpuNs) / 1e6,
+            processCpuMs: (cpu.user + cpu.system) / 1000,
+            sessions
+        };
+    }
+}
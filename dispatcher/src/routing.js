@@ -0,0 +1,317 @@
+// -----------------------------
+// Session routing table
+// -----------------------------
+// Authoritative in-process copy of the `sessions` table, indexed by device, interface and
+// socket, plus a directory of interfaces and devices for interface_connect_to_device.
+// Socket handlers read and write only these maps; changes reach PostgreSQL through a
+// batched write-behind (one multi-row upsert and one DELETE ... ANY per flush), so a
+// connect storm never queues on the pg pool.
+
+export const FLUSH_MS = Number(process.env.ROUTING_FLUSH_MS || 50);
+export const FLUSH_BATCH = Number(process.env.ROUTING_FLUSH_BATCH || 1000); // rows per statement
+
+// Index of the first key in sorted `keys` greater than `key`
+function bisectRight(keys, key) {
+    let lo = 0, hi = keys.length;
+    while (lo < hi) {
+        const mid = (lo + hi) >>> 1;
+        if (keys[mid] <= key) lo = mid + 1;
+        else hi = mid;
+    }
+    return lo;
+}
+
+const UUID = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
+
+export function isUuid(value) {
+    return typeof value === "string" && UUID.test(value);
+}
+
+// SQLSTATE class 22 (data exception) or 23 (integrity constraint violation): the row itself is
+// bad and fails the same way on every retry, unlike a lost connection or a timeout
+function isRowError(err) {
+    return typeof err?.code === "string" && /^2[23]/.test(err.code);
+}
+
+export class RoutingTable {
+    constructor(pool, { flushMs = FLUSH_MS, batchSize = FLUSH_BATCH, journal = null } = {}) {
+        this.pool = pool;
+        this.journal = journal;           // ChangeJournal fed with every session change
+        this.flushMs = flushMs;
+        this.batchSize = batchSize;
+        this.sessions = new Map();        // deviceId -> { deviceId, socketId, interfaceId, updatedAt }
+        this.sortedIds = [];              // session deviceIds in order, so page() seeks instead of sorting
+        this.byInterface = new Map();     // interfaceId -> deviceId
+        this.bySocket = new Map();        // socketId -> Set(deviceId)
+        this.devicesByCode = new Map();   // connection_code -> { deviceId, type }
+        this.deviceCodes = new Map();     // deviceId -> connection_code
+        this.interfaces = new Map();      // interfaceId -> { deviceCode }
+        this.dirty = new Map();           // deviceId -> "upsert" | "delete"
+        this.timer = null;
+        this.flushing = null;
+        this.stats = { flushes: 0, upserts: 0, deletes: 0, errors: 0, rejected: 0, lastFlushMs: 0 };
+    }
+
+    // ---- startup ----
+    async load() {
+        const [sessions, devices, interfaces] = await Promise.all([
+            this.pool.query(`SELECT device_id, socket_id, interface_id, updated_at FROM sessions`),
+            this.pool.query(`SELECT device_id, connection_code, type FROM devices`),
+            this.pool.query(`SELECT interface_id, device_code FROM interfaces`)
+        ]);
+        for (const row of devices.rows) this.addDevice(row);
+        for (const row of interfaces.rows) this.addInterface(row);
+        for (const row of sessions.rows) {
+            this._index({ deviceId: row.device_id, socketId: row.socket_id, interfaceId: row.interface_id, updatedAt: row.updated_at });
+        }
+        console.log(`[ROUTING] Loaded ${this.sessions.size} sessions, ${this.devicesByCode.size} devices, ${this.interfaces.size} interfaces`);
+    }
+
+    // ---- directory (devices / interfaces tables) ----
+    addDevice(row) {
+        this.devicesByCode.set(row.connection_code, { deviceId: row.device_id, type: row.type });
+        this.deviceCodes.set(row.device_id, row.connection_code);
+    }
+
+    removeDeviceRow(deviceId) {
+        const code = this.deviceCodes.get(deviceId);
+        if (code === undefined) return;
+        this.deviceCodes.delete(deviceId);
+        if (this.devicesByCode.get(code)?.deviceId === deviceId) this.devicesByCode.delete(code);
+    }
+
+    // A registered device: sessions for anything else would fail the foreign key on flush
+    hasDevice(deviceId) {
+        return isUuid(deviceId) && this.deviceCodes.has(deviceId);
+    }
+
+    addInterface(row) {
+        this.interfaces.set(row.interface_id, { deviceCode: row.device_code });
+    }
+
+    removeInterfaceRow(interfaceId) {
+        this.interfaces.delete(interfaceId);
+    }
+
+    // Same shape as the old interfaces LEFT JOIN devices lookup
+    lookupInterface(interfaceId) {
+        const iface = this.interfaces.get(interfaceId);
+        if (!iface) return null;
+        const device = this.devicesByCode.get(iface.deviceCode);
+        return { interface_id: interfaceId, device_code: iface.deviceCode, device_id: device?.deviceId ?? null, type: device?.type ?? null };
+    }
+
+    // ---- sessions ----
+    _index(session) {
+        if (!this.sessions.has(session.deviceId)) {
+            this.sortedIds.splice(bisectRight(this.sortedIds, session.deviceId), 0, session.deviceId);
+        }
+        this.sessions.set(session.deviceId, session);
+        if (session.interfaceId) this.byInterface.set(session.interfaceId, session.deviceId);
+        if (session.socketId) {
+            if (!this.bySocket.has(session.socketId)) this.bySocket.set(session.socketId, new Set());
+            this.bySocket.get(session.socketId).add(session.deviceId);
+        }
+    }
+
+    _unindex(session) {
+        if (session.interfaceId && this.byInterface.get(session.interfaceId) === session.deviceId) {
+            this.byInterface.delete(session.interfaceId);
+        }
+        const devices = this.bySocket.get(session.socketId);
+        if (devices) {
+            devices.delete(session.deviceId);
+            if (devices.size === 0) this.bySocket.delete(session.socketId);
+        }
+    }
+
+    getByDevice(deviceId) {
+        return this.sessions.get(deviceId) || null;
+    }
+
+    getByInterface(interfaceId) {
+        const deviceId = this.byInterface.get(interfaceId);
+        return deviceId ? this.sessions.get(deviceId) : null;
+    }
+
+    devicesOnSocket(socketId) {
+        return [...(this.bySocket.get(socketId) || [])];
+    }
+
+    // INSERT ... ON CONFLICT (device_id) DO UPDATE SET socket_id; false for an unknown device
+    upsertDevice(deviceId, socketId) {
+        if (!this.hasDevice(deviceId)) return false;
+        const old = this.sessions.get(deviceId);
+        if (old) this._unindex(old);
+        this._index({ deviceId, socketId, interfaceId: old?.interfaceId ?? null, updatedAt: new Date() });
+        this._markDirty(deviceId, "upsert");
+        return true;
+    }
+
+    // UPDATE sessions SET interface_id = $1 WHERE device_id = $2
+    linkInterface(deviceId, interfaceId) {
+        const session = this.sessions.get(deviceId);
+        if (!session) return false;
+        this._unindex(session);
+        session.interfaceId = interfaceId;
+        session.updatedAt = new Date();
+        this._index(session);
+        this._markDirty(deviceId, "upsert");
+        return true;
+    }
+
+    // UPDATE sessions SET interface_id = NULL WHERE interface_id = $1
+    unlinkInterface(interfaceId) {
+        const session = this.getByInterface(interfaceId);
+        if (!session) return null;
+        this.byInterface.delete(interfaceId);
+        session.interfaceId = null;
+        session.updatedAt = new Date();
+        this._markDirty(session.deviceId, "upsert");
+        return session;
+    }
+
+    // DELETE FROM sessions WHERE device_id = $1
+    removeDevice(deviceId) {
+        const session = this.sessions.get(deviceId);
+        if (!session) return null;
+        this._unindex(session);
+        this.sessions.delete(deviceId);
+        const i = bisectRight(this.sortedIds, deviceId) - 1;
+        if (this.sortedIds[i] === deviceId) this.sortedIds.splice(i, 1);
+        this._markDirty(deviceId, "delete");
+        return session;
+    }
+
+    // Every session owned by a socket that went away
+    removeSocket(socketId) {
+        const removed = this.devicesOnSocket(socketId);
+        for (const deviceId of removed) this.removeDevice(deviceId);
+        return removed;
+    }
+
+    static row(s) {
+        return { device_id: s.deviceId, socket_id: s.socketId, interface_id: s.interfaceId, updated_at: s.updatedAt };
+    }
+
+    all() {
+        return [...this.sessions.values()].map(RoutingTable.row);
+    }
+
+    // Keyset page ordered by device_id, as the SQL-backed listings are
+    page(cursor, limit) {
+        const start = cursor === undefined ? 0 : bisectRight(this.sortedIds, cursor);
+        const rows = this.sortedIds.slice(start, start + limit).map((k) => RoutingTable.row(this.sessions.get(k)));
+        return { rows, next: start + limit < this.sortedIds.length ? rows[rows.length - 1].device_id : null };
+    }
+
+    // ---- write-behind ----
+    _markDirty(deviceId, op) {
+        this.journal?.record(deviceId, op === "delete" ? null : RoutingTable.row(this.sessions.get(deviceId)));
+        this.dirty.set(deviceId, op);
+        if (!this.timer) this.timer = setTimeout(() => this.flush(), this.flushMs);
+    }
+
+    async flush() {
+        this.timer = null;
+        if (this.flushing) {
+            await this.flushing;
+            if (this.dirty.size && !this.timer) this.timer = setTimeout(() => this.flush(), this.flushMs);
+            return;
+        }
+        if (this.dirty.size === 0) return;
+
+        const batch = this.dirty;
+        this.dirty = new Map();
+        this.flushing = this._write(batch).finally(() => { this.flushing = null; });
+        await this.flushing;
+    }
+
+    async _write(batch) {
+        const t0 = process.hrtime.bigint();
+        const deletes = [];
+        const upserts = [];
+        for (const [deviceId, op] of batch) {
+            if (op === "delete") deletes.push(deviceId);
+            else if (this.sessions.has(deviceId)) upserts.push(this.sessions.get(deviceId));
+        }
+        try {
+            for (let i = 0; i < deletes.length; i += this.batchSize) {
+                this.stats.deletes += await this._writeRows(deletes.slice(i, i + this.batchSize), (ids) => this._delete(ids), (id) => id);
+            }
+            for (let i = 0; i < upserts.length; i += this.batchSize) {
+                this.stats.upserts += await this._writeRows(upserts.slice(i, i + this.batchSize), (rows) => this._upsert(rows), (s) => s.deviceId);
+            }
+            this.stats.flushes++;
+        } catch (err) {
+            // Put the batch back unless a newer change superseded it, and retry on the next tick
+            this.stats.errors++;
+            console.error(`[ROUTING] Write-behind failed (${batch.size} rows): ${err.message}`);
+            for (const [deviceId, op] of batch) {
+                if (!this.dirty.has(deviceId)) this.dirty.set(deviceId, op);
+            }
+            if (!this.timer) this.timer = setTimeout(() => this.flush(), this.flushMs * 10);
+        }
+        this.stats.lastFlushMs = Number(process.hrtime.bigint() - t0) / 1e6;
+    }
+
+    // One statement for `rows`; if a bad row fails it, write them one at a time and drop the rows
+    // that fail on their own, so one bad id can't hold back every later flush. Returns rows written.
+    async _writeRows(rows, write, idOf) {
+        try {
+            await write(rows);
+            return rows.length;
+        } catch (err) {
+            if (!isRowError(err)) throw err;
+        }
+        let written = 0;
+        for (const row of rows) {
+            try {
+                await write([row]);
+                written++;
+            } catch (err) {
+                if (!isRowError(err)) throw err;
+                this.stats.rejected++;
+                console.error(`[ROUTING] Dropping session write for ${idOf(row)}: ${err.message}`);
+            }
+        }
+        return written;
+    }
+
+    _delete(deviceIds) {
+        return this.pool.query(`DELETE FROM sessions WHERE device_id = ANY($1)`, [deviceIds]);
+    }
+
+    _upsert(rows) {
+        const values = [];
+        const params = [];
+        rows.forEach((s, j) => {
+            values.push(`($${j * 4 + 1}, $${j * 4 + 2}, $${j * 4 + 3}, $${j * 4 + 4})`);
+            params.push(s.deviceId, s.socketId, s.interfaceId, s.updatedAt);
+        });
+        return this.pool.query(
+            `INSERT INTO sessions (device_id, socket_id, interface_id, updated_at) VALUES ${values.join(", ")}
+             ON CONFLICT (device_id) DO UPDATE SET socket_id = EXCLUDED.socket_id,
+               interface_id = EXCLUDED.interface_id, updated_at = EXCLUDED.updated_at`,
+            params
+        );
+    }
+
+    // Flush everything now and stop the timer (shutdown)
+    async close() {
+        clearTimeout(this.timer);
+        this.timer = null;
+        if (this.flushing) await this.flushing;
+        if (this.dirty.size) await this.flush();
+        clearTimeout(this.timer);
+        this.timer = null;
+    }
+
+    clear() {
+        this.sessions.clear();
+        this.sortedIds = [];
+        this.byInterface.clear();
+        this.bySocket.clear();
+        this.dirty.clear();
+    }
+}
@@ -0,0 +1,174 @@
+// -----------------------------
+// Subnet visibility index
+// -----------------------------
+// A client sees a device when their subnets overlap or the device is public (README,
+// "Subnet Partitioning"). Device subnets live in a binary prefix trie over the IPv4
+// address bits, so a lookup walks at most 32 nodes to find every device subnet that
+// contains the client's, then the client's own subtree for the device subnets it
+// contains: the cost follows the number of matches, not the number of devices.
+// Public devices are kept in a separate set. Subnets that don't parse as IPv4 CIDR only
+// match the identical string.
+
+export function parseCidr(text) {
+    const match = /^\s*(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})(?:\/(\d{1,2}))?\s*$/.exec(String(text ?? ""));
+    if (!match) return null;
+    const octets = match.slice(1, 5).map(Number);
+    const length = match[5] === undefined ? 32 : Number(match[5]);
+    if (octets.some((o) => o > 255) || length > 32) return null;
+    const address = ((octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]) >>> 0;
+    const mask = length === 0 ? 0 : (0xffffffff << (32 - length)) >>> 0;
+    return { address: (address & mask) >>> 0, length };
+}
+
+export function isPublic(value) {
+    return value === true || String(value).toLowerCase() === "true";
+}
+
+function bit(address, depth) {
+    return (address >>> (31 - depth)) & 1;
+}
+
+class Node {
+    constructor(parent = null) {
+        this.parent = parent;
+        this.children = [null, null];
+        this.devices = null;     // Set(deviceId) registered with exactly this prefix
+    }
+}
+
+export class SubnetIndex {
+    constructor() {
+        this.root = new Node();
+        this.devices = new Map();    // deviceId -> { row, node | null }
+        this.public = new Set();     // deviceIds visible to everyone
+        this.unparsed = new Map();   // raw subnet string -> Set(deviceId)
+        this.nodes = 1;
+    }
+
+    async load(pool) {
+        const result = await pool.query(`SELECT device_id, connection_code, type, subnet, is_public FROM devices`);
+        for (const row of result.rows) this.add(row);
+        console.log(`[SUBNETS] Indexed ${this.devices.size} devices (${this.public.size} public, ${this.nodes} trie nodes)`);
+    }
+
+    add(row) {
+        if (this.devices.has(row.device_id)) this.remove(row.device_id);
+        const entry = {
+            row: { device_id: row.device_id, connection_code: row.connection_code, type: row.type, subnet: row.subnet, is_public: row.is_public },
+            node: null
+        };
+        const cidr = parseCidr(row.subnet);
+        if (cidr) {
+            let node = this.root;
+            for (let depth = 0; depth < cidr.length; depth++) {
+                const b = bit(cidr.address, depth);
+                if (!node.children[b]) {
+                    node.children[b] = new Node(node);
+                    this.nodes++;
+                }
+                node = node.children[b];
+            }
+            if (!node.devices) node.devices = new Set();
+            node.devices.add(row.device_id);
+            entry.node = node;
+        } else if (row.subnet) {
+            if (!this.unparsed.has(row.subnet)) this.unparsed.set(row.subnet, new Set());
+            this.unparsed.get(row.subnet).add(row.device_id);
+        }
+        if (isPublic(row.is_public)) this.public.add(row.device_id);
+        this.devices.set(row.device_id, entry);
+    }
+
+    remove(deviceId) {
+        const entry = this.devices.get(deviceId);
+        if (!entry) return false;
+        this.devices.delete(deviceId);
+        this.public.delete(deviceId);
+        let node = entry.node;
+        if (node) {
+            node.devices.delete(deviceId);
+            if (node.devices.size === 0) node.devices = null;
+            // Prune branches left empty so subtree walks only visit nodes that lead to devices
+            while (node.parent && !node.devices && !node.children[0] && !node.children[1]) {
+                const parent = node.parent;
+                parent.children[parent.children[0] === node ? 0 : 1] = null;
+                this.nodes--;
+                node = parent;
+            }
+        } else if (entry.row.subnet) {
+            const ids = this.unparsed.get(entry.row.subnet);
+            ids?.delete(deviceId);
+            if (ids && ids.size === 0) this.unparsed.delete(entry.row.subnet);
+        }
+        return true;
+    }
+
+    // Device ids whose subnet overlaps `subnet` (no public devices)
+    matching(subnet) {
+        const out = [];
+        for (const ids of this.overlapping(subnet)) out.push(...ids);
+        return out;
+    }
+
+    // matching() one trie node's Set of ids at a time, so a limited browse can stop walking early
+    *overlapping(subnet) {
+        const cidr = parseCidr(subnet);
+        if (!cidr) {
+            if (this.unparsed.has(subnet)) yield this.unparsed.get(subnet);
+            return;
+        }
+        // Device subnets containing the client's: the nodes on the path down to it
+        let node = this.root;
+        for (let depth = 0; node && depth < cidr.length; depth++) {
+            if (node.devices) yield node.devices;
+            node = node.children[bit(cidr.address, depth)];
+        }
+        // Device subnets inside the client's (including equal): its whole subtree
+        const stack = node ? [node] : [];
+        while (stack.length) {
+            const n = stack.pop();
+            if (n.devices) yield n.devices;
+            if (n.children[0]) stack.push(n.children[0]);
+            if (n.children[1]) stack.push(n.children[1]);
+        }
+    }
+
+    // Rows visible from `subnet`: overlapping subnets first, then the remaining public devices.
+    // Work is proportional to the rows returned, not to every overlapping device.
+    visible(subnet, { includePublic = true, limit = Infinity } = {}) {
+        const rows = [];
+        if (limit <= 0) return rows;
+        const seen = new Set();
+        for (const ids of this.overlapping(subnet)) {
+            for (const id of ids) {
+                seen.add(id);
+                rows.push(this.devices.get(id).row);
+                if (rows.length >= limit) return rows;
+            }
+        }
+        if (includePublic) {
+            for (const id of this.public) {
+                if (rows.length >= limit) break;
+                if (!seen.has(id)) rows.push(this.devices.get(id).row);
+            }
+        }
+        return rows;
+    }
+
+    // Point check for one device, used when an interface asks to connect
+    canSee(subnet, deviceId) {
+        const entry = this.devices.get(deviceId);
+        if (!entry) return false;
+        if (this.public.has(deviceId)) return true;
+        const client = parseCidr(subnet);
+        const device = parseCidr(entry.row.subnet);
+        if (!client || !device) return subnet === entry.row.subnet;
+        const length = Math.min(client.length, device.length);
+        const mask = length === 0 ? 0 : (0xffffffff << (32 - length)) >>> 0;
+        return ((client.address & mask) >>> 0) === ((device.address & mask) >>> 0);
+    }
+
+    stats() {
+        return { devices: this.devices.size, public: this.public.size, nodes: this.nodes, unparsed: this.unparsed.size };
+    }
+}
@@ -0,0 +1,83 @@
+// -----------------------------
+// RoutingTable write-behind
+// -----------------------------
+// Runs against a fake pg pool, so no database is needed:  npm test
+
+import { test } from "node:test";
+import assert from "node:assert/strict";
+import { randomUUID } from "crypto";
+import { RoutingTable } from "../src/routing.js";
+
+function pgError(code, message) {
+    return Object.assign(new Error(message), { code });
+}
+
+// Accepts session rows for `known` devices; any other device_id fails the whole statement
+// with a foreign-key violation, as PostgreSQL does for a multi-row INSERT
+function fakePool(known, { down = false } = {}) {
+    return {
+        rows: new Map(),
+        statements: 0,
+        async query(sql, params) {
+            this.statements++;
+            if (down) throw pgError("ECONNREFUSED", "connect ECONNREFUSED");
+            if (sql.startsWith("DELETE")) {
+                for (const id of params[0]) this.rows.delete(id);
+                return { rows: [] };
+            }
+            const ids = params.filter((_, i) => i % 4 === 0);
+            const bad = ids.find((id) => !known.has(id));
+            if (bad) throw pgError("23503", `insert or update on table "sessions" violates foreign key constraint (${bad})`);
+            for (const id of ids) this.rows.set(id, params[ids.indexOf(id) * 4 + 1]);
+            return { rows: [] };
+        }
+    };
+}
+
+function table(pool, devices) {
+    const routing = new RoutingTable(pool, { flushMs: 1e6 });
+    devices.forEach((deviceId, i) => routing.addDevice({ device_id: deviceId, connection_code: `C${i}`, type: "test" }));
+    return routing;
+}
+
+test("upsertDevice rejects ids that are not UUIDs or not registered", async () => {
+    const known = randomUUID();
+    const routing = table(fakePool(new Set([known])), [known]);
+    assert.equal(routing.upsertDevice("not-a-uuid", "s1"), false);
+    assert.equal(routing.upsertDevice(randomUUID(), "s1"), false);
+    assert.equal(routing.upsertDevice(known, "s1"), true);
+    assert.deepEqual([...routing.dirty.keys()], [known]);
+    await routing.close();
+});
+
+test("one bad row among good ones is dropped and the rest are written", async () => {
+    const good = Array.from({ length: 5 }, () => randomUUID());
+    const deleted = randomUUID(); // registered when the session was made, gone from the table by flush time
+    const pool = fakePool(new Set(good));
+    const routing = table(pool, [...good.slice(0, 2), deleted, ...good.slice(2)]);
+    for (const deviceId of [...good.slice(0, 2), deleted, ...good.slice(2)]) routing.upsertDevice(deviceId, "s1");
+
+    await routing.close();
+    assert.deepEqual([...pool.rows.keys()].sort(), [...good].sort());
+    assert.equal(routing.stats.rejected, 1);
+    assert.equal(routing.stats.upserts, good.length);
+    assert.equal(routing.dirty.size, 0);
+
+    // Later writes are not held back by the dropped row
+    routing.upsertDevice(good[0], "s2");
+    const before = pool.statements;
+    await routing.close();
+    assert.equal(pool.statements - before, 1);
+    assert.equal(pool.rows.get(good[0]), "s2");
+});
+
+test("a lost connection puts the whole batch back instead of dropping rows", async () => {
+    const good = Array.from({ length: 3 }, () => randomUUID());
+    const routing = table(fakePool(new Set(good), { down: true }), good);
+    for (const deviceId of good) routing.upsertDevice(deviceId, "s1");
+
+    await routing.close();
+    assert.equal(routing.stats.rejected, 0);
+    assert.equal(routing.stats.errors, 1);
+    assert.deepEqual([...routing.dirty.keys()].sort(), [...good].sort());
+});
@@ -8,6 +8,7 @@ const { io } = require('socket.io-client');
 dotenv.config(); // Load .env
 
 let mainWindow;
+let microscopeWindow;
 const connectedInterfaces = new Set();
 
 // ------------------ CREATE WINDOWS ------------------
@@ -33,7 +34,7 @@ function createWindow() {
 function createMicroscopeWindow() {
   if (mainWindow) mainWindow.hide();
 
-  const microscopeWindow = new BrowserWindow({
+  microscopeWindow = new BrowserWindow({
     width: 1950,
     height: 1080,
     webPreferences: {
@@ -46,6 +47,7 @@ function createMicroscopeWindow() {
   microscopeWindow.loadFile(path.join(__dirname, 'windows/microscope/window.html'));
 
   microscopeWindow.on('closed', () => {
+    microscopeWindow = null;
     if (mainWindow) mainWindow.show();
   });
 }
@@ -94,6 +96,13 @@ async function performGoogleOAuth() {
 // ------------------ SOCKET.IO ------------------
 const socket = io('http://localhost:3000'); // Replace with your server URL
 
+// Camera frames relayed by the dispatcher for the linked device
+socket.on('device_frame', (meta, frame) => {
+  if (microscopeWindow && !microscopeWindow.isDestroyed()) {
+    microscopeWindow.webContents.send('device-frame', meta, frame);
+  }
+});
+
 // ------------------ APP EVENTS ------------------
 app.whenReady().then(() => {
   createWindow();
@@ -74,7 +74,7 @@ function setApiBaseFromInputs() {
 
   // Refresh live stream if open
   const stream = document.getElementById("cameraStream");
-  if (stream) stream.src = `${apiBase}/camera_feed`;
+  if (stream) stream.src = `${apiBase}/camera_feed?mode=adaptive`;
 }
 
 
@@ -699,7 +699,7 @@ async function initializeCamera() {
         if (data.error) {
             alert("Failed to start camera: " + data.error);
         } else {
-            document.getElementById("cameraStream").src = `${apiBase}/camera_feed`;
+            document.getElementById("cameraStream").src = `${apiBase}/camera_feed?mode=adaptive`;
 
         }
     } catch (err) {
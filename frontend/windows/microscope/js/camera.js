@@ -12,8 +12,9 @@ async function initializeCamera() {
         if (data.error) {
             alert("Failed to start camera: " + data.error);
         } else {
-            document.getElementById("cameraStream").src = `http://192.168.1.60:8000/camera_feed`;
-
+            cameraOn = true;
+            showDirectFeed();
+            if (window.electronAPI) listenForRelayedFrames();
         }
     } catch (err) {
         alert("Error connecting to server: " + err.message);
@@ -21,6 +22,70 @@ async function initializeCamera() {
 }
 
 
+// The direct /camera_feed is the default. Inside Electron, frames relayed through the
+// dispatcher take over once one actually arrives, and the direct feed comes back when they
+// stop for RELAY_STALE_MS (agent not registered, not relaying, or the link dropped).
+// Only the newest relayed frame is kept: one that arrives while the previous is still
+// decoding replaces it instead of queueing behind it.
+const CAMERA_FEED_URL = `http://192.168.1.60:8000/camera_feed?mode=adaptive`;
+const RELAY_STALE_MS = 2000;
+let cameraOn = false;
+let relayListening = false;
+let relayActive = false;
+let relayWatchdog = null;
+let relayBusy = false;
+let relayPending = null;
+let relayUrl = null;
+
+function resetRelay() {
+    relayActive = false;
+    relayBusy = false;
+    relayPending = null;
+    clearTimeout(relayWatchdog);
+    relayWatchdog = null;
+    const img = document.getElementById("cameraStream");
+    img.onload = img.onerror = null;
+    if (relayUrl) URL.revokeObjectURL(relayUrl);
+    relayUrl = null;
+}
+
+function showDirectFeed() {
+    resetRelay();
+    document.getElementById("cameraStream").src = CAMERA_FEED_URL;
+}
+
+function listenForRelayedFrames() {
+    if (relayListening) return;
+    relayListening = true;
+    window.electronAPI.on("device-frame", (meta, bytes) => {
+        if (!cameraOn) return;
+        relayActive = true;
+        clearTimeout(relayWatchdog);
+        relayWatchdog = setTimeout(() => { if (cameraOn) showDirectFeed(); }, RELAY_STALE_MS);
+        relayPending = bytes;
+        if (!relayBusy) drawRelayedFrame();
+    });
+}
+
+function drawRelayedFrame() {
+    const img = document.getElementById("cameraStream");
+    const bytes = relayPending;
+    relayPending = null;
+    if (!bytes || !relayActive) {
+        relayBusy = false;
+        return;
+    }
+    relayBusy = true;
+    const url = URL.createObjectURL(new Blob([bytes], { type: "image/jpeg" }));
+    img.onload = img.onerror = () => {
+        if (relayUrl) URL.revokeObjectURL(relayUrl);
+        relayUrl = url;
+        drawRelayedFrame();
+    };
+    img.src = url;
+}
+
+
 async function setExposure() {
     const exposureValue = document.getElementById("exposureInput").value;
     try {
@@ -72,6 +137,8 @@ async function captureImage() {
 async function stopCamera() {
     try {
         refreshConnectionParams();
+        cameraOn = false;
+        resetRelay();
         document.getElementById("cameraStream").src = "";  // Stop image
         await fetch(`http://192.168.1.60:8000/stop_camera`);
     } catch (error) {
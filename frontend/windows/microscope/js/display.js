@@ -121,11 +121,18 @@ function displayPhaseDifference(data) {
 }
 
 
-function pixelateBase64Image(base64, canvasId) {
-    const img = new Image();
-    img.src = base64;
-
-    img.onload = () => {
+// `source` is an image URL (e.g. a base64 PNG) or an already drawn canvas
+function pixelateBase64Image(source, canvasId) {
+    let img = source;
+    if (typeof source === "string") {
+        img = new Image();
+        img.src = source;
+        img.onload = () => draw();
+    } else {
+        requestAnimationFrame(() => draw());
+    }
+
+    const draw = () => {
         const canvas = document.getElementById(canvasId);
         const ctx = canvas.getContext("2d");
 
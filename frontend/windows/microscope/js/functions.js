@@ -9,10 +9,18 @@ let imageFile = null
 
 
 let image = {
-    psi: null,
-    roi: null
+    psi: null,          // base64 PNG of the phase map, used by the ROI / point popups
+    roi: null,
+    phase: null,        // { data: Float32Array, shape, min, max } from a binary result
+    phaseCanvas: null
 };
 
+// The popups load the phase map as a PNG; with binary results it is encoded here, once, on first use
+function phasePsi() {
+    if (!image.psi && image.phaseCanvas) image.psi = image.phaseCanvas.toDataURL("image/png").split(",")[1];
+    return image.psi;
+}
+
 
 // Functions for loading object and refernce images, coressponding displaying functions found in display.js
 const objectInput = document.getElementById('imageFile');
@@ -91,25 +99,32 @@ async function runPhaseDiff() {
 
     try {
         startProcessingOverlay();
-        const response = await fetch(`http://192.168.1.60:8000/run_phase_difference`, {
+        // Binary float data when the agent supports it (see resultCodec.js), JSON + PNG otherwise
+        const data = await fetchResult(`http://192.168.1.60:8000/run_phase_difference`, {
             method: "POST",
             body: formData
-        });
-        if (!response.ok) throw new Error("Server error " + response.status);
-
-        const data = await response.json();
+        }, PHASE_RESULT_OPTIONS);
+        if (data.error) throw new Error(data.error);
 
         // Render phase output container
         const phaseOutputBox = document.getElementById("phaseOutput");
         phaseOutputBox.innerHTML = `<canvas id="pixelCanvas" style="width:100%; height:100%;"></canvas>`;
 
         // Run pixelation effect on returned phase image
-        pixelateBase64Image("data:image/png;base64," + data.phase_image, "pixelCanvas");
+        if (data.arrays) {
+            image.phase = data.arrays.phase;
+            image.phaseCanvas = arrayToCanvas(image.phase);
+            image.psi = null;  // encoded from the canvas only if a popup needs it
+            pixelateBase64Image(image.phaseCanvas, "pixelCanvas");
+        } else {
+            pixelateBase64Image("data:image/png;base64," + data.phase_image, "pixelCanvas");
+            image.phase = image.phaseCanvas = null;
+            image.psi = data.phase_image;
+        }
 
         // Optional debug logs
         console.log("Phase shape:", data.shape);
         console.log("Phase range:", data.min, "to", data.max);
-        image.psi = data.phase_image;
 
     } catch (error) {
         console.error("Error:", error);
@@ -183,7 +198,7 @@ function getParams() {
 
 
 function startROISelection() {
-    if (!image.psi) {
+    if (!phasePsi()) {
         alert("No phase difference image available.");
         return;
     }
@@ -313,12 +328,16 @@ async function fetch3DPlot() {
     try {
         startProcessingOverlay()
 
-        const response = await fetch(`http://192.168.1.60:8000/compute_3d`);
-        const data = await response.json();
+        const data = await fetchResult(`http://192.168.1.60:8000/compute_3d`);
         if (data.error) {
             alert(data.error);
             return;
         }
+        if (data.arrays) {
+            data.x = data.arrays.x.data;
+            data.y = data.arrays.y.data;
+            data.z = rowsOf(data.arrays.z);
+        }
         const output3D = document.getElementById("output3D");
         output3D.innerHTML = `<div id="plot3d" style="width:100%; height:100%;"></div>`;
 
@@ -351,7 +370,7 @@ async function fetch3DPlot() {
 
 
 function startPointsSelection() {
-    if (!image.roi && !image.psi) {
+    if (!image.roi && !phasePsi()) {
         alert("Please compute the phase difference first.");
         return;
     }
@@ -531,7 +550,7 @@ async function fetch1DPlot() {
     const y2 = Math.round(point2.y);
 
     try {
-        const response = await fetch(`http://192.168.1.60:8000/compute_1d`, {
+        const data = await fetchResult(`http://192.168.1.60:8000/compute_1d`, {
             method: "POST",
             headers: {
                 "Content-Type": "application/json"
@@ -540,11 +559,14 @@ async function fetch1DPlot() {
         });
 
         // recieve thickness and distance to plot
-        const data = await response.json();
         if (data.error) {
             alert(data.error);
             return;
         }
+        if (data.arrays) {
+            data.x = data.arrays.x.data;
+            data.y = data.arrays.y.data;
+        }
 
         const output1D = document.getElementById("output1D");
 
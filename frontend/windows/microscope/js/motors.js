@@ -35,7 +35,36 @@ document.getElementById("unfocus").addEventListener("click", () => {
 });
 
 
+// Jog commands go over the agent's /motor_ws queue when it offers one: rapid clicks are
+// merged into a single move on the device instead of each waiting on an HTTP round-trip.
+let motorSocket = null;
+let motorSocketUnsupported = false;
+
+function motorChannel() {
+    if (motorSocketUnsupported) return null;
+    if (motorSocket) return motorSocket;
+    let opened = false;
+    motorSocket = new WebSocket("ws://192.168.1.60:8000/motor_ws");
+    motorSocket.onopen = () => { opened = true; };
+    motorSocket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        if (data.type === "done" || data.type === "error") console.log("Motor feedback:", data);
+    };
+    motorSocket.onclose = () => {
+        if (!opened) motorSocketUnsupported = true; // older agent: stay on HTTP
+        motorSocket = null;
+    };
+    return motorSocket;
+}
+
 async function move_motor(motor_number, steps, latency_ms, direction) {
+    const ws = motorChannel();
+    if (ws && ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ motor_number, steps, latency_ms, direction }));
+        stopProcessingOverlay();
+        return;
+    }
+
     const formData = new FormData();
     formData.append("motor_number", motor_number);
     formData.append("steps", steps);
@@ -0,0 +1,118 @@
+// Binary result decoder (see tests/resultCodec.py for the format).
+// fetchResult() asks the agent for application/x-phase-result and falls back to JSON
+// when the agent answers with JSON (older agents, or errors). Arrays come back as
+// Float32Array (uint16 payloads are dequantized, NaN restored) with their shape.
+
+const RESULT_CONTENT_TYPE = "application/x-phase-result";
+const PHASE_RESULT_OPTIONS = { dtype: "uint16" };  // ~3e-5 rad steps at half the bytes of float32
+
+// Options become query parameters: { dtype: "uint16", compress: "deflate", preview: 512 }
+async function fetchResult(url, init = {}, options = {}) {
+    const target = new URL(url, typeof window !== "undefined" ? window.location.href : undefined);
+    for (const [key, value] of Object.entries(options)) {
+        if (value !== undefined && value !== null) target.searchParams.set(key, value);
+    }
+    const headers = Object.assign({}, init.headers, { Accept: `${RESULT_CONTENT_TYPE}, application/json` });
+    const response = await fetch(target, Object.assign({}, init, { headers }));
+    const type = response.headers.get("Content-Type") || "";
+    if (type.startsWith(RESULT_CONTENT_TYPE)) {
+        return decodeResult(await response.arrayBuffer());
+    }
+    const data = await response.json();
+    if (!response.ok && !data.error) throw new Error("Server error " + response.status);
+    return data;
+}
+
+async function inflate(bytes) {
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+function unshuffle(bytes, itemSize) {
+    const count = bytes.length / itemSize;
+    const out = new Uint8Array(bytes.length);
+    for (let b = 0; b < itemSize; b++) {
+        const plane = b * count;
+        for (let i = 0; i < count; i++) out[i * itemSize + b] = bytes[plane + i];
+    }
+    return out.buffer;
+}
+
+// { meta..., arrays: { name: { data: Float32Array, shape, min, max } } }
+async function decodeResult(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== "PHR1") throw new Error("Not a phase result message");
+    const length = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, length)));
+    const arrays = {};
+    for (const entry of header.arrays) {
+        const itemSize = entry.dtype === "uint16" ? 2 : 4;
+        const count = entry.shape.reduce((a, b) => a * b, 1);
+        let source = buffer;
+        let offset = entry.offset;
+        if (entry.codec === "deflate") {
+            source = unshuffle(await inflate(new Uint8Array(buffer, entry.offset, entry.length)), entry.shuffle);
+            offset = 0;
+        }
+        let data;
+        if (entry.dtype === "uint16") {
+            const codes = new Uint16Array(source, offset, count);
+            data = new Float32Array(count);
+            for (let i = 0; i < count; i++) {
+                data[i] = codes[i] === entry.nan ? NaN : entry.min + codes[i] * entry.scale;
+            }
+        } else {
+            data = new Float32Array(source, offset, count);  // zero-copy when uncompressed
+        }
+        arrays[entry.name] = { data, shape: entry.shape, min: entry.min, max: entry.max };
+    }
+    return Object.assign({}, header.meta, { arrays });
+}
+
+// Rows of a 2D array as Float32Array views, the shape Plotly wants for surface z
+function rowsOf({ data, shape }) {
+    const rows = [];
+    for (let r = 0; r < shape[0]; r++) rows.push(data.subarray(r * shape[1], (r + 1) * shape[1]));
+    return rows;
+}
+
+// Grayscale canvas of a 2D array scaled over [min, max]; drawable without a PNG round-trip
+function arrayToCanvas({ data, shape, min, max }) {
+    const [h, w] = shape;
+    const canvas = document.createElement("canvas");
+    canvas.width = w;
+    canvas.height = h;
+    const ctx = canvas.getContext("2d");
+    const pixels = ctx.createImageData(w, h);
+    const scale = max > min ? 255 / (max - min) : 0;
+    for (let i = 0; i < data.length; i++) {
+        const v = (data[i] - min) * scale;  // NaN becomes 0
+        const p = i * 4;
+        pixels.data[p] = pixels.data[p + 1] = pixels.data[p + 2] = v;
+        pixels.data[p + 3] = 255;
+    }
+    ctx.putImageData(pixels, 0, 0);
+    return canvas;
+}
+
+// Node: `node resultCodec.js payload.bin ...` times decodeResult on files written by
+// `python tests/resultCodec.py --write DIR`
+if (typeof module !== "undefined" && require.main === module) {
+    const fs = require("node:fs");
+    (async () => {
+        for (const file of process.argv.slice(2)) {
+            const bytes = fs.readFileSync(file);
+            const buffer = bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.length);
+            let best = Infinity;
+            let result;
+            for (let i = 0; i < 10; i++) {
+                const t0 = process.hrtime.bigint();
+                result = await decodeResult(buffer.slice(0));
+                best = Math.min(best, Number(process.hrtime.bigint() - t0) / 1e6);
+            }
+            const shape = Object.values(result.arrays).map((a) => a.shape.join("x")).join(", ");
+            console.log(`[CODEC] ${file.split("/").pop()} ${bytes.length} bytes -> ${shape} in ${best.toFixed(2)}ms`);
+        }
+    })();
+}
@@ -0,0 +1,163 @@
+import io
+import itertools
+import socket
+import time
+
+import numpy as np
+from PIL import Image
+
+# -----------------------------
+# Configuration
+# -----------------------------
+# Quality ladder for ?mode=adaptive: (JPEG quality, decimation stride). Level 0 is the
+# camera loop's own full-resolution encode, shared by every client that keeps up.
+STREAM_LEVELS = ((80, 1), (65, 1), (50, 2), (40, 2), (30, 3), (25, 4))
+MIN_STREAM_FPS = 5                # below this affordable rate a client drops a level
+HEADROOM = 0.8                    # fraction of the measured throughput we plan to use
+UPGRADE_FRAMES = 15               # frames of spare capacity needed before stepping back up
+SEND_BUFFER = 64 * 1024           # bytes queued per client before writes start blocking
+EWMA = 0.2
+
+_client_ids = itertools.count(1)
+
+
+def ewma(old, new, alpha=EWMA):
+    return new if old is None else old + alpha * (new - old)
+
+
+# -----------------------------
+# Per-client adaptive stream
+# -----------------------------
+class StreamClient:
+    """Rate controller and encoder for one /camera_feed?mode=adaptive consumer.
+
+    The send path is kept shallow (small socket and transport buffers), so a slow reader
+    makes `write` block instead of queueing frames. While it blocks, newer frames replace
+    older ones and only the latest is sent: stale frames are dropped, not buffered. The
+    time each write takes gives the client's throughput, which picks the quality level
+    and the paced frame rate.
+    """
+
+    def __init__(self, peer, max_fps):
+        self.id = next(_client_ids)
+        self.peer = peer
+        self.max_fps = max_fps
+        self.target_fps = max_fps
+        self.level = 0
+        self.spare_frames = 0
+        self.frame_bytes = [None] * len(STREAM_LEVELS)   # EWMA encoded size per level
+        self.send_bytes = None                          # EWMA bytes per write
+        self.send_seconds = None                        # EWMA seconds blocked per write
+        self.buffer = io.BytesIO()                      # reused for every encode
+        self.scaled = None                              # reused decimation target
+        self.started = time.monotonic()
+        self.last_seq = 0
+        self.last_sent = None
+        self.sent = 0
+        self.dropped = 0
+        self.interval = None
+        self.encode_ms = None
+        self.age_ms = None
+        self.max_age_ms = 0.0
+
+    @staticmethod
+    def limit_send_buffer(transport):
+        """Shrink kernel and asyncio buffers so backpressure reaches us within ~one frame."""
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+            except OSError:
+                pass
+        transport.set_write_buffer_limits(high=SEND_BUFFER)
+
+    # ---- encoding ----
+    def encode(self, frame, shared_jpeg):
+        """JPEG for the current level; level 0 reuses the camera loop's encode."""
+        if self.level == 0:
+            self.encode_ms = ewma(self.encode_ms, 0.0)
+            return shared_jpeg
+        quality, stride = STREAM_LEVELS[self.level]
+        t0 = time.perf_counter()
+        src = frame[::stride, ::stride]
+        if self.scaled is None or self.scaled.shape != src.shape:
+            self.scaled = np.empty_like(src)
+        np.copyto(self.scaled, src)
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        Image.fromarray(self.scaled).save(self.buffer, format="JPEG", quality=quality)
+        self.encode_ms = ewma(self.encode_ms, (time.perf_counter() - t0) * 1000)
+        return self.buffer.getvalue()
+
+    # ---- rate control ----
+    def next_send_time(self):
+        return self.last_sent + 1.0 / self.target_fps if self.last_sent else 0.0
+
+    def on_sent(self, seq, size, send_seconds, frame_time):
+        """Account for one delivered frame and retune level and pacing."""
+        now = time.monotonic()
+        if self.last_seq:
+            self.dropped += max(0, seq - self.last_seq - 1)
+        if self.last_sent is not None:
+            self.interval = ewma(self.interval, now - self.last_sent)
+        self.last_seq, self.last_sent = seq, now
+        self.sent += 1
+        age = (time.time() - frame_time) * 1000
+        self.age_ms = ewma(self.age_ms, age)
+        self.max_age_ms = max(self.max_age_ms, age)
+
+        # Ratio of averages, not an average of ratios: most writes return at once and the
+        # cost of a frame shows up as the next write blocking.
+        self.send_bytes = ewma(self.send_bytes, size)
+        self.send_seconds = ewma(self.send_seconds, send_seconds)
+        throughput = self.throughput()
+        self.frame_bytes[self.level] = ewma(self.frame_bytes[self.level], size)
+        affordable = HEADROOM * throughput / self.frame_bytes[self.level]
+        if affordable < MIN_STREAM_FPS:
+            # Step straight down to the first level expected to sustain MIN_STREAM_FPS
+            while self.level < len(STREAM_LEVELS) - 1 and \
+                    HEADROOM * throughput / self.estimate_bytes(self.level) < MIN_STREAM_FPS:
+                self.level += 1
+            self.spare_frames = 0
+        elif self.level > 0:
+            upgrade = HEADROOM * throughput / self.estimate_bytes(self.level - 1) >= self.max_fps
+            self.spare_frames = self.spare_frames + 1 if upgrade else 0
+            if self.spare_frames >= UPGRADE_FRAMES:
+                self.level -= 1
+                self.spare_frames = 0
+        self.target_fps = max(MIN_STREAM_FPS, min(self.max_fps, HEADROOM * throughput / self.estimate_bytes(self.level)))
+
+    def estimate_bytes(self, level):
+        """Measured frame size at `level`, else scaled from the nearest measured level by pixels and quality."""
+        if self.frame_bytes[level] is not None:
+            return self.frame_bytes[level]
+        known = min((i for i, b in enumerate(self.frame_bytes) if b is not None), key=lambda i: abs(i - level))
+        quality, stride = STREAM_LEVELS[level]
+        known_quality, known_stride = STREAM_LEVELS[known]
+        return self.frame_bytes[known] * (known_stride / stride) ** 2 * quality / known_quality
+
+    def throughput(self):
+        """Estimated client bandwidth in bytes/s."""
+        if self.send_bytes is None:
+            return None
+        return self.send_bytes / max(self.send_seconds, 1e-4)
+
+    def stats(self):
+        throughput = self.throughput()
+        quality, stride = STREAM_LEVELS[self.level]
+        return {
+            "id": self.id,
+            "peer": self.peer,
+            "level": self.level,
+            "quality": quality,
+            "scale": round(1 / stride, 3),
+            "fps": round(1 / self.interval, 2) if self.interval else None,
+            "target_fps": round(self.target_fps, 2),
+            "encode_ms": round(self.encode_ms, 2) if self.encode_ms is not None else None,
+            "frame_age_ms": round(self.age_ms, 1) if self.age_ms is not None else None,
+            "max_frame_age_ms": round(self.max_age_ms, 1),
+            "throughput_kbps": round(throughput * 8 / 1000, 1) if throughput else None,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "uptime_s": round(time.monotonic() - self.started, 1),
+        }
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+from phaseDifference import PhaseReconstructor, limit_fft_workers, parse_params
+
+# -----------------------------
+# Configuration
+# -----------------------------
+RING_FRAMES = 64                  # frames of headroom between the camera and the reconstruction
+BATCH_FRAMES = 4                  # holograms per worker call
+PENDING = 0                       # frames.npy state values
+DONE = 1
+DROPPED = 2                       # overwritten in the ring before a worker could read it
+FRAME_META = np.dtype([("time", "f8"), ("state", "u1")])
+
+
+# -----------------------------
+# Capture ring buffer
+# -----------------------------
+# One writer (the camera loop) and any number of readers in other processes. The layout
+# is [head int64][slot seq int64 x N][slot time f64 x N][frames uint8 x N], in POSIX
+# shared memory or in a memory-mapped file. push() never waits: the oldest slot is
+# overwritten, and a reader that was too slow finds a different seq in the slot and
+# counts the frame as dropped. Each slot is a seqlock: its seq is -1 while it is written,
+# and a reader checks the seq again after copying so a torn frame is never used.
+
+class CaptureRing:
+    def __init__(self, capacity, shape, name=None, path=None, create=True):
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.frame_bytes = int(np.prod(self.shape))
+        size = 8 + capacity * 16 + capacity * self.frame_bytes
+        self.shm = None
+        self.path = path
+        if path is not None:
+            buffer = np.memmap(path, dtype=np.uint8, mode="w+" if create else "r+", shape=(size,))
+            self.name = path
+        else:
+            self.shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+            buffer = self.shm.buf
+            self.name = self.shm.name
+        self._buffer = buffer
+        self._head = np.ndarray((1,), np.int64, buffer, 0)
+        self.seqs = np.ndarray((capacity,), np.int64, buffer, 8)
+        self.times = np.ndarray((capacity,), np.float64, buffer, 8 + capacity * 8)
+        self.frames = np.ndarray((capacity,) + self.shape, np.uint8, buffer, 8 + capacity * 16)
+        if create:
+            self._head[0] = 0
+            self.seqs[:] = -1
+
+    def spec(self):
+        """Picklable arguments for attach() in another process."""
+        return {"capacity": self.capacity, "shape": self.shape,
+                "name": None if self.path else self.name, "path": self.path}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec["capacity"], spec["shape"], name=spec["name"], path=spec["path"], create=False)
+
+    @property
+    def head(self):
+        """Frames pushed so far; the next push gets this seq."""
+        return int(self._head[0])
+
+    def push(self, frame, timestamp=None):
+        seq = int(self._head[0])
+        slot = seq % self.capacity
+        self.seqs[slot] = -1
+        self.frames[slot] = frame
+        self.times[slot] = time.time() if timestamp is None else timestamp
+        self.seqs[slot] = seq
+        self._head[0] = seq + 1
+        return seq
+
+    def read_into(self, seq, out):
+        """Copy frame `seq` into `out`; returns its timestamp, or None if it was overwritten."""
+        slot = seq % self.capacity
+        if self.seqs[slot] != seq:
+            return None
+        out[...] = self.frames[slot]
+        timestamp = float(self.times[slot])
+        return timestamp if self.seqs[slot] == seq else None
+
+    def close(self, unlink=False):
+        self._head = self.seqs = self.times = self.frames = None
+        self._buffer = None
+        if self.shm is not None:
+            self.shm.close()
+            if unlink:
+                self.shm.unlink()
+        elif unlink and self.path:
+            os.remove(self.path)
+
+
+# -----------------------------
+# Worker processes
+# -----------------------------
+# State set once per worker by _init_worker: the ring, the output stack and a reconstructor
+# whose reference side is prepared on the first batch and reused for the whole run.
+_worker = {}
+
+
+def _init_worker(ring_spec, stack_path, reference, params):
+    limit_fft_workers()
+    _worker.update(ring=CaptureRing.attach(ring_spec), stack=np.load(stack_path, mmap_mode="r+"),
+                   reconstructor=PhaseReconstructor(cache_size=1), reference=reference, params=params)
+
+
+def _ready():
+    """No-op submitted once per worker so the pool spawns and initialises them up front."""
+    return os.getpid()
+
+
+def _process_batch(seqs):
+    """Reconstruct frames `seqs` from the ring into the stack; returns [(seq, time or None)]."""
+    ring, stack = _worker["ring"], _worker["stack"]
+    batch = np.empty((len(seqs),) + ring.shape, np.float32)
+    read, results = [], []
+    for seq in seqs:
+        timestamp = ring.read_into(seq, batch[len(read)])
+        results.append((seq, timestamp))
+        if timestamp is not None:
+            read.append(seq)
+    for seq, frame in zip(read, batch):  # copied out of the ring first, before it can be overwritten
+        _worker["reconstructor"].reconstruct_into(frame, _worker["reference"], _worker["params"], stack[seq],
+                                                  reference_key="timelapse")
+    return results
+
+
+# -----------------------------
+# Time-lapse run
+# -----------------------------
+class TimeLapse:
+    """Capture `frames` holograms through a ring and reconstruct them against one reference.
+
+    The producer calls push() at camera rate; run() keeps up to two batches per worker
+    in flight so every core stays busy, and workers write phase maps straight into
+    `<directory>/phase.npy` (float32, frames x h x w). `<directory>/frames.npy` holds
+    each frame's capture time and state (PENDING, DONE, DROPPED). Both are plain .npy
+    files, so the stack can be paged with np.load(..., mmap_mode="r") by anything.
+    """
+
+    def __init__(self, frames, reference, params, directory=None, ring_frames=RING_FRAMES,
+                 batch=BATCH_FRAMES, workers=None, ring_file=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.frames = frames
+        self.shape = np.shape(reference)
+        self.params = params
+        self.batch = max(1, batch)
+        self.workers = workers or os.cpu_count() or 1
+        self.directory = directory or os.path.join(tempfile.gettempdir(), f"timelapse-{self.id}")
+        os.makedirs(self.directory, exist_ok=True)
+        self.stack_path = os.path.join(self.directory, "phase.npy")
+        self.stack = np.lib.format.open_memmap(self.stack_path, mode="w+", dtype=np.float32,
+                                               shape=(frames,) + self.shape)
+        self.meta = np.lib.format.open_memmap(os.path.join(self.directory, "frames.npy"), mode="w+",
+                                              dtype=FRAME_META, shape=(frames,))
+        self.ring = CaptureRing(ring_frames, self.shape, path=ring_file)
+        # spawn, not fork: the agent process has an event loop and executor threads
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=get_context("spawn"), initializer=_init_worker,
+                                        initargs=(self.ring.spec(), self.stack_path,
+                                                  np.asarray(reference, np.float32), params))
+        # the pool spawns lazily; start every worker now rather than on the first batch
+        self.warmup = [self.pool.submit(_ready) for _ in range(self.workers)]
+        self.capturing = False      # set by start() once all workers are up
+        self.captured = 0           # frames pushed into the ring
+        self.next_seq = 0           # first frame not yet handed to a worker
+        self.pending = {}           # asyncio future -> batch size
+        self.done = 0
+        self.dropped = 0
+        self.stopped = False
+        self.started = time.time()
+        self.finished = None
+        self.busy = 0.0             # s with at least one batch in flight
+
+    async def start(self):
+        """Wait for every worker to finish starting; push() ignores frames until then."""
+        if self.capturing:
+            return
+        try:
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in self.warmup))
+        except BaseException:
+            self.finished = time.time()
+            await self.close()
+            raise
+        self.capturing = True
+        self.started = time.time()
+
+    def push(self, frame, timestamp=None):
+        """Producer side; never waits on processing. Returns False while the workers are
+        still starting and once the run has all its frames."""
+        if not self.capturing or self.stopped or self.captured >= self.frames:
+            return False
+        self.ring.push(frame, timestamp)
+        self.captured += 1
+        return True
+
+    def stop(self):
+        """End capture early; frames already in the ring are still processed."""
+        if self.stopped:
+            return
+        self.stopped = True
+        if self.captured < self.frames:
+            self.meta["state"][self.captured:] = DROPPED
+            self.dropped += self.frames - self.captured
+
+    def _capture_over(self):
+        return self.stopped or self.captured >= self.frames
+
+    def _dispatch(self):
+        head = self.captured
+        oldest = head - self.ring.capacity  # frames before this are already overwritten
+        if self.next_seq < oldest:
+            self.meta["state"][self.next_seq:oldest] = DROPPED
+            self.dropped += oldest - self.next_seq
+            self.next_seq = oldest
+        while len(self.pending) < 2 * self.workers:
+            ready = head - self.next_seq
+            if ready <= 0 or (ready < self.batch and not self._capture_over()):
+                return
+            seqs = list(range(self.next_seq, self.next_seq + min(self.batch, ready)))
+            self.pending[asyncio.wrap_future(self.pool.submit(_process_batch, seqs))] = len(seqs)
+            self.next_seq += len(seqs)
+
+    def _collect(self, future):
+        del self.pending[future]
+        for seq, timestamp in future.result():
+            if timestamp is None:
+                self.meta[seq] = (0.0, DROPPED)
+                self.dropped += 1
+            else:
+                self.meta[seq] = (timestamp, DONE)
+                self.done += 1
+
+    async def run(self, poll=0.01):
+        await self.start()
+        try:
+            while True:
+                self._dispatch()
+                if self._capture_over() and not self.pending and self.next_seq >= self.captured:
+                    break
+                t0 = time.monotonic()
+                if self.pending:
+                    finished, _ = await asyncio.wait(list(self.pending), timeout=poll,
+                                                     return_when=asyncio.FIRST_COMPLETED)
+                    self.busy += time.monotonic() - t0
+                    for future in finished:
+                        self._collect(future)
+                else:
+                    await asyncio.sleep(poll)
+            self.stack.flush()
+            self.meta.flush()
+        finally:
+            self.finished = time.time()
+            await self.close()
+
+    async def close(self):
+        """Shut the pool down in a thread: in-flight batches finish without blocking the event loop."""
+        self.stopped = True
+        await asyncio.get_running_loop().run_in_executor(None, self._shutdown)
+
+    def _shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        if self.ring.frames is not None:
+            self.ring.close(unlink=True)
+
+    def frame(self, index):
+        """(phase map, capture time) for frame `index`, or None while it is pending or if it was dropped."""
+        time_, state = self.meta[index]
+        return (self.stack[index], float(time_)) if state == DONE else None
+
+    def status(self):
+        elapsed = (self.finished or time.time()) - self.started
+        return {
+            "id": self.id,
+            "running": self.finished is None,
+            "frames": self.frames,
+            "captured": self.captured,
+            "processed": self.done,
+            "dropped": self.dropped,
+            "in_flight": sum(self.pending.values()),
+            "workers": self.workers,
+            "ring_frames": self.ring.capacity,
+            "processed_fps": round(self.done / elapsed, 2) if elapsed > 0 else None,
+            "directory": self.directory,
+            "thickness_per_rad": self.params["wavelength"] / (2 * np.pi * self.params["delta_ri"]),
+        }
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+async def bench(args):
+    from microscopeAgent import HologramSource
+
+    source = HologramSource(args.size, args.size)
+    reference = source.frame(0, with_object=False)
+    timelapse = TimeLapse(args.frames, reference, parse_params({}), ring_frames=args.ring_frames,
+                          batch=args.batch, workers=args.workers)
+    interval = 1.0 / args.fps
+    pushes = []
+
+    async def camera():
+        frame = source.frame(0)  # rendering isn't what's measured: push the same frame at camera rate
+        next_tick = time.monotonic()
+        while not timelapse._capture_over():
+            t0 = time.perf_counter()
+            timelapse.push(frame)
+            pushes.append(time.perf_counter() - t0)
+            next_tick += interval
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+
+    print(f"[TIMELAPSE] {args.frames} frames {args.size}x{args.size} @ {args.fps} fps, ring {args.ring_frames}, "
+          f"batch {args.batch}, {timelapse.workers} workers -> {timelapse.directory}")
+    await timelapse.start()
+    cpu0 = os.times()
+    await asyncio.gather(camera(), timelapse.run())
+    cpu1 = os.times()
+    status = timelapse.status()
+    elapsed = timelapse.finished - timelapse.started
+    worker_cpu = (cpu1.children_user + cpu1.children_system) - (cpu0.children_user + cpu0.children_system)
+    print(f"[TIMELAPSE] processed {status['processed']} dropped {status['dropped']} in {elapsed:.1f}s "
+          f"({status['processed_fps']} frames/s), push p99 {np.percentile(pushes, 99) * 1000:.3f}ms, "
+          f"worker CPU {worker_cpu / elapsed:.1f} cores")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ring-buffered time-lapse reconstruction benchmark")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--size", type=int, default=512, help="square frame size")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--ring-frames", type=int, default=RING_FRAMES)
+    parser.add_argument("--batch", type=int, default=BATCH_FRAMES)
+    parser.add_argument("--workers", type=int, default=None, help="default: one per core")
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
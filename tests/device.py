@@ -1,19 +1,44 @@
 import tkinter as tk
 from tkinter import messagebox
-import requests
+import functools
+import queue
 import random
 import string
 import threading
-import socketio
 import time
+import socketio
+import os
+import sys
+import dispatcherClient
+import metrics
+from sessionCache import SessionCache
+from subnetIndex import overlaps, parse_cidr
+from virtualList import VirtualList
+
+# ---------------- Headless fleet mode ----------------
+# `python device.py --headless -n 1000` skips the GUI and runs deviceFleet instead
+if __name__ == "__main__" and "--headless" in sys.argv:
+    import deviceFleet
+    deviceFleet.main([a for a in sys.argv[1:] if a != "--headless"])
+    sys.exit(0)
+
+# `python device.py --soak -n 20 --duration 4h` churns register/connect/link/disconnect/delete
+# through soak.py and fails on resource growth or orphaned sessions in the dispatcher
+if __name__ == "__main__" and "--soak" in sys.argv:
+    import soak
+    soak.main([a for a in sys.argv[1:] if a != "--soak"])
+    sys.exit(0)
 
 # ---------------- Server URLs ----------------
-API_URL = "http://localhost:3000/api/register_device"
-DEVICES_URL = "http://localhost:3000/admin/devices"
-INTERFACES_URL = "http://localhost:3000/admin/interfaces"
-DELETE_URL = "http://localhost:3000/api/delete_device"
-SESSIONS_URL = "http://localhost:3000/admin/sessions"
-SOCKET_URL = "http://localhost:3000"
+# HTTP calls go through dispatcherClient's pooled session; override with DISPATCHER_URL
+SOCKET_URL = dispatcherClient.BROKER_URL
+
+# ---------------- Metrics ----------------
+# DEVICE_METRICS_PORT=9101 serves /metrics (and /profile with METRICS_PROFILE=1)
+RECONNECT_ATTEMPTS = metrics.counter("socket_reconnect_attempts_total", "Connect attempts made after a drop")
+RECONNECTS = metrics.counter("socket_reconnects_total", "Sockets that reconnected and re-announced")
+if os.environ.get("DEVICE_METRICS_PORT"):
+    metrics.start_http_server(int(os.environ["DEVICE_METRICS_PORT"]))
 
 # ---------------- GUI ----------------
 root = tk.Tk()
@@ -40,8 +65,22 @@ for i, field in enumerate(fields):
 # --- Log ---
 log_text = tk.Text(left_frame, height=15)
 log_text.grid(row=len(fields)+3, column=0, columnspan=2, pady=5)
+
+# ---------------- UI update queue ----------------
+# Socket, cache and worker threads never touch Tk: they post ("log", msg) and
+# ("cache", kind, key, row) diffs here, and drain_updates applies them on the main loop.
+updates = queue.Queue()
+DRAIN_INTERVAL_MS = 50
+DRAIN_BUDGET = 0.03  # seconds of main-loop time per drain, so a flood of diffs can't freeze the window
+LOG_LINES = 2000
+
 def log(msg):
+    updates.put(("log", msg))
+
+def write_log(msg):
     log_text.insert(tk.END, msg+"\n")
+    if int(log_text.index("end-1c").split(".")[0]) > LOG_LINES:
+        log_text.delete("1.0", f"end-{LOG_LINES}l")
     log_text.see(tk.END)
 
 # ---------------- Random Values ----------------
@@ -62,9 +101,12 @@ def random_values():
     entries['connection_code'].insert(0, ''.join(random.choices(string.ascii_uppercase+string.digits, k=8)))
 
 # ---------------- Socket.IO Client ----------------
-sio = socketio.Client()
+# Reconnects are driven by reconnect_loop (full-jitter backoff) instead of the client's own
+sio = socketio.Client(reconnection=False)
 connected_devices = {}  # deviceId -> {type, connection_code}
+hosted_devices = set()  # deviceIds this client announced; re-announced after a reconnect
 socket_thread_lock = threading.Lock()
+reconnecting = threading.Event()
 
 def start_socket_thread(device_id):
     """Connect via Socket.IO and register device session"""
@@ -77,8 +119,8 @@ def start_socket_thread(device_id):
 
                 # Register session
                 try:
-                    res = requests.post(f"{SOCKET_URL}/api/register_device_session",
-                                        json={"deviceId": device_id, "socketId": sio.sid}, timeout=5)
+                    res = dispatcherClient.post("/api/register_device_session",
+                                                json={"deviceId": device_id, "socketId": sio.sid})
                     if res.ok:
                         log(f"[SERVER] Device session created for {device_id}")
                     else:
@@ -87,95 +129,135 @@ def start_socket_thread(device_id):
                     log(f"[ERROR] Registering session failed: {e}")
 
                 sio.emit("device_connect_to_dispatcher", {"deviceId": device_id})
+                hosted_devices.add(device_id)
                 log(f"[SOCKET] Device {device_id} connected to server")
             except Exception as e:
                 log(f"[SOCKET ERROR] {e}")
 
     threading.Thread(target=run_socket, daemon=True).start()
 
+def announce_hosted():
+    """Re-create every hosted session with one socket event; the dispatcher acks when done."""
+    if not hosted_devices:
+        return
+    device_ids = sorted(hosted_devices)
+    sio.emit("devices_connect_to_dispatcher", {"deviceIds": device_ids},
+             callback=lambda data: log(f"[SOCKET] Re-announced {data.get('count')} devices"))
+
+def reconnect_loop():
+    """Reconnect after the server drops us, with full-jitter backoff so a dispatcher restart
+    is not hit by every agent at once."""
+    attempt = 0
+    try:
+        while not sio.connected:
+            delay = dispatcherClient.reconnect_delay(attempt)
+            log(f"[SOCKET] Reconnecting in {delay:.1f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+            with socket_thread_lock:
+                try:
+                    if not sio.connected:
+                        RECONNECT_ATTEMPTS.inc()
+                        sio.connect(SOCKET_URL)
+                        RECONNECTS.inc()
+                except Exception as e:
+                    log(f"[SOCKET ERROR] Reconnect failed: {e}")
+            attempt += 1
+    finally:
+        reconnecting.clear()
+
 @sio.event
 def connect():
     log(f"[SOCKET EVENT] Connected to server: {sio.sid}")
+    announce_hosted()
+    # (Re)load the cache so events missed while offline are picked up
+    threading.Thread(target=reload_cache, daemon=True).start()
 
 @sio.event
-def disconnect():
+def disconnect(*reason):
     log(f"[SOCKET EVENT] Disconnected from server")
+    if not reconnecting.is_set():
+        reconnecting.set()
+        threading.Thread(target=reconnect_loop, daemon=True).start()
 
 @sio.on("message_from_device")
 def handle_device_message(data):
     log(f"[DEVICE MESSAGE] {data.get('message')}")
 
-# ---------------- Refresh connected devices and interfaces ----------------
-def refresh_sessions():
-    while True:
-        try:
-            res = requests.get(SESSIONS_URL, timeout=5)
-            if res.ok:
-                sessions = res.json()
-                new_connected_devices = {}
-                new_connected_interfaces = []
-                refresh_sessions.current_interfaces = []  # store for disconnect
-
-                # Fetch devices and interfaces
-                try:
-                    devices_res = requests.get(DEVICES_URL, timeout=5)
-                    interfaces_res = requests.get(INTERFACES_URL, timeout=5)
-                    if devices_res.status_code == 200:
-                        devices_list = devices_res.json()
-                        devices_map = {d['device_id']: d for d in devices_list}
-                    else:
-                        devices_map = {}
-                    if interfaces_res.status_code == 200:
-                        interfaces_list = interfaces_res.json()
-                        interfaces_map = {i['interface_id']: i for i in interfaces_list}
-                    else:
-                        interfaces_map = {}
-                except Exception as e:
-                    log(f"[ERROR] Fetching devices/interfaces failed: {e}")
-                    devices_map = {}
-                    interfaces_map = {}
-
-                for s in sessions:
-                    device_id = s.get('device_id')
-                    interface_id = s.get('interface_id')
-
-                    if not device_id:
-                        continue
-
-                    device = devices_map.get(device_id, {"type": "unknown", "connection_code": "unknown"})
-                    new_connected_devices[device_id] = {
-                        "type": device.get("type", "unknown"),
-                        "connection_code": device.get("connection_code", "unknown")
-                    }
-
-                    if interface_id:
-                        interface = interfaces_map.get(interface_id, {"name": "unknown"})
-                        # Show connection code + interface ID
-                        display_text = f"{device.get('connection_code')} | {interface_id}"
-                        new_connected_interfaces.append(display_text)
-                        # Keep for disconnect reference
-                        refresh_sessions.current_interfaces.append({
-                            "interface_id": interface_id,
-                            "device_connection_code": device.get("connection_code")
-                        })
-
-                # Update UI
-                connected_listbox.delete(0, tk.END)
-                for info in new_connected_devices.values():
-                    connected_listbox.insert(tk.END, f"{info['type']} | {info['connection_code']}")
-
-                connected_interfaces_listbox.delete(0, tk.END)
-                for entry in new_connected_interfaces:
-                    connected_interfaces_listbox.insert(tk.END, entry)
-
-                # Update internal dict
-                connected_devices.clear()
-                connected_devices.update(new_connected_devices)
+# ---------------- Connected devices and interfaces (event-driven) ----------------
+def device_text(row):
+    return f"{row['connection_code']} | {row['type']}"
+
+def refresh_session_row(device_id):
+    session = session_cache.sessions.get(device_id)
+    device = session_cache.devices.get(device_id, {})
+    info = {
+        "type": device.get("type", "unknown"),
+        "connection_code": device.get("connection_code", "unknown")
+    }
+    if session:
+        connected_devices[device_id] = info
+        connected_list.set(device_id, f"{info['type']} | {info['connection_code']}", device)
+    else:
+        connected_devices.pop(device_id, None)
+        connected_list.remove(device_id)
+
+    interface_id = session.get("interface_id") if session else None
+    if interface_id:
+        interfaces_list.set(device_id, f"{info['connection_code']} | {interface_id}", device)
+    else:
+        interfaces_list.remove(device_id)
+
+def apply_cache_change(kind, key, row):
+    if kind == "device":
+        if row:
+            device_list.set(key, device_text(row), row)
+        else:
+            device_list.remove(key)
+    if kind == "session" or (kind == "device" and key in session_cache.sessions):
+        refresh_session_row(key)
+
+def on_cache_change(kind, key, row):
+    # Called on socket/HTTP threads while the cache lock is held: queue the diff, nothing more
+    updates.put(("cache", kind, key, row))
+
+def drain_updates():
+    """Apply queued diffs on the Tk thread within DRAIN_BUDGET, then reschedule."""
+    deadline = time.perf_counter() + DRAIN_BUDGET
+    lines = []
+    try:
+        while time.perf_counter() < deadline:
+            item = updates.get_nowait()
+            if item[0] == "log":
+                lines.append(item[1])
             else:
-                log(f"[ERROR] Could not fetch sessions: {res.status_code}")
+                apply_cache_change(*item[1:])
+    except queue.Empty:
+        pass
+    if lines:
+        write_log("\n".join(lines[-LOG_LINES:]))
+    counts_label.config(text=f"{len(device_list)} devices | {len(connected_list)} connected | "
+                             f"{len(interfaces_list)} interfaces | {updates.qsize()} pending")
+    root.after(DRAIN_INTERVAL_MS, drain_updates)
+
+session_cache = SessionCache(sio, on_change=on_cache_change)
+
+def reload_cache():
+    try:
+        session_cache.load()
+        log(f"[CACHE] Loaded {len(session_cache.sessions)} sessions, {len(session_cache.devices)} devices")
+    except Exception as e:
+        log(f"[ERROR] Failed to load sessions: {e}")
+
+def start_monitor():
+    """Connect the socket so broadcasts reach the cache; the connect handler loads it."""
+    with socket_thread_lock:
+        try:
+            if not sio.connected:
+                sio.connect(SOCKET_URL)
         except Exception as e:
-            log(f"[ERROR] Failed to fetch sessions: {e}")
-        time.sleep(5)
+            log(f"[SOCKET ERROR] {e}")
+            reload_cache()
+    session_cache.start_resync()
 
 # ---------------- Register Device ----------------
 def register():
@@ -187,13 +269,13 @@ def register():
         "is_public": entries['is_public'].get()
     }
     try:
-        response = requests.post(API_URL, json=payload, timeout=5)
+        response = dispatcherClient.post("/api/register_device", json=payload)
         if response.status_code == 200:
             data = response.json()
             entries['connection_code'].delete(0, tk.END)
             entries['connection_code'].insert(0, data['connection_code'])
             log(f"[REGISTERED] Type: {data['type']} | Code: {data['connection_code']}")
-            load_devices()
+            start_load_devices()
         elif response.status_code == 400:
             reason = response.json().get("reason", "Unknown error")
             log(f"[ERROR] {reason}")
@@ -206,49 +288,44 @@ def register():
         messagebox.showerror("Connection Error", str(e))
 
 # ---------------- Connect/Disconnect ----------------
+def start_load_devices():
+    threading.Thread(target=load_devices, daemon=True).start()
+
 def connect():
-    sel = device_listbox.curselection()
-    if not sel:
+    connection_code, device = selected_device()
+    if connection_code is None:
         messagebox.showwarning("Connect", "No device selected!")
         return
-    index = sel[0]
-    device_text = device_listbox.get(index)
-    connection_code = device_text.split('|')[0].strip()
-    device_id = devices_by_code.get(connection_code)
-    if not device_id:
+    if not device:
         messagebox.showerror("Connect", "Device ID not found!")
         return
-    start_socket_thread(device_id)
+    start_socket_thread(device["device_id"])
 
 def disconnect():
-    try:
-        sel_index = connected_listbox.curselection()[0]
-        item = connected_listbox.get(sel_index)
-    except IndexError:
+    dev_id = connected_list.selected_key()
+    info = connected_devices.get(dev_id)
+    if info is None:
         messagebox.showwarning("Disconnect", "No device selected!")
         return
 
-    for dev_id, info in list(connected_devices.items()):
-        if f"{info['type']} | {info['connection_code']}" == item:
-            try:
-                sio.emit("device_disconnect_from_dispatcher", {"deviceId": dev_id})
-                log(f"[SOCKET] Sent disconnect for device {dev_id}")
-            except Exception as e:
-                log(f"[ERROR] Socket disconnect failed: {e}")
+    try:
+        sio.emit("device_disconnect_from_dispatcher", {"deviceId": dev_id})
+        log(f"[SOCKET] Sent disconnect for device {dev_id}")
+    except Exception as e:
+        log(f"[ERROR] Socket disconnect failed: {e}")
 
-            try:
-                res = requests.delete(f"{SOCKET_URL}/api/sessions/{dev_id}", timeout=5)
-                if res.ok:
-                    log(f"[SERVER] Session removed for device {dev_id}")
-                else:
-                    log(f"[SERVER ERROR] Could not remove session: {res.text}")
-            except Exception as e:
-                log(f"[ERROR] Could not remove session via API: {e}")
+    try:
+        res = dispatcherClient.delete(f"/api/sessions/{dev_id}", endpoint="/api/sessions/:id")
+        if res.ok:
+            log(f"[SERVER] Session removed for device {dev_id}")
+        else:
+            log(f"[SERVER ERROR] Could not remove session: {res.text}")
+    except Exception as e:
+        log(f"[ERROR] Could not remove session via API: {e}")
 
-            connected_devices.pop(dev_id)
-            connected_listbox.delete(sel_index)
-            log(f"[CLIENT] Disconnected device {info['type']} ({info['connection_code']})")
-            break
+    hosted_devices.discard(dev_id)
+    session_cache.forget_session(dev_id)
+    log(f"[CLIENT] Disconnected device {info['type']} ({info['connection_code']})")
 
 # ---------------- Left Buttons ----------------
 # ---------------- Left Buttons ----------------
@@ -256,59 +333,95 @@ tk.Button(left_frame, text="Random", command=random_values).grid(row=len(fields)
 tk.Button(left_frame, text="Register", command=register).grid(row=len(fields), column=1, pady=5)
 tk.Button(left_frame, text="Connect", command=connect).grid(row=len(fields)+1, column=0, columnspan=2, pady=5)
 
+# ---------------- Filters ----------------
+# Type is a case-insensitive substring; subnet keeps devices whose subnet overlaps it
+filter_frame = tk.Frame(right_frame)
+filter_frame.pack(fill=tk.X)
+FILTER_DELAY_MS = 250  # re-filter once typing pauses, not on every keystroke
+type_filter = tk.StringVar()
+subnet_filter = tk.StringVar()
+tk.Label(filter_frame, text="Type filter").pack(side=tk.LEFT)
+tk.Entry(filter_frame, textvariable=type_filter, width=15).pack(side=tk.LEFT, padx=5)
+tk.Label(filter_frame, text="Subnet filter").pack(side=tk.LEFT)
+tk.Entry(filter_frame, textvariable=subnet_filter, width=18).pack(side=tk.LEFT, padx=5)
+counts_label = tk.Label(filter_frame, anchor="e")
+counts_label.pack(side=tk.RIGHT)
+
+parse_subnet = functools.lru_cache(maxsize=65536)(parse_cidr)  # fleets repeat a few thousand subnets
+
+def row_filter():
+    """Predicate for the current filter entries, or None when both are empty."""
+    type_text = type_filter.get().strip().lower()
+    subnet_text = subnet_filter.get().strip()
+    if not type_text and not subnet_text:
+        return None
+    cidr = parse_cidr(subnet_text) if subnet_text else None
+
+    def predicate(row):
+        if not row:
+            return False
+        if type_text and type_text not in str(row.get("type", "")).lower():
+            return False
+        if subnet_text:
+            device = parse_subnet(str(row.get("subnet", "")))
+            if cidr is None or device is None:
+                return subnet_text == row.get("subnet")
+            return overlaps(cidr, device)
+        return True
+    return predicate
+
+filter_job = None
+
+def apply_filters():
+    global filter_job
+    filter_job = None
+    predicate = row_filter()
+    for lst in (device_list, connected_list, interfaces_list):
+        lst.set_filter(predicate)
+
+def schedule_filters(*_):
+    global filter_job
+    if filter_job is not None:
+        root.after_cancel(filter_job)
+    filter_job = root.after(FILTER_DELAY_MS, apply_filters)
+
+type_filter.trace_add("write", schedule_filters)
+subnet_filter.trace_add("write", schedule_filters)
+
 # ---------------- Right device & interface list ----------------
+# VirtualLists keyed by device_id; each holds the device row so the filters can read it
 right_top_frame = tk.Frame(right_frame)
 right_top_frame.pack(fill=tk.BOTH, expand=True)
 
 # Registered Devices
 tk.Label(right_top_frame, text="Registered Devices").grid(row=0, column=0, sticky="w")
-device_listbox = tk.Listbox(right_top_frame, width=40)
-device_listbox.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
+device_list = VirtualList(right_top_frame, width=40, on_select=lambda key: fill_from_selection())
+device_list.grid(row=1, column=0, sticky="nsew", padx=5, pady=5)
 tk.Button(right_top_frame, text="Delete Selected Device", command=lambda: delete_selected_device(), width=20).grid(row=2, column=0, pady=5)
 
 # Connected Devices
 tk.Label(right_top_frame, text="Connected Devices").grid(row=0, column=1, sticky="w")
-connected_listbox = tk.Listbox(right_top_frame, width=40, bg="#e0f7fa")
-connected_listbox.grid(row=1, column=1, sticky="nsew", padx=5, pady=5)
+connected_list = VirtualList(right_top_frame, width=40, bg="#e0f7fa")
+connected_list.grid(row=1, column=1, sticky="nsew", padx=5, pady=5)
 tk.Button(right_top_frame, text="Disconnect Selected Device", command=disconnect, width=25).grid(row=2, column=1, pady=5)
 
 # Connected Interfaces
 tk.Label(right_top_frame, text="Connected Interfaces").grid(row=0, column=2, sticky="w")
-connected_interfaces_listbox = tk.Listbox(right_top_frame, width=40, bg="#f0e0ff")
-connected_interfaces_listbox.grid(row=1, column=2, sticky="nsew", padx=5, pady=5)
+interfaces_list = VirtualList(right_top_frame, width=40, bg="#f0e0ff")
+interfaces_list.grid(row=1, column=2, sticky="nsew", padx=5, pady=5)
 
 def disconnect_interface():
-    sel = connected_interfaces_listbox.curselection()
-    if not sel:
+    device_id = interfaces_list.selected_key()
+    session = session_cache.sessions.get(device_id) if device_id else None
+    interface_id = session.get("interface_id") if session else None
+    if not interface_id:
         messagebox.showwarning("Disconnect Interface", "No interface selected!")
         return
-    index = sel[0]
-    entry_text = connected_interfaces_listbox.get(index)
-    
-    # Assuming format "DeviceCode | InterfaceID"
-    try:
-        device_code, interface_id = entry_text.split('|')
-        device_code = device_code.strip()
-        interface_id = interface_id.strip()
-    except ValueError:
-        messagebox.showerror("Error", "Invalid format in interfaces list")
-        return
-
-    # Find the corresponding deviceId from connected_devices (you maintain device_code -> deviceId)
-    deviceId = None
-    for dev_id, info in connected_devices.items():
-        if info['connection_code'] == device_code:
-            deviceId = dev_id
-            break
-
-    if not deviceId:
-        messagebox.showerror("Error", f"Device not found for code {device_code}")
-        return
 
     try:
         sio.emit("interface_disconnect_from_dispatcher", {"interfaceId": interface_id})
         log(f"[SOCKET] Sent disconnect for interface {interface_id}")
-        connected_interfaces_listbox.delete(index)
+        session_cache.unlink_interface(interface_id)
     except Exception as e:
         log(f"[ERROR] Socket disconnect failed: {e}")
         messagebox.showerror("Error", str(e))
@@ -323,64 +436,58 @@ right_top_frame.grid_columnconfigure(1, weight=1)
 right_top_frame.grid_columnconfigure(2, weight=1)
 
 # ---------------- Device Mapping ----------------
-devices_by_code = {}
-
 def load_devices():
-    global devices_by_code
+    """Bring the cache up to date; only rows that changed since the last load are fetched.
+    Runs on a worker thread (start_load_devices): the diffs reach the lists via `updates`."""
     try:
-        res = requests.get(DEVICES_URL, timeout=5)
-        if res.status_code == 200:
-            devices = res.json()
-            device_listbox.delete(0, tk.END)
-            devices_by_code = {}
-            for d in devices:
-                device_listbox.insert(tk.END, f"{d['connection_code']} | {d['type']}")
-                devices_by_code[d['connection_code']] = d['device_id']
-            log(f"[INFO] Loaded {len(devices)} devices")
+        session_cache.load()
+        log(f"[INFO] {len(session_cache.devices)} devices")
     except Exception as e:
         log(f"[ERROR] Could not fetch devices: {e}")
 
-def fill_from_selection(event):
-    sel = device_listbox.curselection()
-    if not sel: return
-    index = sel[0]
-    device_text = device_listbox.get(index)
-    connection_code = device_text.split('|')[0].strip()
+def device_for_code(connection_code):
+    """Device row from the local index, falling back to a single-row lookup."""
+    device = session_cache.by_code.get(connection_code)
+    if device is None:
+        res = dispatcherClient.get(f"/admin/devices/by_code/{connection_code}", endpoint="/admin/devices/by_code/:code")
+        if res.status_code == 200:
+            device = res.json()
+    return device
+
+def selected_device():
+    row = device_list.row(device_list.selected_key())
+    if not row:
+        return None, None
+    connection_code = row["connection_code"]
     try:
-        device_id = devices_by_code.get(connection_code)
-        if device_id:
-            res = requests.get(DEVICES_URL, timeout=5)
-            if res.status_code == 200:
-                devices = res.json()
-                device = next((d for d in devices if d['connection_code']==connection_code), None)
-                if device:
-                    for f in fields:
-                        entries[f].delete(0, tk.END)
-                        entries[f].insert(0, str(device.get(f, "")))
+        return connection_code, device_for_code(connection_code)
     except Exception as e:
-        log(f"[ERROR] Could not fill device: {e}")
+        log(f"[ERROR] Could not look up device {connection_code}: {e}")
+        return connection_code, None
 
-device_listbox.bind("<<ListboxSelect>>", fill_from_selection)
+def fill_from_selection():
+    connection_code, device = selected_device()
+    if device:
+        for f in fields:
+            entries[f].delete(0, tk.END)
+            entries[f].insert(0, str(device.get(f, "")))
 
 # ---------------- Delete selected device ----------------
 def delete_selected_device():
-    sel = device_listbox.curselection()
-    if not sel:
+    connection_code, device = selected_device()
+    if connection_code is None:
         messagebox.showwarning("Delete Device", "No device selected!")
         return
-    index = sel[0]
-    device_text = device_listbox.get(index)
-    connection_code = device_text.split('|')[0].strip()
-    device_id = devices_by_code.get(connection_code)
-    if not device_id:
+    if not device:
         messagebox.showerror("Delete Device", "Device ID not found!")
         return
+    device_id = device["device_id"]
     try:
-        res = requests.delete(f"{DELETE_URL}/{device_id}", timeout=5)
+        res = dispatcherClient.delete(f"/api/delete_device/{device_id}", endpoint="/api/delete_device/:id")
         data = res.json()
         if res.ok:
             messagebox.showinfo("Deleted", f"Device {connection_code} deleted successfully")
-            load_devices()
+            start_load_devices()
             for f in entries:
                 entries[f].delete(0, tk.END)
         else:
@@ -390,9 +497,9 @@ def delete_selected_device():
 
 # ---------------- Initial setup ----------------
 random_values()
-load_devices()
+root.after(DRAIN_INTERVAL_MS, drain_updates)
 
-# Start background thread to poll sessions table
-threading.Thread(target=refresh_sessions, daemon=True).start()
+# Connect the monitoring socket; its connect handler (or start_monitor on failure) loads the cache
+threading.Thread(target=start_monitor, daemon=True).start()
 
 root.mainloop()
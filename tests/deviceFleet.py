@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import itertools
+import time
+
+import aiohttp
+import socketio
+
+import dispatcherClient
+import metrics
+from manifest import read_manifest
+from randomDevice import random_device_payload
+
+# -----------------------------
+# Configuration
+# -----------------------------
+BROKER_URL = dispatcherClient.BROKER_URL
+REGISTER_ATTEMPTS = 5  # retries when the random IP+port is already taken
+
+ACK_SECONDS = metrics.histogram("socket_ack_seconds", "Announce emit to dispatcher ack", ("event",))
+RECONNECT_ATTEMPTS = metrics.counter("socket_reconnect_attempts_total", "Connect attempts made after a drop")
+RECONNECTS = metrics.counter("socket_reconnects_total", "Sockets that reconnected and re-announced")
+DISCONNECTS = metrics.counter("socket_disconnects_total", "Unplanned socket drops")
+
+
+# -----------------------------
+# Dispatcher socket with reconnect
+# -----------------------------
+class ReconnectingSocket:
+    """Socket.IO client that comes back by itself after the dispatcher drops it.
+
+    Reconnects use full-jitter exponential backoff (dispatcherClient.reconnect_delay) and
+    finish with `announce()`, which emits `announce_event` with `announce_data` and so
+    re-creates the session rows over the socket alone. `online_at` is set when the
+    dispatcher acknowledges the announcement.
+    """
+
+    def __init__(self, index, socket_http, broker_url, announce_event, announce_data, reconnect=True):
+        self.index = index
+        self.broker_url = broker_url
+        self.announce_event = announce_event
+        self.announce_data = announce_data
+        self.sio = socketio.AsyncClient(reconnection=False, http_session=socket_http, handle_sigint=False)
+        self.sio.on("disconnect", self._on_disconnect)
+        self.reconnect = reconnect
+        self.reconnect_task = None
+        self.reconnects = 0
+        self.attempts = 0           # connect attempts made by the reconnect loop
+        self.stopping = False
+        self.online_at = None
+        self.disconnected_at = None
+        self.error = None
+
+    async def announce(self):
+        sent = time.perf_counter()
+
+        def on_ack(*args):
+            ack = args[0] if args and isinstance(args[0], dict) else {}
+            if ack.get("success") is False:  # the dispatcher doesn't know this device
+                self.error = f"{self.announce_event} rejected: {ack.get('reason')}"
+                return
+            if ack.get("rejected"):
+                print(f"[FLEET] {type(self).__name__} {self.index}: {len(ack['rejected'])} devices rejected as unknown")
+            self.online_at = time.perf_counter()
+            ACK_SECONDS.observe(self.online_at - sent, event=self.announce_event)
+
+        await self.sio.emit(self.announce_event, self.announce_data, callback=on_ack)
+
+    async def _on_disconnect(self, *reason):
+        self.online_at = None
+        self.disconnected_at = time.perf_counter()
+        if not self.stopping:
+            DISCONNECTS.inc()
+        if self.reconnect and not self.stopping and (self.reconnect_task is None or self.reconnect_task.done()):
+            self.reconnect_task = asyncio.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        for attempt in itertools.count():
+            await asyncio.sleep(dispatcherClient.reconnect_delay(attempt))
+            if self.stopping:
+                return
+            self.attempts += 1
+            RECONNECT_ATTEMPTS.inc()
+            try:
+                if not self.sio.connected:
+                    await self.sio.connect(self.broker_url, transports=["websocket"])
+                await self.announce()
+            except (socketio.exceptions.ConnectionError, aiohttp.ClientError, OSError):
+                continue
+            except Exception as e:
+                # Connected but not announced: the dispatcher has no session for us yet
+                print(f"[FLEET] {type(self).__name__} {self.index} announce after reconnect failed, "
+                      f"retrying: {type(e).__name__}: {e}")
+                continue
+            self.reconnects += 1
+            RECONNECTS.inc()
+            return
+
+    def send_backlog(self):
+        """Packets queued in the engine.io client but not yet written to the socket."""
+        queue = getattr(self.sio.eio, "queue", None)
+        return queue.qsize() if queue is not None else 0
+
+    async def stop(self):
+        self.stopping = True
+        if self.reconnect_task is not None:
+            self.reconnect_task.cancel()
+        if self.sio.connected:
+            await self.sio.disconnect()
+
+
+# -----------------------------
+# Simulated device
+# -----------------------------
+class SimulatedDevice(ReconnectingSocket):
+    """One headless device agent: register, open its own socket, join the dispatcher."""
+
+    def __init__(self, index, http, socket_http, broker_url=BROKER_URL, row=None, payload=None, reconnect=True):
+        # device_connect_to_dispatcher upserts the session itself, so reconnects skip the POST
+        super().__init__(index, socket_http, broker_url, "device_connect_to_dispatcher",
+                         {"deviceId": row["device_id"] if row else None}, reconnect)
+        self.payload = payload  # fixed registration metadata; random when None
+        self.http = http
+        self.connection_code = row["connection_code"] if row else None  # set when reusing a manifest
+        self.timings = {}
+
+    @property
+    def device_id(self):
+        return self.announce_data["deviceId"]
+
+    @device_id.setter
+    def device_id(self, value):
+        self.announce_data["deviceId"] = value
+
+    async def register(self):
+        """POST /api/register_device, retrying on IP+port collisions."""
+        for _ in range(1 if self.payload else REGISTER_ATTEMPTS):
+            payload = self.payload or random_device_payload()
+            async with self.http.post(f"{self.broker_url}/api/register_device", json=payload) as res:
+                if res.status == 200:
+                    data = await res.json()
+                    self.device_id = data["device_id"]
+                    self.connection_code = data["connection_code"]
+                    return
+                if res.status != 400:
+                    raise RuntimeError(f"register_device {res.status}: {await res.text()}")
+        raise RuntimeError("register_device kept colliding on IP+port")
+
+    async def connect(self):
+        """Open the socket, create the session row and announce the device."""
+        await self.sio.connect(self.broker_url, transports=["websocket"])
+        async with self.http.post(f"{self.broker_url}/api/register_device_session",
+                                  json={"deviceId": self.device_id, "socketId": self.sio.sid}) as res:
+            if res.status != 200:
+                raise RuntimeError(f"register_device_session {res.status}: {await res.text()}")
+        await self.announce()
+
+    async def start(self):
+        """Run the full bring-up sequence, recording per-step latency."""
+        try:
+            t0 = time.perf_counter()
+            if self.device_id is None:
+                await self.register()
+            t1 = time.perf_counter()
+            await self.connect()
+            t2 = time.perf_counter()
+            self.timings = {"register": t1 - t0, "connect": t2 - t1, "total": t2 - t0}
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+
+class DeviceGateway(ReconnectingSocket):
+    """One socket carrying many registered devices, announced with a single bulk event."""
+
+    def __init__(self, index, rows, socket_http, broker_url=BROKER_URL, reconnect=True):
+        self.device_ids = [row["device_id"] for row in rows]
+        super().__init__(index, socket_http, broker_url, "devices_connect_to_dispatcher",
+                         {"deviceIds": self.device_ids}, reconnect)
+
+    async def start(self):
+        try:
+            await self.sio.connect(self.broker_url, transports=["websocket"])
+            await self.announce()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+
+# -----------------------------
+# Fleet runner
+# -----------------------------
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run_fleet(count, ramp_rate, concurrency, hold, broker_url=BROKER_URL, rows=None):
+    """Bring up `count` devices at `ramp_rate` per second, hold them, then tear down.
+
+    `rows` (from a manifest) reuses already-registered devices instead of registering new ones.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    socket_connector = aiohttp.TCPConnector(limit=0)  # one long-lived connection per device
+
+    async with dispatcherClient.async_session(limit=concurrency) as http, \
+            aiohttp.ClientSession(connector=socket_connector) as socket_http:
+        rows = rows or []
+        devices = [SimulatedDevice(i, http, socket_http, broker_url, rows[i] if i < len(rows) else None)
+                   for i in range(count)]
+        metrics.gauge("fleet_sockets_connected", "Simulated devices with an open dispatcher socket").set_function(
+            lambda: sum(d.sio.connected for d in devices))
+
+        async def bring_up(device):
+            async with limit:
+                await device.start()
+
+        started = time.perf_counter()
+        tasks = []
+        for device in devices:
+            tasks.append(asyncio.create_task(bring_up(device)))
+            if ramp_rate > 0:
+                await asyncio.sleep(1 / ramp_rate)
+            if device.index and device.index % 100 == 0:
+                online = sum(1 for d in devices if d.timings)
+                print(f"[FLEET] launched {device.index}/{count}, online {online}")
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+        online = [d for d in devices if not d.error]
+        failed = [d for d in devices if d.error]
+        print(f"[FLEET] {len(online)}/{count} devices online in {elapsed:.2f}s ({len(online) / elapsed:.1f}/s)")
+        for step in ("register", "connect", "total"):
+            values = [d.timings[step] for d in online]
+            if values:
+                print(f"[FLEET] {step:<8} p50={percentile(values, 50) * 1000:.1f}ms "
+                      f"p99={percentile(values, 99) * 1000:.1f}ms max={max(values) * 1000:.1f}ms")
+        errors = {}
+        for d in failed:
+            errors[d.error] = errors.get(d.error, 0) + 1
+        for error, n in sorted(errors.items(), key=lambda item: -item[1]):
+            print(f"[FLEET ERROR] x{n} {error}")
+
+        if hold:
+            print(f"[FLEET] holding connections for {hold}s")
+            await asyncio.sleep(hold)
+        await asyncio.gather(*(d.stop() for d in devices), return_exceptions=True)
+        return devices
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless fleet of simulated device agents")
+    parser.add_argument("-n", "--devices", type=int, default=100, help="number of simulated devices")
+    parser.add_argument("--ramp-rate", type=float, default=50, help="devices started per second (0 = all at once)")
+    parser.add_argument("--concurrency", type=int, default=100, help="max devices in bring-up at the same time")
+    parser.add_argument("--hold", type=float, default=0, help="seconds to keep the fleet connected")
+    parser.add_argument("--broker", default=BROKER_URL, help="dispatcher base URL")
+    parser.add_argument("--manifest", help="reuse devices from a randomDevice.py --manifest file instead of registering")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus /metrics on this port")
+    parser.add_argument("--profile", action="store_true", help="allow sampling profiles from /profile?seconds=N")
+    args = parser.parse_args(argv)
+
+    metrics.enable_profiling(args.profile or metrics.PROFILING_ENABLED)
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+
+    rows = [r for r in read_manifest(args.manifest) if r.get("device_id")] if args.manifest else None
+    asyncio.run(run_fleet(args.devices, args.ramp_rate, args.concurrency, args.hold, args.broker, rows))
+
+
+if __name__ == "__main__":
+    main()
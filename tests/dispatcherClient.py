@@ -0,0 +1,173 @@
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+# -----------------------------
+# Configuration
+# -----------------------------
+BROKER_URL = os.environ.get("DISPATCHER_URL", "http://localhost:3000")
+TIMEOUT = 5          # seconds, per request
+POOL_SIZE = 32       # keep-alive connections kept per host
+RETRIES = 3          # connection-level retries only; a sent request is never replayed
+BACKOFF = 0.2        # seconds, doubled per retry
+RECONNECT_BASE = 0.5  # seconds, ceiling of the first socket reconnect delay
+RECONNECT_CAP = 15    # seconds, largest reconnect delay ceiling
+
+_session = None
+_session_lock = threading.Lock()
+_timings = {}  # "METHOD endpoint" -> [count, errors, total_seconds, max_seconds]
+_timings_lock = threading.Lock()
+
+REQUEST_SECONDS = metrics.histogram("dispatcher_request_seconds", "HTTP requests to the dispatcher",
+                                    ("method", "endpoint"))
+REQUEST_ERRORS = metrics.counter("dispatcher_request_errors_total", "Dispatcher requests that failed or returned 5xx",
+                                 ("method", "endpoint"))
+_ID_SEGMENT = re.compile(r"/(?:[0-9a-fA-F]{8}(?:-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12}|[0-9A-Z]{8}|[0-9]+)(?=/|$)")
+
+
+# -----------------------------
+# Pooled session
+# -----------------------------
+def session():
+    """Process-wide keep-alive session shared by every caller and thread."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(total=RETRIES, connect=RETRIES, read=0, status=0, other=0,
+                              backoff_factor=BACKOFF, allowed_methods=None)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, pool_block=False, max_retries=retry)
+                s = requests.Session()
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                _session = s
+    return _session
+
+
+def url(path):
+    return f"{BROKER_URL}{path}"
+
+
+def request(method, path, endpoint=None, **kwargs):
+    """Send a request to the dispatcher and time it under `endpoint` (defaults to `path`).
+
+    Pass `endpoint` for paths that embed IDs, e.g. "/api/delete_device/:id", so the
+    counters stay per-endpoint rather than per-URL.
+    """
+    kwargs.setdefault("timeout", TIMEOUT)
+    key = f"{method} {endpoint or path}"
+    failed = True
+    t0 = time.perf_counter()
+    try:
+        res = session().request(method, url(path), **kwargs)
+        failed = res.status_code >= 500
+        return res
+    finally:
+        elapsed = time.perf_counter() - t0
+        with _timings_lock:
+            entry = _timings.setdefault(key, [0, 0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += failed
+            entry[2] += elapsed
+            entry[3] = max(entry[3], elapsed)
+        _observe(method, endpoint or endpoint_label(path), elapsed, failed)
+
+
+def endpoint_label(path):
+    """Metric label for a request path: query dropped, UUID, connection-code and numeric segments replaced by ":id"."""
+    return _ID_SEGMENT.sub("/:id", path.split("?", 1)[0])
+
+
+def _observe(method, endpoint, elapsed, failed):
+    REQUEST_SECONDS.observe(elapsed, method=method, endpoint=endpoint)
+    if failed:
+        REQUEST_ERRORS.inc(method=method, endpoint=endpoint)
+
+
+def get(path, **kwargs):
+    return request("GET", path, **kwargs)
+
+
+def post(path, **kwargs):
+    return request("POST", path, **kwargs)
+
+
+def delete(path, **kwargs):
+    return request("DELETE", path, **kwargs)
+
+
+def reconnect_delay(attempt):
+    """Full-jitter exponential backoff for socket reconnects: uniform(0, min(cap, base * 2**attempt)).
+
+    Spreading retries over the whole window keeps a restarted dispatcher from being hit
+    by every agent at the same instant.
+    """
+    return random.uniform(0, min(RECONNECT_CAP, RECONNECT_BASE * 2 ** attempt))
+
+
+# -----------------------------
+# Timing counters
+# -----------------------------
+def stats():
+    """Snapshot of the per-endpoint counters."""
+    with _timings_lock:
+        return {
+            key: {
+                "count": count,
+                "errors": errors,
+                "mean_ms": round(total / count * 1000, 3) if count else None,
+                "max_ms": round(peak * 1000, 3),
+            }
+            for key, (count, errors, total, peak) in _timings.items()
+        }
+
+
+def reset_stats():
+    with _timings_lock:
+        _timings.clear()
+
+
+def print_stats():
+    for key, s in sorted(stats().items()):
+        print(f"[HTTP] {key:<40} n={s['count']:<6} err={s['errors']:<4} mean={s['mean_ms']}ms max={s['max_ms']}ms")
+
+
+# -----------------------------
+# asyncio equivalent
+# -----------------------------
+def async_session(limit=100, timeout=30):
+    """aiohttp session with the same keep-alive policy, for the asyncio tools."""
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=limit, keepalive_timeout=60, ttl_dns_cache=300)
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout),
+                                 trace_configs=[_trace_config()])
+
+
+def _trace_config():
+    """Feed aiohttp request timings into the same dispatcher_request_* metrics."""
+    import aiohttp
+
+    async def on_start(session, ctx, params):
+        ctx.t0 = time.perf_counter()
+
+    async def on_end(session, ctx, params):
+        _observe(params.method, endpoint_label(params.url.path), time.perf_counter() - ctx.t0,
+                 params.response.status >= 500)
+
+    async def on_exception(session, ctx, params):
+        _observe(params.method, endpoint_label(params.url.path), time.perf_counter() - ctx.t0, True)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+    trace.on_request_exception.append(on_exception)
+    return trace
@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import string
+import time
+
+import dispatcherClient
+from randomDevice import random_device_payload
+from randomInterface import generate_random_name_email
+
+# -----------------------------
+# Configuration
+# -----------------------------
+BROKER_URL = dispatcherClient.BROKER_URL
+DEFAULT_MIX = "register_device=4,register_interface=2,register_device_session=2,admin_devices=1,admin_interfaces=1,admin_sessions=1"
+SCENARIOS = ("register_device", "register_interface", "register_device_session",
+             "admin_devices", "admin_interfaces", "admin_sessions",
+             "admin_devices_delta", "admin_sessions_delta")
+BUCKET_GROWTH = 1.02  # histogram resolution: ~2% relative error
+SEED_DEVICES = 10     # registered before the timed phase when interface/session calls have no targets
+
+
+# -----------------------------
+# Latency histogram
+# -----------------------------
+class LatencyHistogram:
+    """Log-bucketed latency histogram; constant memory regardless of sample count."""
+
+    def __init__(self):
+        self.buckets = {}  # bucket index -> count
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = int(math.log(max(seconds * 1e6, 1.0)) / math.log(BUCKET_GROWTH))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th sample, in seconds."""
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * pct / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(BUCKET_GROWTH ** (index + 1) / 1e6, self.max)
+        return self.max
+
+    def coarse(self):
+        """Counts per power-of-two millisecond bucket, keyed by upper bound ("<=1ms", "<=2ms", ...)."""
+        out = {}
+        for index, n in sorted(self.buckets.items()):
+            ms = BUCKET_GROWTH ** (index + 1) / 1e3
+            upper = 2 ** max(0, math.ceil(math.log2(ms))) if ms > 0 else 1
+            key = f"<={upper}ms"
+            out[key] = out.get(key, 0) + n
+        return out
+
+    def to_dict(self):
+        ms = lambda s: None if s is None else round(s * 1000, 3)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.percentile(50)),
+            "p90_ms": ms(self.percentile(90)),
+            "p99_ms": ms(self.percentile(99)),
+            "max_ms": ms(self.max) if self.count else None,
+            "histogram": self.coarse(),
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.errors = {}  # "HTTP 400" / exception name -> count
+        self.dropped = 0  # open-loop requests never sent because --max-inflight was reached
+        self.bytes = 0
+
+    def error(self, key):
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    def to_dict(self, elapsed):
+        ok = self.latency.count - sum(self.errors.values())
+        return {
+            "requests": self.latency.count,
+            "ok": ok,
+            "dropped": self.dropped,
+            "throughput_rps": round(self.latency.count / elapsed, 2) if elapsed else None,
+            "bytes_received": self.bytes,
+            "errors": self.errors,
+            "latency": self.latency.to_dict(),
+        }
+
+
+# -----------------------------
+# Scenarios
+# -----------------------------
+class LoadTest:
+    """Drives the dispatcher's registration, session and admin endpoints."""
+
+    def __init__(self, http, broker_url, mix):
+        self.http = http
+        self.broker_url = broker_url
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.stats = {name: EndpointStats() for name in self.names}
+        self.devices = []  # (device_id, connection_code) registered or fetched during the run
+        self.versions = {}  # admin path -> version token for the *_delta scenarios
+
+    async def seed(self):
+        """Load existing devices so interface/session calls have targets from the start.
+
+        On an empty dispatcher a few devices are registered here, outside the timed phase,
+        so those scenarios never fall back to a register_device call of their own.
+        """
+        async with self.http.get(f"{self.broker_url}/admin/devices") as res:
+            if res.status == 200:
+                self.devices = [(d["device_id"], d["connection_code"]) for d in await res.json()]
+        if self.devices or not {"register_interface", "register_device_session"} & set(self.names):
+            return
+        for _ in range(SEED_DEVICES):
+            await self.register_device()
+        if not self.devices:
+            raise SystemExit("[LOAD] no devices to target and registering seed devices failed")
+
+    async def _post(self, path, payload):
+        async with self.http.post(f"{self.broker_url}{path}", json=payload) as res:
+            body = await res.read()
+            return res.status, body
+
+    async def _get(self, path):
+        async with self.http.get(f"{self.broker_url}{path}") as res:
+            body = await res.read()
+            return res.status, body
+
+    async def register_device(self):
+        status, body = await self._post("/api/register_device", random_device_payload())
+        if status == 200:
+            data = json.loads(body)
+            self.devices.append((data["device_id"], data["connection_code"]))
+        return status, body
+
+    async def register_interface(self):
+        name, email = generate_random_name_email()
+        _, code = random.choice(self.devices)
+        return await self._post("/api/register_interface", {"name": name, "email": email, "deviceCode": code})
+
+    async def register_device_session(self):
+        device_id, _ = random.choice(self.devices)
+        socket_id = ''.join(random.choices(string.ascii_letters + string.digits, k=20))
+        return await self._post("/api/register_device_session", {"deviceId": device_id, "socketId": socket_id})
+
+    async def admin_devices(self):
+        return await self._get("/admin/devices")
+
+    async def admin_interfaces(self):
+        return await self._get("/admin/interfaces")
+
+    async def admin_sessions(self):
+        return await self._get("/admin/sessions")
+
+    async def _get_delta(self, path):
+        """A client refresh: changes since the last version seen (first call reads one page for it)."""
+        version = self.versions.get(path)
+        if version is None:
+            status, body = await self._get(f"{path}?limit=1")
+        else:
+            async with self.http.get(f"{self.broker_url}{path}", params={"since": version},
+                                     headers={"If-None-Match": f'W/"{version}"'}) as res:
+                status, body = res.status, await res.read()
+            if status == 304:
+                return 200, body
+            if status == 410:
+                self.versions.pop(path, None)
+        if status == 200:
+            self.versions[path] = json.loads(body)["version"]
+        return status, body
+
+    async def admin_devices_delta(self):
+        return await self._get_delta("/admin/devices")
+
+    async def admin_sessions_delta(self):
+        return await self._get_delta("/admin/sessions")
+
+    async def run_one(self, name, started=None):
+        """Run one request; in rate mode latency counts from the scheduled start time."""
+        stats = self.stats[name]
+        t0 = started if started is not None else time.perf_counter()
+        try:
+            status, body = await getattr(self, name)()
+            stats.bytes += len(body)
+            if status >= 400:
+                stats.error(f"HTTP {status}")
+        except Exception as e:
+            stats.error(type(e).__name__)
+        stats.latency.record(time.perf_counter() - t0)
+
+    def pick(self):
+        return random.choices(self.names, self.weights)[0]
+
+    async def run_concurrency(self, concurrency, deadline):
+        """Closed loop: `concurrency` workers, each issuing back-to-back requests."""
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.run_one(self.pick())
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def run_rate(self, rate, deadline, max_inflight):
+        """Open loop: start requests on a fixed schedule, independent of response times."""
+        inflight = set()
+        start = time.perf_counter()
+        i = 0
+        while True:
+            scheduled = start + i / rate
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            i += 1
+            name = self.pick()
+            if len(inflight) >= max_inflight:
+                self.stats[name].dropped += 1  # not sent, so no latency to record
+                continue
+            task = asyncio.create_task(self.run_one(name, scheduled))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+        if inflight:
+            await asyncio.gather(*inflight)
+
+    def report(self, elapsed, config):
+        endpoints = {name: s.to_dict(elapsed) for name, s in self.stats.items() if s.latency.count or s.dropped}
+        total = LatencyHistogram()
+        errors = {}
+        for s in self.stats.values():
+            for index, n in s.latency.buckets.items():
+                total.buckets[index] = total.buckets.get(index, 0) + n
+            total.count += s.latency.count
+            total.total += s.latency.total
+            total.max = max(total.max, s.latency.max)
+            for key, n in s.errors.items():
+                errors[key] = errors.get(key, 0) + n
+        return {
+            "config": config,
+            "elapsed_s": round(elapsed, 3),
+            "total": {
+                "requests": total.count,
+                "throughput_rps": round(total.count / elapsed, 2) if elapsed else None,
+                "errors": errors,
+                "dropped": sum(s.dropped for s in self.stats.values()),
+                "latency": total.to_dict(),
+            },
+            "endpoints": endpoints,
+        }
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    async with dispatcherClient.async_session(limit=args.connections, timeout=args.timeout) as http:
+        test = LoadTest(http, args.broker, mix)
+        await test.seed()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        if args.rate:
+            await test.run_rate(args.rate, deadline, args.max_inflight)
+        else:
+            await test.run_concurrency(args.concurrency, deadline)
+        elapsed = time.perf_counter() - started
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    config["mix"] = mix
+    return test.report(elapsed, config)
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the dispatcher registration/session/admin APIs")
+    parser.add_argument("--broker", default=BROKER_URL, help="dispatcher base URL")
+    parser.add_argument("--duration", type=float, default=30, help="test length in seconds")
+    parser.add_argument("--rate", type=float, default=0, help="target requests/s (open loop); 0 = use --concurrency")
+    parser.add_argument("--concurrency", type=int, default=10, help="closed-loop workers when --rate is 0")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="open-loop cap on outstanding requests")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size")
+    parser.add_argument("--timeout", type=float, default=10, help="per-request timeout in seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted scenarios, e.g. register_device=3,admin_sessions=1")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# -----------------------------
+# Fleet manifest
+# -----------------------------
+# One row per provisioned device or interface, so benchmark runs can reuse a fleet
+# without registering it again. ".csv" paths are written as CSV, anything else as JSONL.
+FIELDS = ["device_id", "connection_code", "type", "subnet", "is_public", "interface_id", "email"]
+
+
+class ManifestWriter:
+    """Streams rows to disk as they are produced; flushes after every row."""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.csv = path.endswith(".csv")
+        exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, "a" if append else "w", newline="")
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS, extrasaction="ignore")
+            if not exists:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.csv:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps({k: row[k] for k in FIELDS if row.get(k) is not None}, separators=(",", ":")) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_manifest(path):
+    """Load a manifest written by ManifestWriter; empty CSV cells come back as missing keys."""
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            return [{k: v for k, v in row.items() if v} for row in csv.DictReader(f)]
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# -----------------------------
+# Batch provisioning
+# -----------------------------
+def bounded_map(fn, items, parallel):
+    """Run fn over items on `parallel` threads, yielding results as they finish.
+
+    At most 2 * parallel calls are queued at once, so very large batches use constant memory.
+    """
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        pending = set()
+        for item in items:
+            pending.add(pool.submit(fn, item))
+            if len(pending) >= parallel * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def provision(register, items, count, noun, parallel=16, manifest_path=None, retried="collisions"):
+    """Call `register(item)` for each of `count` items with bounded parallelism, streaming rows to a manifest.
+
+    `register` returns (row or None, retries, error or None); an exception it raises is
+    counted as a failure under its type name.
+    """
+    def guarded(item):
+        try:
+            return register(item)
+        except Exception as e:
+            return None, 0, type(e).__name__
+
+    writer = ManifestWriter(manifest_path) if manifest_path else None
+    summary = {"registered": 0, f"{retried}_retried": 0, "failed": {}}
+    started = time.perf_counter()
+    try:
+        for done, (row, retries, error) in enumerate(bounded_map(guarded, items, parallel), 1):
+            summary[f"{retried}_retried"] += retries
+            if error:
+                summary["failed"][error] = summary["failed"].get(error, 0) + 1
+            else:
+                summary["registered"] += 1
+                if writer:
+                    writer.write(row)
+            if done % 500 == 0:
+                print(f"[BATCH] {done}/{count} ({done / (time.perf_counter() - started):.0f}/s)")
+    finally:
+        if writer:
+            writer.close()
+    elapsed = time.perf_counter() - started
+    print(f"[BATCH] Registered {summary['registered']}/{count} {noun} in {elapsed:.1f}s, "
+          f"{summary[f'{retried}_retried']} {retried} retried, failures: {summary['failed'] or 'none'}")
+    return summary
@@ -0,0 +1,294 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# -----------------------------
+# Configuration
+# -----------------------------
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_INTERVAL = 0.005          # s between stack samples
+PROFILE_MAX_SECONDS = 60
+PROFILING_ENABLED = os.environ.get("METRICS_PROFILE") == "1"  # or enable_profiling() / --profile
+
+
+# -----------------------------
+# Metric types
+# -----------------------------
+# Prometheus text exposition without the client library: the agents and simulators only
+# need counters, gauges and fixed-bucket histograms, and every tool in tests/ can then
+# serve /metrics with nothing extra installed.
+
+def _labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self.values = {}            # label values tuple -> value
+        self.lock = threading.Lock()
+        self.function = None        # scrape-time callback, see set_function
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def set_function(self, function):
+        """`function()` returns a number, or a {label values tuple: number} dict for labelled metrics."""
+        self.function = function
+        return self
+
+    def samples(self):
+        if self.function is None:
+            with self.lock:
+                return [(self.name, key, (), value) for key, value in self.values.items()]
+        try:
+            value = self.function()
+        except Exception:
+            return []
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        return [(self.name, key if isinstance(key, tuple) else (key,), (), v) for key, v in items]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{_labels_text(self.labelnames, key, extra)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Incremented directly, or read at scrape time from a total kept elsewhere (set_function)."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Set directly, or give it a callback that is read at scrape time (queue depths, sizes)."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            counts = entry[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def samples(self):
+        out = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    out.append((f"{self.name}_bucket", key, (("le", _number(bound)),), cumulative))
+                out.append((f"{self.name}_sum", key, (), total))
+                out.append((f"{self.name}_count", key, (), count))
+        return out
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        """Return the metric registered under `name`, creating it on first use."""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name, help, labels=()):
+    return REGISTRY._get(Counter, name, help, labels)
+
+
+def gauge(name, help, labels=()):
+    return REGISTRY._get(Gauge, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY._get(Histogram, name, help, labels, buckets=buckets)
+
+
+def render():
+    return REGISTRY.render()
+
+
+# -----------------------------
+# Sampling profiler
+# -----------------------------
+_profile_lock = threading.Lock()
+
+
+def enable_profiling(enabled=True):
+    global PROFILING_ENABLED
+    PROFILING_ENABLED = enabled
+
+
+def profile_seconds(text, default=10):
+    """?seconds= for /profile: a positive number, capped at PROFILE_MAX_SECONDS; ValueError otherwise."""
+    try:
+        seconds = float(default if text is None else text)
+    except ValueError:
+        seconds = float("nan")
+    if not 0 < seconds < float("inf"):
+        raise ValueError(f"seconds must be a positive number, got {text!r}")
+    return min(seconds, PROFILE_MAX_SECONDS)
+
+
+def profile(seconds, interval=PROFILE_INTERVAL):
+    """Sample every thread's stack for `seconds`; returns collapsed stacks ("a;b;c count"),
+    hottest first, ready for flamegraph.pl / speedscope.
+
+    Opt-in (METRICS_PROFILE=1 or enable_profiling()) and one capture at a time. Sampling
+    costs a few microseconds per thread per interval and nothing when not running.
+    """
+    if not PROFILING_ENABLED:
+        raise PermissionError("Profiling is disabled; start with --profile or METRICS_PROFILE=1")
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = _Tally()
+        deadline = time.perf_counter() + min(seconds, PROFILE_MAX_SECONDS)
+        while time.perf_counter() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:  # threads started during the capture
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                parts.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(parts))] += 1
+            time.sleep(interval)
+        return "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()) + "\n"
+    finally:
+        _profile_lock.release()
+
+
+# -----------------------------
+# Standalone HTTP endpoint
+# -----------------------------
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            self._reply(200, render(), CONTENT_TYPE)
+        elif url.path == "/profile":
+            try:
+                seconds = profile_seconds(parse_qs(url.query).get("seconds", [None])[0])
+            except ValueError as e:
+                return self._reply(400, f"{e}\n", "text/plain; charset=utf-8")
+            try:
+                self._reply(200, profile(seconds), "text/plain; charset=utf-8")
+            except PermissionError as e:
+                self._reply(403, f"{e}\n", "text/plain; charset=utf-8")
+            except RuntimeError as e:
+                self._reply(409, f"{e}\n", "text/plain; charset=utf-8")
+        else:
+            self._reply(404, "Not found\n", "text/plain; charset=utf-8")
+
+    def _reply(self, status, body, content_type):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="0.0.0.0"):
+    """Serve /metrics (and /profile when enabled) from a daemon thread, for tools without a web server."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[METRICS] Serving http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,757 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import math
+import os
+import socket
+import time
+
+import numpy as np
+from aiohttp import web
+from PIL import Image
+
+import dispatcherClient
+import metrics
+import resultCodec
+from cameraStream import StreamClient
+from captureRing import RING_FRAMES, TimeLapse
+from deviceFleet import SimulatedDevice
+from motorQueue import MotorCommand, MotorQueue
+from phaseDifference import PhaseReconstructor, carrier_peaks, filter_mask, parse_params
+from phaseMap import PhaseMap, PhaseMapCache, params_key, png_base64
+
+# -----------------------------
+# Configuration
+# -----------------------------
+AGENT_PORT = 8000                 # the microscope UI talks to http://<device>:8000
+FRAME_WIDTH = 640
+FRAME_HEIGHT = 480
+FPS = 15
+JPEG_QUALITY = 80
+DEFAULT_EXPOSURE = 1000.0         # µs; frames are scaled by exposure / DEFAULT_EXPOSURE
+CARRIER = (0.19, 0.13)            # off-axis fringe frequency, cycles/pixel (x, y)
+STEP_RATE = 2000                  # simulated motor speed, steps/s
+MOTOR_OVERHEAD = 0.005            # s of driver/serial overhead per move
+FOCUS_SCALE = 400.0               # Z steps over which fringe contrast halves
+PLOT_3D_MAX = 200                 # default max samples per side returned by /compute_3d (?lod=)
+
+HTTP_SECONDS = metrics.histogram("agent_http_request_seconds", "Agent HTTP handler time", ("method", "route", "status"))
+ENCODE_SECONDS = metrics.histogram("frame_encode_seconds", "JPEG encode time per frame", ("stream",))
+WRITE_SECONDS = metrics.histogram("stream_write_seconds", "Adaptive feed frame write time", ("level",))
+EMIT_SECONDS = metrics.histogram("socket_emit_seconds", "Socket.IO emit time", ("event",))
+
+
+# -----------------------------
+# Synthetic hologram source
+# -----------------------------
+class HologramSource:
+    """Off-axis hologram of drifting phase "cells": I = |R + O|^2 with a tilted plane reference."""
+
+    def __init__(self, width=FRAME_WIDTH, height=FRAME_HEIGHT, cells=12, seed=0):
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(seed)
+        self.x = np.arange(width, dtype=np.float32)
+        self.y = np.arange(height, dtype=np.float32)
+        self.carrier = (2 * np.pi * (CARRIER[0] * self.x[None, :] + CARRIER[1] * self.y[:, None])).astype(np.float32)
+        self.cells = [
+            (rng.uniform(0, width), rng.uniform(0, height), rng.uniform(12, 40), rng.uniform(1.0, 4.0),
+             rng.uniform(-8, 8), rng.uniform(-8, 8))
+            for _ in range(cells)
+        ]  # (cx, cy, radius px, peak phase rad, vx px/s, vy px/s)
+        self.rng = rng
+
+    def object_phase(self, t, offset_x=0.0, offset_y=0.0):
+        """Sum of Gaussian phase bumps; separable, so each costs one outer product."""
+        phase = np.zeros((self.height, self.width), dtype=np.float32)
+        for cx, cy, r, peak, vx, vy in self.cells:
+            px = (cx + vx * t - offset_x) % self.width
+            py = (cy + vy * t - offset_y) % self.height
+            gx = np.exp(-((self.x - px) / r) ** 2)
+            gy = np.exp(-((self.y - py) / r) ** 2)
+            phase += peak * np.outer(gy, gx)
+        return phase
+
+    def frame(self, t, offset_x=0.0, offset_y=0.0, focus=0.0, exposure=DEFAULT_EXPOSURE, with_object=True):
+        """One 8-bit hologram; with_object=False gives the empty-field reference."""
+        contrast = 1.0 / (1.0 + (focus / FOCUS_SCALE) ** 2)
+        phase = self.carrier + self.object_phase(t, offset_x, offset_y) if with_object else self.carrier
+        intensity = 0.5 * (1.0 + contrast * np.cos(phase)) * (exposure / DEFAULT_EXPOSURE) * 200.0
+        intensity += self.rng.normal(0.0, 2.0, intensity.shape).astype(np.float32)
+        return np.clip(intensity, 0, 255).astype(np.uint8)
+
+
+# -----------------------------
+# Image helpers
+# -----------------------------
+def encode_jpeg(frame, quality=JPEG_QUALITY):
+    buf = io.BytesIO()
+    Image.fromarray(frame).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def parse_points(data):
+    """(x1, y1, x2, y2) as floats from a JSON body; ValueError if any is missing or not a finite number."""
+    try:
+        points = [float(data[k]) for k in ("x1", "y1", "x2", "y2")]
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"x1, y1, x2 and y2 must be numbers ({type(e).__name__}: {e})") from None
+    if not all(map(math.isfinite, points)):
+        raise ValueError("x1, y1, x2 and y2 must be finite")
+    return points
+
+
+def decode_image(data):
+    return np.asarray(Image.open(io.BytesIO(data)).convert("L"), dtype=np.float32)
+
+
+# -----------------------------
+# Device agent
+# -----------------------------
+class MicroscopeAgent:
+    """Stand-in for the microscope's port-8000 agent: camera, motors and reconstruction."""
+
+    def __init__(self, width=FRAME_WIDTH, height=FRAME_HEIGHT, fps=FPS, step_rate=STEP_RATE,
+                 ring_frames=RING_FRAMES, timelapse_dir=None):
+        self.source = HologramSource(width, height)
+        self.fps = fps
+        self.step_rate = step_rate
+        self.exposure = DEFAULT_EXPOSURE
+        self.started = time.monotonic()
+        self.camera_task = None
+        self.frame = None           # latest raw frame (uint8)
+        self.jpeg = None            # latest encoded frame
+        self.frame_seq = 0
+        self.frame_time = 0.0       # wall-clock capture time of the latest frame
+        self.encode_ms = None       # camera loop's full-quality JPEG encode
+        self.new_frame = asyncio.Event()
+        self.stream_clients = {}    # id -> StreamClient for ?mode=adaptive feeds
+        self.relay_task = None      # pushes frames through the dispatcher while an interface is linked
+        self.relay_stats = {"sent": 0, "skipped": 0, "bytes": 0}
+        self.captured = {"object": None, "reference": None}
+        self.capture_seq = {"object": 0, "reference": 0}  # identifies the captured reference for the cache
+        self.reconstructor = PhaseReconstructor()
+        self.motor_position = {1: 0, 2: 0, 3: 0}
+        self.motor_locks = {1: asyncio.Lock(), 2: asyncio.Lock(), 3: asyncio.Lock()}
+        self.motor_overhead = MOTOR_OVERHEAD
+        self.motor_queue = MotorQueue(self)
+        self.phase_maps = PhaseMapCache()
+        self.current = None         # PhaseMap behind /select_roi, /compute_1d and /compute_3d
+        self.ring_frames = ring_frames
+        self.timelapse_dir = timelapse_dir
+        self.timelapse = None       # current or last TimeLapse; the camera loop feeds it while it runs
+        self.timelapse_task = None
+        self._register_gauges()
+
+    def _register_gauges(self):
+        """Queue depths, sizes and totals kept elsewhere, read when /metrics is scraped."""
+        metrics.gauge("motor_queue_depth", "Commands waiting per motor", ("motor",)).set_function(
+            lambda: {(str(m),): len(q) for m, q in self.motor_queue.pending.items()})
+        metrics.gauge("stream_clients", "Open adaptive camera feeds").set_function(lambda: len(self.stream_clients))
+        metrics.gauge("stream_client_level", "Quality level per adaptive feed", ("client",)).set_function(
+            lambda: {(str(c.id),): c.level for c in self.stream_clients.values()})
+        metrics.counter("relay_frames_total", "Frames relayed through the dispatcher", ("outcome",)).set_function(
+            lambda: {("sent",): self.relay_stats["sent"], ("skipped",): self.relay_stats["skipped"]})
+        metrics.counter("relay_bytes_total", "Bytes relayed through the dispatcher").set_function(
+            lambda: self.relay_stats["bytes"])
+        metrics.counter("phase_map_cache_lookups_total", "Phase map cache lookups", ("outcome",)).set_function(
+            lambda: {("hit",): self.phase_maps.hits, ("miss",): self.phase_maps.misses})
+        metrics.gauge("timelapse_frames", "Frames of the current time-lapse", ("state",)).set_function(
+            lambda: {} if self.timelapse is None else {
+                ("captured",): self.timelapse.captured, ("processed",): self.timelapse.done,
+                ("dropped",): self.timelapse.dropped})
+
+    # ---- camera ----
+    def render(self, with_object=True):
+        return self.source.frame(time.monotonic() - self.started,
+                                 offset_x=self.motor_position[2], offset_y=self.motor_position[1],
+                                 focus=self.motor_position[3], exposure=self.exposure, with_object=with_object)
+
+    async def camera_loop(self):
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.fps
+        next_tick = time.monotonic()
+        while True:
+            frame = await loop.run_in_executor(None, self.render)  # ~20 ms at 640x480, ~300 ms at 2048x2048
+            if self.timelapse is not None:
+                self.timelapse.push(frame)  # a copy into the ring; processing happens in the workers
+            t0 = time.perf_counter()
+            self.jpeg = await loop.run_in_executor(None, encode_jpeg, frame)
+            self.encode_ms = (time.perf_counter() - t0) * 1000
+            ENCODE_SECONDS.observe(self.encode_ms / 1000, stream="camera")
+            self.frame = frame
+            self.frame_seq += 1
+            self.frame_time = time.time()
+            self.new_frame.set()
+            self.new_frame = asyncio.Event()
+            next_tick += interval
+            await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+
+    async def start_camera(self, request):
+        if self.camera_task is None or self.camera_task.done():
+            self.camera_task = asyncio.create_task(self.camera_loop())
+        return web.json_response({"success": True, "width": self.source.width, "height": self.source.height, "fps": self.fps})
+
+    async def stop_camera(self, request):
+        if self.camera_task is not None:
+            self.camera_task.cancel()
+            self.camera_task = None
+        return web.json_response({"success": True})
+
+    async def camera_feed(self, request):
+        """MJPEG push stream; each part carries X-Frame-Seq and X-Frame-Timestamp for latency probes.
+
+        ?mode=adaptive paces, drops and degrades frames per client (see cameraStream.py);
+        the default mode pushes every frame at full quality.
+        """
+        if self.camera_task is None:
+            return web.json_response({"error": "Camera not started"}, status=409)
+        response = web.StreamResponse(headers={"Content-Type": "multipart/x-mixed-replace; boundary=frame",
+                                               "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        try:
+            if request.query.get("mode") == "adaptive":
+                await self.adaptive_feed(request, response)
+            else:
+                while self.camera_task is not None:
+                    await self.new_frame.wait()
+                    jpeg = self.jpeg
+                    await response.write(
+                        b"--frame\r\nContent-Type: image/jpeg\r\n"
+                        + f"Content-Length: {len(jpeg)}\r\nX-Frame-Seq: {self.frame_seq}\r\n"
+                          f"X-Frame-Timestamp: {self.frame_time:.6f}\r\n\r\n".encode()
+                        + jpeg + b"\r\n")
+        except ConnectionResetError:
+            pass
+        return response
+
+    async def adaptive_feed(self, request, response):
+        """Always send the newest frame, no faster than the client drains them."""
+        loop = asyncio.get_running_loop()
+        client = StreamClient(request.remote, self.fps)
+        client.limit_send_buffer(request.transport)
+        self.stream_clients[client.id] = client
+        try:
+            while self.camera_task is not None:
+                delay = client.next_send_time() - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if self.frame_seq == client.last_seq:
+                    await self.new_frame.wait()
+                seq, frame, shared, frame_time = self.frame_seq, self.frame, self.jpeg, self.frame_time
+                if client.level:
+                    t0 = time.perf_counter()
+                    jpeg = await loop.run_in_executor(None, client.encode, frame, shared)
+                    ENCODE_SECONDS.observe(time.perf_counter() - t0, stream="adaptive")
+                else:
+                    jpeg = client.encode(frame, shared)
+                t0 = time.perf_counter()
+                await response.write(
+                    b"--frame\r\nContent-Type: image/jpeg\r\n"
+                    + f"Content-Length: {len(jpeg)}\r\nX-Frame-Seq: {seq}\r\n"
+                      f"X-Frame-Timestamp: {frame_time:.6f}\r\nX-Stream-Level: {client.level}\r\n\r\n".encode()
+                    + jpeg + b"\r\n")
+                client.on_sent(seq, len(jpeg), time.perf_counter() - t0, frame_time)
+                WRITE_SECONDS.observe(time.perf_counter() - t0, level=client.level)
+        finally:
+            del self.stream_clients[client.id]
+
+    async def camera_stats(self, request):
+        """Per-client fps, encode time and frame age for the adaptive feeds."""
+        return web.json_response({
+            "running": self.camera_task is not None,
+            "source_fps": self.fps,
+            "frame_seq": self.frame_seq,
+            "camera_encode_ms": round(self.encode_ms, 2) if self.encode_ms is not None else None,
+            "clients": [c.stats() for c in self.stream_clients.values()],
+            "relay": dict(self.relay_stats, active=self.relay_task is not None and not self.relay_task.done()),
+        })
+
+    # ---- dispatcher relay ----
+    def attach_relay(self, device):
+        """Follow relay_start/relay_stop from the dispatcher for this device's session."""
+        @device.sio.on("relay_start")
+        async def relay_start(data):
+            if self.relay_task is None or self.relay_task.done():
+                self.relay_task = asyncio.create_task(self.relay_loop(device))
+                print(f"[AGENT] Relaying frames to interface {data.get('interfaceId')}")
+
+        @device.sio.on("relay_stop")
+        async def relay_stop(data):
+            if self.relay_task is not None:
+                self.relay_task.cancel()
+                self.relay_task = None
+                print("[AGENT] Frame relay stopped")
+
+    async def relay_loop(self, device):
+        """Emit the newest encoded frame as binary "device_frame"; skip frames while the socket is backed up."""
+        last_seq = 0
+        while device.sio.connected:
+            if self.frame_seq == last_seq:
+                await self.new_frame.wait()
+            seq, jpeg, frame_time = self.frame_seq, self.jpeg, self.frame_time
+            if device.send_backlog() > 1:
+                self.relay_stats["skipped"] += 1
+                await asyncio.sleep(1.0 / self.fps)
+                continue
+            meta = {"deviceId": device.device_id, "seq": seq, "ts": frame_time}
+            with EMIT_SECONDS.time(event="device_frame"):
+                await device.sio.emit("device_frame", (meta, jpeg))
+            last_seq = seq
+            self.relay_stats["sent"] += 1
+            self.relay_stats["bytes"] += len(jpeg)
+
+    async def set_exposure(self, request):
+        data = await request.json()
+        exposure = float(data.get("exposure", 0))
+        if exposure <= 0:
+            return web.json_response({"success": False, "error": "Exposure must be positive"})
+        self.exposure = exposure
+        return web.json_response({"success": True, "exposure": exposure})
+
+    async def capture_image(self, request):
+        data = await request.json()
+        kind = data.get("type", "object")
+        if kind not in self.captured:
+            return web.json_response({"error": f"Unknown capture type {kind}"}, status=400)
+        # The reference is an empty-field hologram: the simulated sample is moved out of view
+        frame = await asyncio.get_running_loop().run_in_executor(None, self.render, kind == "object")
+        self.captured[kind] = frame.astype(np.float32)
+        self.capture_seq[kind] += 1
+        return web.json_response({"success_ref": True} if kind == "reference" else {"success_img": True})
+
+    # ---- time-lapse ----
+    async def timelapse_start(self, request):
+        """Capture `frames` frames at camera rate and reconstruct them against the captured reference.
+
+        Body: {"frames", "batch", "workers", "ring_frames"} plus the /run_phase_difference
+        parameters. Results go to a memory-mapped stack paged with /timelapse/frame.
+        """
+        if self.timelapse_task is not None and not self.timelapse_task.done():
+            return web.json_response({"error": "A time-lapse is already running"}, status=409)
+        if self.captured["reference"] is None:
+            return web.json_response({"error": "Capture a reference first"}, status=409)
+        data = await request.json()
+        try:
+            frames = int(data.get("frames", 100))
+            batch = int(data.get("batch", 4))
+            workers = int(data["workers"]) if data.get("workers") else None
+            ring_frames = int(data.get("ring_frames", self.ring_frames))
+            params = parse_params(data)
+        except (TypeError, ValueError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        if frames < 1 or ring_frames < batch:
+            return web.json_response({"error": "frames must be positive and ring_frames at least batch"}, status=400)
+
+        directory = None
+        if self.timelapse_dir:
+            directory = os.path.join(self.timelapse_dir, f"timelapse-{time.strftime('%Y%m%d-%H%M%S')}")
+        self.timelapse = TimeLapse(frames, self.captured["reference"], params, directory=directory,
+                                   ring_frames=ring_frames, batch=batch, workers=workers)
+        try:
+            await self.timelapse.start()  # respond once capture has begun, not while workers spawn
+        except Exception as e:
+            return web.json_response({"error": f"Time-lapse workers failed to start: {e}"}, status=500)
+        self.timelapse_task = asyncio.create_task(self.timelapse.run())
+        if self.camera_task is None or self.camera_task.done():
+            self.camera_task = asyncio.create_task(self.camera_loop())
+        return web.json_response(dict(self.timelapse.status(), success=True))
+
+    async def timelapse_stop(self, request):
+        if self.timelapse is None:
+            return web.json_response({"error": "No time-lapse"}, status=409)
+        self.timelapse.stop()
+        return web.json_response(dict(self.timelapse.status(), success=True))
+
+    async def timelapse_status(self, request):
+        if self.timelapse is None:
+            return web.json_response({"error": "No time-lapse"}, status=409)
+        return web.json_response(self.timelapse.status())
+
+    async def timelapse_frame(self, request):
+        """One reconstructed frame of the current/last time-lapse as a phase PNG (?index=N)."""
+        if self.timelapse is None:
+            return web.json_response({"error": "No time-lapse"}, status=409)
+        try:
+            index = int(request.query.get("index", 0))
+        except ValueError:
+            return web.json_response({"error": "index must be an integer"}, status=400)
+        if not 0 <= index < self.timelapse.frames:
+            return web.json_response({"error": f"index must be in [0, {self.timelapse.frames})"}, status=400)
+        entry = self.timelapse.frame(index)
+        if entry is None:
+            return web.json_response({"error": f"Frame {index} is pending or was dropped"}, status=404)
+        phase, timestamp = entry
+        if resultCodec.wants_binary(request):
+            return await self._binary_result(request, {"phase": phase}, {"index": index, "time": timestamp},
+                                             image="phase")
+        phase_image = await asyncio.get_running_loop().run_in_executor(None, png_base64, phase)
+        return web.json_response({
+            "index": index,
+            "time": timestamp,
+            "phase_image": phase_image,
+            "shape": list(phase.shape),
+            "min": float(phase.min()),
+            "max": float(phase.max()),
+        })
+
+    # ---- motors ----
+    async def move(self, motor, steps, latency_ms, direction):
+        """Blocking move behind /move_motor; returns (position, seconds spent waiting for the axis)."""
+        if motor not in self.motor_locks:
+            raise ValueError(f"Unknown motor {motor}")
+        t0 = time.perf_counter()
+        async with self.motor_locks[motor]:
+            waited = time.perf_counter() - t0
+            await asyncio.sleep(self.motor_overhead + abs(steps) / self.step_rate + latency_ms / 1000)
+            self.motor_position[motor] += -steps if direction else steps
+            return self.motor_position[motor], waited
+
+    @staticmethod
+    def motor_command(data):
+        """MotorCommand from motor_number + steps/direction (relative) or target (absolute)."""
+        motor = int(data.get("motor_number", data.get("motor")))
+        latency_ms = float(data.get("latency_ms", 0))
+        if data.get("target") is not None:
+            return MotorCommand(motor, target=int(data["target"]), latency_ms=latency_ms, tag=data.get("id"))
+        steps = int(data["steps"])
+        return MotorCommand(motor, delta=-steps if int(data.get("direction", 0)) else steps,
+                            latency_ms=latency_ms, tag=data.get("id"))
+
+    async def move_motor(self, request):
+        """JSON body (app.js) or multipart form (motors.js) with motor_number/steps/latency_ms/direction.
+
+        With queue=1 (field or query) the command joins the coalescing queue and the call
+        returns 202 at once; progress arrives on /motor_ws.
+        """
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = await request.post()
+        queued = str(data.get("queue", request.query.get("queue", ""))).lower() in ("1", "true")
+        try:
+            if queued:
+                command = self.motor_queue.submit(self.motor_command(data))
+                return web.json_response({"success": True, "queued": True, "id": command.id}, status=202)
+            motor = int(data["motor_number"])
+            t0 = time.perf_counter()
+            position, waited = await self.move(motor, int(data["steps"]), float(data.get("latency_ms", 0)), int(data.get("direction", 0)))
+        except (KeyError, TypeError, ValueError) as e:
+            return web.json_response({"error": f"Bad motor command: {e}"}, status=400)
+        return web.json_response({"success": True, "motor": motor, "position": position,
+                                  "queued_ms": round(waited * 1000, 2),
+                                  "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2)})
+
+    async def move_motors(self, request):
+        """Batch of moves, e.g. {"moves": [{"motor": 1, "steps": 200}, {"motor": 2, "target": 0}], "wait": true}.
+
+        Axes move concurrently; without "wait" the call returns the command ids at once.
+        """
+        data = await request.json()
+        try:
+            commands = [self.motor_queue.submit(self.motor_command(move)) for move in data["moves"]]
+        except (KeyError, TypeError, ValueError) as e:
+            return web.json_response({"error": f"Bad motor command: {e}"}, status=400)
+        if not data.get("wait"):
+            return web.json_response({"success": True, "ids": [c.id for c in commands]}, status=202)
+        results = await asyncio.gather(*(c.done for c in commands))
+        return web.json_response({"success": True, "results": results, "positions": self.motor_position})
+
+    async def motor_status(self, request):
+        return web.json_response({"positions": self.motor_position,
+                                  "pending": {m: len(q) for m, q in self.motor_queue.pending.items()},
+                                  "stats": self.motor_queue.stats})
+
+    async def motor_ws(self, request):
+        """Persistent motor channel: send moves as JSON, receive accepted/moving/position/done updates."""
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        updates = asyncio.Queue()
+        self.motor_queue.subscribe(updates.put_nowait)
+
+        async def sender():
+            while True:
+                await ws.send_json(await updates.get())
+
+        send_task = asyncio.create_task(sender())
+        try:
+            await ws.send_json({"type": "hello", "positions": self.motor_position})
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                try:
+                    data = msg.json()
+                    moves = data["moves"] if "moves" in data else [data]
+                    commands = [self.motor_queue.submit(self.motor_command(move)) for move in moves]
+                    updates.put_nowait({"type": "accepted", "ids": [c.id for c in commands],
+                                        "tags": [c.tag for c in commands]})
+                except (KeyError, TypeError, ValueError) as e:
+                    updates.put_nowait({"type": "error", "error": f"Bad motor command: {e}"})
+        finally:
+            self.motor_queue.unsubscribe(updates.put_nowait)
+            send_task.cancel()
+        return ws
+
+    # ---- reconstruction ----
+    async def run_phase_difference(self, request):
+        form = await request.post()
+        params = parse_params(form)
+        image = form.get("image")
+        reference = form.get("reference")
+        if image is not None and hasattr(image, "file"):
+            image_data = image.file.read()
+            obj_key = "upload:" + hashlib.blake2b(image_data, digest_size=16).hexdigest()
+        else:
+            image_data, obj_key = None, f"capture:{self.capture_seq['object']}"
+        if reference is not None and hasattr(reference, "file"):
+            ref_data = reference.file.read()
+            ref_key = "upload:" + hashlib.blake2b(ref_data, digest_size=16).hexdigest()
+        else:
+            ref_data, ref_key = None, f"capture:{self.capture_seq['reference']}"
+
+        key = (obj_key, ref_key, params_key(params))
+        phase_map = self.phase_maps.get(key)
+        loop = asyncio.get_running_loop()
+        if phase_map is None:
+            hologram = decode_image(image_data) if image_data is not None else self.captured["object"]
+            ref = decode_image(ref_data) if ref_data is not None else self.captured["reference"]
+            if hologram is None or ref is None:
+                return web.json_response({"error": "Capture or upload both an object image and a reference"}, status=400)
+            try:
+                phase, thickness = await loop.run_in_executor(None, self.reconstructor.reconstruct, hologram, ref, params, ref_key)
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+            phase_map = self.phase_maps.put(PhaseMap(key, phase, thickness, params))
+        phase_map.roi = None
+        self.current = phase_map
+        meta = {
+            "shape": list(phase_map.shape),
+            "min": float(phase_map.phase.min()),
+            "max": float(phase_map.phase.max()),
+        }
+        if resultCodec.wants_binary(request):
+            return await self._binary_result(request, {"phase": phase_map.phase}, meta, image="phase")
+        # The PNG is only encoded for JSON clients, once per cached map
+        return web.json_response(dict(meta, phase_image=await loop.run_in_executor(None, phase_map.phase_png)))
+
+    async def _binary_result(self, request, arrays, meta, image=None):
+        """Binary (resultCodec) response for clients that sent Accept: application/x-phase-result."""
+        try:
+            opts = resultCodec.options(request.query)
+            body = await asyncio.get_running_loop().run_in_executor(
+                None, resultCodec.encode_result, arrays, meta, opts, image)
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        return web.Response(body=body, headers={"Content-Type": resultCodec.CONTENT_TYPE, "Vary": "Accept"})
+
+    def _no_phase(self):
+        return web.json_response({"error": "Run phase difference first"}, status=409)
+
+    async def select_roi(self, request):
+        if self.current is None:
+            return self._no_phase()
+        try:
+            roi = self.current.set_roi(*parse_points(await request.json()))
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        if roi is None:
+            return web.json_response({"error": "ROI is too small"}, status=400)
+        y1, y2, x1, x2 = roi
+        return web.json_response({"roi_image": self.current.roi_png(), "shape": [y2 - y1, x2 - x1]})
+
+    async def compute_1d(self, request):
+        """Points are in the coordinates of the image the user picked on: the ROI if one is set."""
+        if self.current is None:
+            return self._no_phase()
+        try:
+            points = parse_points(await request.json())
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        distance, values = self.current.profile(*points)
+        if resultCodec.wants_binary(request):
+            return await self._binary_result(request, {"x": distance, "y": values}, {})
+        return web.json_response({"x": distance.tolist(), "y": values.tolist()})
+
+    async def compute_3d(self, request):
+        if self.current is None:
+            return self._no_phase()
+        try:
+            lod = max(2, int(request.query.get("lod", PLOT_3D_MAX)))
+        except ValueError:
+            return web.json_response({"error": "lod must be an integer"}, status=400)
+        mesh = self.current.surface(lod)
+        if resultCodec.wants_binary(request):
+            return await self._binary_result(request, mesh, {})
+        return web.json_response({k: v.tolist() for k, v in mesh.items()})
+
+    async def check_spectrum(self, request):
+        reference = self.captured["reference"] if self.captured["reference"] is not None else self.captured["object"]
+        if reference is None:
+            return web.json_response({"error": "Capture an image first"}, status=409)
+        params = self.current.params if self.current is not None else parse_params({})
+        spectrum = np.fft.fft2(reference - reference.mean())
+        ky, kx = carrier_peaks(spectrum, params["dc_remove"])[0]
+        spectrum = np.fft.fftshift(spectrum)
+        max_y, max_x = ky + spectrum.shape[0] // 2, kx + spectrum.shape[1] // 2
+        mask = filter_mask(spectrum.shape, (max_y, max_x), params["filter_type"], params["filter_size"])
+        return web.json_response({
+            "imageArray_shiftft": png_base64(np.log1p(np.abs(spectrum))),
+            "mask_bool": png_base64(mask.astype(np.uint8)),
+            "max_y": max_y,
+            "max_x": max_x,
+        })
+
+
+# -----------------------------
+# HTTP app
+# -----------------------------
+@web.middleware
+async def cors(request, handler):
+    """The UI runs from file:// / localhost:4000, so every response needs CORS headers."""
+    if request.method == "OPTIONS":
+        response = web.Response(status=204)
+    else:
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            response = e
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "*"
+    response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+    return response
+
+
+@web.middleware
+async def timed(request, handler):
+    """Handler latency per route into agent_http_request_seconds."""
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "unmatched"
+        HTTP_SECONDS.observe(time.perf_counter() - t0, method=request.method, route=route, status=status)
+
+
+async def metrics_endpoint(request):
+    return web.Response(body=metrics.render().encode(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def profile_endpoint(request):
+    """Opt-in sampling profile (--profile): collapsed stacks over ?seconds=N."""
+    try:
+        seconds = metrics.profile_seconds(request.query.get("seconds"))
+    except ValueError as e:
+        return web.Response(status=400, text=str(e))
+    try:
+        stacks = await asyncio.get_running_loop().run_in_executor(None, metrics.profile, seconds)
+    except PermissionError as e:
+        return web.Response(status=403, text=str(e))
+    except RuntimeError as e:
+        return web.Response(status=409, text=str(e))
+    return web.Response(text=stacks)
+
+
+def create_app(agent):
+    app = web.Application(middlewares=[cors, timed], client_max_size=256 * 1024 * 1024)
+    app.router.add_get("/start_camera", agent.start_camera)
+    app.router.add_get("/stop_camera", agent.stop_camera)
+    app.router.add_get("/camera_feed", agent.camera_feed)
+    app.router.add_get("/camera_stats", agent.camera_stats)
+    app.router.add_post("/set_exposure", agent.set_exposure)
+    app.router.add_post("/capture_image", agent.capture_image)
+    app.router.add_post("/move_motor", agent.move_motor)
+    app.router.add_post("/move_motor_endpoint", agent.move_motor)
+    app.router.add_post("/move_motors", agent.move_motors)
+    app.router.add_get("/motor_status", agent.motor_status)
+    app.router.add_get("/motor_ws", agent.motor_ws)
+    app.router.add_post("/run_phase_difference", agent.run_phase_difference)
+    app.router.add_post("/select_roi", agent.select_roi)
+    app.router.add_post("/compute_1d", agent.compute_1d)
+    app.router.add_get("/compute_3d", agent.compute_3d)
+    app.router.add_get("/check_spectrum", agent.check_spectrum)
+    app.router.add_post("/timelapse/start", agent.timelapse_start)
+    app.router.add_post("/timelapse/stop", agent.timelapse_stop)
+    app.router.add_get("/timelapse/status", agent.timelapse_status)
+    app.router.add_get("/timelapse/frame", agent.timelapse_frame)
+    app.router.add_get("/metrics", metrics_endpoint)
+    app.router.add_get("/profile", profile_endpoint)
+    return app
+
+
+def local_ip():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.connect(("10.255.255.255", 1))
+            return s.getsockname()[0]
+        except OSError:
+            return "127.0.0.1"
+
+
+async def register_with_dispatcher(agent, port, subnet, is_public):
+    """Same flow as device.py: register_device, register_device_session, device_connect_to_dispatcher.
+
+    Once registered, frames are relayed over the same socket whenever an interface links to the device.
+    """
+    import aiohttp
+
+    http = dispatcherClient.async_session(limit=4)
+    socket_http = aiohttp.ClientSession()
+    payload = {"type": "microscope", "ip": local_ip(), "port": port, "subnet": subnet, "is_public": is_public}
+    device = SimulatedDevice(0, http, socket_http, dispatcherClient.BROKER_URL, payload=payload)
+    agent.attach_relay(device)
+    await device.start()
+    if device.error:
+        print(f"[AGENT] Dispatcher registration failed: {device.error}")
+    else:
+        print(f"[AGENT] Registered with dispatcher: device_id={device.device_id} code={device.connection_code}")
+    return device
+
+
+async def serve(args):
+    agent = MicroscopeAgent(args.width, args.height, args.fps, args.step_rate, args.ring_frames, args.timelapse_dir)
+    runner = web.AppRunner(create_app(agent))
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    print(f"[AGENT] Simulated microscope on http://{args.host}:{args.port} "
+          f"({args.width}x{args.height} @ {args.fps} fps)")
+    if args.register:
+        await register_with_dispatcher(agent, args.port, args.subnet, args.public)
+    await asyncio.Event().wait()
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Simulated microscope device agent (port-8000 API)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=AGENT_PORT)
+    parser.add_argument("--width", type=int, default=FRAME_WIDTH)
+    parser.add_argument("--height", type=int, default=FRAME_HEIGHT)
+    parser.add_argument("--fps", type=float, default=FPS)
+    parser.add_argument("--step-rate", type=float, default=STEP_RATE, help="simulated motor speed in steps/s")
+    parser.add_argument("--ring-frames", type=int, default=RING_FRAMES, help="capture ring size for time-lapses")
+    parser.add_argument("--timelapse-dir", default=None, help="where time-lapse stacks are written (default: temp dir)")
+    parser.add_argument("--register", action="store_true", help="register and connect to the dispatcher like device.py")
+    parser.add_argument("--subnet", default="192.168.1.0/24", help="subnet reported when registering")
+    parser.add_argument("--public", action="store_true", help="register as a public device")
+    parser.add_argument("--profile", action="store_true", help="allow sampling profiles from /profile?seconds=N")
+    args = parser.parse_args()
+    metrics.enable_profiling(args.profile or metrics.PROFILING_ENABLED)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from deviceFleet import percentile
+from microscopeAgent import AGENT_PORT, MOTOR_OVERHEAD, STEP_RATE
+
+# -----------------------------
+# Configuration
+# -----------------------------
+AGENT_URL = f"http://localhost:{AGENT_PORT}"
+MODES = ("http", "queue", "ws")
+
+
+# -----------------------------
+# Click bursts
+# -----------------------------
+class MotorWatcher:
+    """Listens on /motor_ws and timestamps when each command id starts moving and finishes."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.started = {}
+        self.finished = {}
+        self.accepted = {}          # tag -> id, for commands sent over this socket
+        self.status = {}
+        self.task = asyncio.create_task(self.listen())
+
+    async def listen(self):
+        async for msg in self.ws:
+            data = json.loads(msg.data)
+            now = time.perf_counter()
+            if data["type"] == "moving":
+                for command_id in data["ids"]:
+                    self.started.setdefault(command_id, now)
+            elif data["type"] == "done":
+                self.finished[data["id"]] = now
+                self.status[data["id"]] = data["status"]
+            elif data["type"] == "accepted":
+                self.accepted.update(zip(data["tags"], data["ids"]))
+
+
+async def click_burst(http, base, watcher, mode, clicks, rate, motor, steps, latency_ms):
+    """Fire `clicks` jog commands at `rate`/s without waiting on any of them, like a held key."""
+    clicked = {}
+    responses = []
+
+    async def click(i):
+        t0 = time.perf_counter()
+        clicked[i] = t0
+        if mode == "ws":
+            await watcher.ws.send_json({"id": i, "motor": motor, "steps": steps, "latency_ms": latency_ms})
+            return
+        form = aiohttp.FormData({"motor_number": str(motor), "steps": str(steps),
+                                 "latency_ms": str(latency_ms), "direction": "0"})
+        query = "?queue=1" if mode == "queue" else ""
+        async with http.post(f"{base}/move_motor{query}", data=form) as res:
+            data = await res.json()
+        responses.append((i, t0, time.perf_counter(), data))
+
+    tasks = []
+    for i in range(clicks):
+        tasks.append(asyncio.create_task(click(i)))
+        if rate > 0:
+            await asyncio.sleep(1 / rate)
+    await asyncio.gather(*tasks)
+    issued = time.perf_counter() - clicked[0]
+    return clicked, responses, issued
+
+
+async def run_mode(http, base, mode, args):
+    async with http.ws_connect(f"{base}/motor_ws") as ws:
+        watcher = MotorWatcher(ws)
+        async with http.post(f"{base}/move_motors", json={"moves": [{"motor": args.motor, "target": 0}], "wait": True}):
+            pass
+        clicked, responses, issued = await click_burst(http, base, watcher, mode, args.clicks, args.rate,
+                                                       args.motor, args.steps, args.latency_ms)
+        expected = args.clicks * args.steps
+        while True:  # settle: wait until the stage reaches the sum of all clicks
+            async with http.get(f"{base}/motor_status") as res:
+                status = await res.json()
+            if status["positions"][str(args.motor)] == expected and not status["pending"][str(args.motor)]:
+                break
+            await asyncio.sleep(0.005)
+        settled = time.perf_counter()
+        await asyncio.sleep(0.05)
+        watcher.task.cancel()
+
+    last_click = max(clicked.values())
+    if mode == "http":
+        # Blocking path: motion starts once the axis lock is free
+        to_motion = [data["queued_ms"] / 1000 + (t1 - t0) - data["elapsed_ms"] / 1000
+                     for _, t0, t1, data in responses]
+    else:
+        ids = watcher.accepted if mode == "ws" else {i: data["id"] for i, _, _, data in responses}
+        to_motion = [watcher.started[ids[i]] - clicked[i] for i in clicked if ids.get(i) in watcher.started]
+    return {
+        "mode": mode,
+        "commands_per_s": args.clicks / issued if issued else float("inf"),
+        "click_to_motion_p50_ms": percentile(to_motion, 50) * 1000,
+        "click_to_motion_p99_ms": percentile(to_motion, 99) * 1000,
+        "settle_after_last_click_ms": (settled - last_click) * 1000,
+        "moves": status["stats"]["moves"],
+    }
+
+
+async def run(args):
+    base = args.agent.rstrip("/")
+    single = MOTOR_OVERHEAD + args.steps / STEP_RATE + args.latency_ms / 1000
+    print(f"[MOTOR] {args.clicks} clicks of {args.steps} steps at {args.rate}/s on motor {args.motor}; "
+          f"one simulated move takes {single * 1000:.0f} ms at the default step rate")
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as http:
+        for mode in args.modes:
+            async with http.get(f"{base}/motor_status") as res:
+                moves_before = (await res.json())["stats"]["moves"]
+            r = await run_mode(http, base, mode, args)
+            print(f"[MOTOR] {mode:<5} {r['commands_per_s']:8.1f} cmd/s  "
+                  f"click->motion p50={r['click_to_motion_p50_ms']:.1f}ms p99={r['click_to_motion_p99_ms']:.1f}ms  "
+                  f"settled {r['settle_after_last_click_ms']:.0f}ms after last click  "
+                  f"driver moves {args.clicks if mode == 'http' else r['moves'] - moves_before - 1}")
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Jog-click burst against the agent's motor endpoints")
+    parser.add_argument("--agent", default=AGENT_URL, help="device agent base URL")
+    parser.add_argument("--clicks", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=20, help="clicks per second (0 = as fast as possible)")
+    parser.add_argument("--motor", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=100, help="latency_ms sent with each click, as in motors.js")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import asyncio
+import itertools
+import time
+
+# -----------------------------
+# Configuration
+# -----------------------------
+PROGRESS_INTERVAL = 0.05          # s between position updates pushed while a move runs
+
+
+# -----------------------------
+# Coalescing motor queue
+# -----------------------------
+class MotorCommand:
+    """One queued request: a relative `delta` or an absolute `target` on one axis."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, motor, delta=None, target=None, latency_ms=0.0, tag=None):
+        self.id = next(self._ids)
+        self.tag = tag              # caller's own id, echoed back in updates
+        self.motor = motor
+        self.delta = delta
+        self.target = target
+        self.latency_ms = latency_ms
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.done = asyncio.get_running_loop().create_future()
+
+    def result(self, status, position):
+        now = time.perf_counter()
+        return {
+            "id": self.id,
+            "tag": self.tag,
+            "motor": self.motor,
+            "status": status,
+            "position": position,
+            "queued_ms": round(((self.started or now) - self.submitted) * 1000, 2),
+            "elapsed_ms": round((now - self.submitted) * 1000, 2),
+        }
+
+
+class MotorQueue:
+    """Per-axis command queues in front of the agent's motors.
+
+    Consecutive relative moves on an axis are merged into one move, so a burst of jog
+    clicks costs one driver overhead instead of one per click. An absolute target
+    supersedes everything queued on its axis and stops the move in progress where it
+    is. Position and completion updates go to every subscriber (the /motor_ws sockets).
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.pending = {motor: [] for motor in agent.motor_position}
+        self.workers = {}
+        self.running = {}           # motor -> (task, commands) for the move in progress
+        self.subscribers = set()
+        self.stats = {"submitted": 0, "moves": 0, "coalesced": 0, "superseded": 0}
+
+    def subscribe(self, callback):
+        self.subscribers.add(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.discard(callback)
+
+    def publish(self, message):
+        for callback in list(self.subscribers):
+            callback(message)
+
+    def submit(self, command):
+        if command.motor not in self.pending:
+            raise ValueError(f"Unknown motor {command.motor}")
+        self.stats["submitted"] += 1
+        queue = self.pending[command.motor]
+        if command.target is not None:
+            for old in queue:
+                self._finish(old, "superseded")
+            queue.clear()
+            running = self.running.get(command.motor)
+            if running:
+                running[0].cancel()
+        queue.append(command)
+        worker = self.workers.get(command.motor)
+        if worker is None or worker.done():
+            self.workers[command.motor] = asyncio.create_task(self._worker(command.motor))
+        return command
+
+    def _finish(self, command, status):
+        position = self.agent.motor_position[command.motor]
+        if status == "superseded":
+            self.stats["superseded"] += 1
+        result = command.result(status, position)
+        if not command.done.done():
+            command.done.set_result(result)
+        self.publish(dict(result, type="done"))
+
+    def _take(self, motor):
+        """Pop the next move: an absolute target, or every relative command up to the next target."""
+        queue = self.pending[motor]
+        batch = [queue.pop(0)]
+        if batch[0].target is None:
+            while queue and queue[0].target is None:
+                batch.append(queue.pop(0))
+        self.stats["coalesced"] += len(batch) - 1
+        return batch
+
+    async def _worker(self, motor):
+        while self.pending[motor]:
+            batch = self._take(motor)
+            position = self.agent.motor_position[motor]
+            if batch[0].target is not None:
+                delta = batch[0].target - position
+            else:
+                delta = sum(c.delta for c in batch)
+            latency_ms = max(c.latency_ms for c in batch)
+            task = asyncio.create_task(self._run(motor, delta, latency_ms, batch))
+            self.running[motor] = (task, batch)
+            try:
+                await task
+                status = "done"
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise               # the worker itself is being cancelled
+                status = "superseded"
+            finally:
+                self.running.pop(motor, None)
+            for command in batch:
+                self._finish(command, status)
+
+    async def _run(self, motor, delta, latency_ms, batch):
+        """Simulated move: overhead and latency up front, then steps in PROGRESS_INTERVAL slices."""
+        agent = self.agent
+        async with agent.motor_locks[motor]:
+            now = time.perf_counter()
+            for command in batch:
+                command.started = now
+            self.stats["moves"] += 1
+            self.publish({"type": "moving", "motor": motor, "position": agent.motor_position[motor],
+                          "target": agent.motor_position[motor] + delta, "ids": [c.id for c in batch]})
+            await asyncio.sleep(agent.motor_overhead + latency_ms / 1000)
+            remaining = delta
+            chunk = max(1, int(agent.step_rate * PROGRESS_INTERVAL))
+            while remaining:
+                step = max(-chunk, min(chunk, remaining))
+                await asyncio.sleep(abs(step) / agent.step_rate)
+                agent.motor_position[motor] += step
+                remaining -= step
+                if remaining:
+                    self.publish({"type": "position", "motor": motor, "position": agent.motor_position[motor]})
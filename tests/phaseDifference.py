@@ -0,0 +1,416 @@
+import argparse
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import scipy.fft as fft_backend   # multithreaded, plan-caching FFTs when available
+    FFT_KWARGS = {"workers": -1}
+except ImportError:
+    fft_backend = np.fft              # pocketfft; caches twiddle factors per length internally
+    FFT_KWARGS = {}
+
+# -----------------------------
+# Configuration
+# -----------------------------
+TWO_PI = np.float32(2 * np.pi)
+REFERENCE_CACHE_SIZE = 4  # prepared references kept (~8 bytes/pixel/beam each)
+PARITY_TOLERANCE = 1e-4   # rad, float32 pipeline vs float64 baseline (wrapped, background removed)
+
+
+def parse_params(fields):
+    """The form fields the UI sends with /run_phase_difference."""
+    return {
+        "wavelength": float(fields.get("wavelength", 0.65)),
+        "pixel_size": float(fields.get("pixel_size", 1.0)),
+        "magnification": float(fields.get("magnification", 10)),
+        "delta_ri": float(fields.get("delta_ri", 1)) or 1.0,
+        "dc_remove": int(float(fields.get("dc_remove", 20))),
+        "filter_type": fields.get("filter_type", "circle"),
+        "filter_size": int(float(fields.get("filter_size", 101))),
+        "beam_type": fields.get("beam_type", "1 Beam"),
+    }
+
+
+def limit_fft_workers(workers=1):
+    """Cap scipy's FFT threads; pool workers already run one process per core."""
+    if "workers" in FFT_KWARGS:
+        FFT_KWARGS["workers"] = workers
+
+
+def beam_count(params):
+    return 2 if params["beam_type"].startswith("2") else 1
+
+
+# -----------------------------
+# Spectrum helpers
+# -----------------------------
+def carrier_peaks(spectrum, dc_remove, count=1, exclude=0):
+    """Signed (ky, kx) frequency indices of the +1 order(s) in an unshifted spectrum.
+
+    Searches ky >= 0 outside the DC block; with count=2 (two reference beams) the
+    second peak is searched more than `exclude` bins away from the first.
+    """
+    h, w = spectrum.shape
+    return _pick_peaks(np.abs(spectrum[:(h + 1) // 2]), dc_remove, count, exclude)
+
+
+def _pick_peaks(search, dc_remove, count, exclude):
+    """carrier_peaks() on the |spectrum| of rows ky = 0 .. (h+1)//2 - 1, all columns; zeroes `search`."""
+    w = search.shape[1]
+    cx = w // 2
+    search[:dc_remove + 1, :dc_remove + 1] = 0
+    search[:dc_remove + 1, w - dc_remove:] = 0
+    peaks = []
+    for _ in range(count):
+        ry, rx = np.unravel_index(np.argmax(search), search.shape)
+        peaks.append((int(ry), int((rx + cx) % w - cx)))
+        cols = np.arange(rx - exclude, rx + exclude + 1) % w
+        search[max(0, ry - exclude):ry + exclude + 1][:, cols] = 0
+    return peaks
+
+
+def filter_mask(shape, center, filter_type, filter_size):
+    """Full-size boolean filter around `center` (shifted-spectrum coordinates), for display."""
+    h, w = shape
+    radius = filter_size / 2
+    yy, xx = np.ogrid[:h, :w]
+    if filter_type == "square":
+        return (np.abs(yy - center[0]) <= radius) & (np.abs(xx - center[1]) <= radius)
+    return (yy - center[0]) ** 2 + (xx - center[1]) ** 2 <= radius ** 2
+
+
+# -----------------------------
+# Straightforward implementation
+# -----------------------------
+def phase_difference(hologram, reference, params):
+    """Unwrapped phase (rad) and thickness (µm) of `hologram` relative to `reference`.
+
+    Direct float64 version: every call redoes the reference. Kept as the baseline
+    that PhaseReconstructor is checked and benchmarked against.
+    """
+    hologram = np.asarray(hologram, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    if hologram.shape != reference.shape:
+        raise ValueError(f"Image {hologram.shape} and reference {reference.shape} differ in size")
+
+    h, w = hologram.shape
+    obj_spectrum = np.fft.fftshift(np.fft.fft2(hologram - hologram.mean()))
+    ref_spectrum = np.fft.fft2(reference - reference.mean())
+    peaks = carrier_peaks(ref_spectrum, params["dc_remove"], beam_count(params), params["filter_size"])
+    ref_spectrum = np.fft.fftshift(ref_spectrum)
+    product = np.zeros(hologram.shape, dtype=np.complex128)
+    for ky, kx in peaks:
+        mask = filter_mask(hologram.shape, (ky + h // 2, kx + w // 2), params["filter_type"], params["filter_size"])
+        fields = [np.fft.ifft2(np.fft.ifftshift(np.roll(s * mask, (-ky, -kx), axis=(0, 1))))
+                  for s in (obj_spectrum, ref_spectrum)]
+        product += fields[0] * np.conj(fields[1])
+    phase = np.angle(product)
+    phase = np.unwrap(np.unwrap(phase, axis=0), axis=1)
+    phase -= np.median(phase)
+    thickness = phase * params["wavelength"] / (2 * np.pi * params["delta_ri"])
+    return phase, thickness
+
+
+# -----------------------------
+# Cached float32 pipeline
+# -----------------------------
+def _ifft(a, axis, out=None):
+    if out is not None and fft_backend is np.fft:
+        try:
+            return np.fft.ifft(a, axis=axis, out=out)
+        except TypeError:
+            pass  # numpy < 2.0 has no out=
+    return fft_backend.ifft(a, axis=axis, **FFT_KWARGS)
+
+
+def _unwrap(phase, axis):
+    """In-place float32 equivalent of np.unwrap along `axis` (period 2π)."""
+    jumps = np.diff(phase, axis=axis)
+    jumps *= 1 / TWO_PI
+    np.rint(jumps, out=jumps)
+    np.cumsum(jumps, axis=axis, out=jumps)
+    jumps *= TWO_PI
+    tail = [slice(None)] * phase.ndim
+    tail[axis] = slice(1, None)
+    phase[tuple(tail)] -= jumps
+
+
+def _rfft_peaks(spectrum, width, dc_remove, count=1, exclude=0):
+    """carrier_peaks() for an rfft2 half-spectrum of an image `width` columns wide.
+
+    The upper half of the full |spectrum| is rebuilt from Hermitian symmetry,
+    |S(ky, kx)| = |S(-ky, -kx)|, so the search and its exclusion zones are the baseline's.
+    """
+    h, half_w = spectrum.shape
+    rows = (h + 1) // 2
+    magnitude = np.abs(spectrum)
+    search = np.empty((rows, width), magnitude.dtype)
+    search[:, :half_w] = magnitude[:rows]
+    mirror = width - np.arange(half_w, width)
+    search[:, half_w:] = magnitude[(-np.arange(rows)) % h][:, mirror]
+    return _pick_peaks(search, dc_remove, count, exclude)
+
+
+class _Window:
+    """filter_mask() around one carrier peak, as gather indices into an rfft2 half-spectrum.
+
+    The same bins as the baseline: the window is cut off at the edge of the shifted
+    spectrum rather than wrapped, and is never clamped. Bins with kx < 0 are read
+    from their Hermitian mirror and conjugated.
+    """
+
+    def __init__(self, shape, peak, filter_type, filter_size):
+        h, w = shape
+        ky, kx = peak
+        radius = filter_size / 2
+        r = int(np.floor(radius))
+        # Offsets whose bin lies inside the shifted spectrum, ky in [-(h//2), h - h//2)
+        dy = np.arange(max(-r, -(h // 2) - ky), min(r, h - h // 2 - 1 - ky) + 1)
+        dx = np.arange(max(-r, -(w // 2) - kx), min(r, w - w // 2 - 1 - kx) + 1)
+        if filter_type == "square":
+            self.mask = np.ones((dy.size, dx.size), dtype=np.float32)
+        else:
+            self.mask = (dy[:, None] ** 2 + dx[None, :] ** 2 <= radius ** 2).astype(np.float32)
+        self.offsets = (dy, dx)
+        rows, cols = np.broadcast_arrays((ky + dy)[:, None], (kx + dx)[None, :])
+        self.conj = cols < 0
+        self.src = (np.where(self.conj, -rows, rows) % h, np.abs(cols))
+        self.dst_rows = dy % h  # recentred on DC
+        self.dst_cols = dx % w
+
+    def gather(self, spectra):
+        band = spectra[(slice(None),) + self.src] * self.mask
+        np.conjugate(band, out=band, where=self.conj)
+        return band
+
+
+class PhaseReconstructor:
+    """Off-axis phase reconstruction with the reference side cached.
+
+    The reference spectrum, carrier peaks, filter windows and the conjugate reference
+    field are prepared once per (reference, filter_type, filter_size, dc_remove, beams)
+    and reused; work buffers are allocated once per frame shape. Batches go through
+    frame by frame: every stage is memory-bound, so stacking frames only pushes the
+    working set out of cache (a 4-frame stack ran 10-20% slower). Everything runs in
+    float32/complex64, the forward transform is a real FFT, and the inverse only
+    transforms the columns the filter window touches before the full row pass.
+    The background offset is the median of a 4x-subsampled grid.
+    The FFT stages are serialised because the buffers are shared.
+    """
+
+    def __init__(self, cache_size=REFERENCE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.references = OrderedDict()  # key -> (windows, [conj reference field per beam])
+        self.buffers = {}                # (1, h, w) -> (work, field, product)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _buffers(self, shape):
+        if shape not in self.buffers:
+            self.buffers.clear()  # keep one shape's worth of memory
+            self.buffers[shape] = (np.zeros(shape, np.complex64), np.empty(shape, np.complex64),
+                                   np.empty(shape, np.complex64))
+        return self.buffers[shape]
+
+    def _fields(self, spectra, window, work, out=None):
+        """Complex field of one filtered order, moved to DC, for a batch of half-spectra.
+
+        Only the window's columns are non-zero, so the column pass runs on that band
+        alone; `work` is an all-zero (n, h, w) buffer and is left that way.
+        """
+        n, h = spectra.shape[:2]
+        band = np.zeros((n, h, window.dst_cols.size), np.complex64)
+        band[:, window.dst_rows, :] = window.gather(spectra)
+        work[:, :, window.dst_cols] = _ifft(band, axis=1)
+        field = _ifft(work, axis=2, out=out)
+        work[:, :, window.dst_cols] = 0
+        return field
+
+    @staticmethod
+    def _spectra(stack):
+        stack = stack - stack.mean(axis=(-2, -1), keepdims=True, dtype=np.float32)
+        return fft_backend.rfft2(stack, axes=(-2, -1), **FFT_KWARGS)
+
+    def prepare_reference(self, reference, params, reference_key=None):
+        """Cached reference side; `reference_key` skips hashing when the caller can identify it."""
+        reference = np.asarray(reference, dtype=np.float32)
+        if reference_key is None:
+            reference_key = hashlib.blake2b(np.ascontiguousarray(reference).data, digest_size=16).hexdigest()
+        beams = beam_count(params)
+        key = (reference_key, reference.shape, params["filter_type"], params["filter_size"], params["dc_remove"], beams)
+        entry = self.references.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.references.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        spectra = self._spectra(reference[None])
+        peaks = _rfft_peaks(spectra[0], reference.shape[1], params["dc_remove"], beams, params["filter_size"])
+        windows = [_Window(reference.shape, peak, params["filter_type"], params["filter_size"]) for peak in peaks]
+        work = np.zeros((1,) + reference.shape, np.complex64)
+        conj_fields = [np.conj(self._fields(spectra, window, work)[0]) for window in windows]
+        entry = (windows, conj_fields)
+        self.references[key] = entry
+        while len(self.references) > self.cache_size:
+            self.references.popitem(last=False)
+        return entry
+
+    def _frame(self, hologram, entry, out):
+        """Unwrapped, background-removed phase of one (h, w) hologram into `out`."""
+        windows, conj_fields = entry
+        with self.lock:
+            work, field, product = self._buffers((1,) + hologram.shape)
+            spectra = self._spectra(hologram[None])
+            for i, (window, conj_ref) in enumerate(zip(windows, conj_fields)):
+                field = self._fields(spectra, window, work, field)
+                if i == 0:
+                    np.multiply(field, conj_ref, out=product)
+                else:
+                    product += field * conj_ref
+            np.arctan2(product[0].imag, product[0].real, out=out)
+        _unwrap(out, axis=0)
+        _unwrap(out, axis=1)
+        out -= np.median(out[::4, ::4])
+        return out
+
+    @staticmethod
+    def _stack(holograms, reference):
+        holograms = np.asarray(holograms, dtype=np.float32)
+        if holograms.ndim == 2:
+            holograms = holograms[None]
+        if holograms.shape[1:] != np.shape(reference):
+            raise ValueError(f"Image {holograms.shape[1:]} and reference {np.shape(reference)} differ in size")
+        return holograms
+
+    def reconstruct_batch(self, holograms, reference, params, reference_key=None):
+        """Phase and thickness stacks, shape (n, h, w), for holograms sharing one reference."""
+        holograms = self._stack(holograms, reference)
+        with self.lock:
+            entry = self.prepare_reference(reference, params, reference_key)
+        phase = np.empty(holograms.shape, np.float32)
+        for hologram, out in zip(holograms, phase):
+            self._frame(hologram, entry, out)
+        thickness = phase * np.float32(params["wavelength"] / (2 * np.pi * params["delta_ri"]))
+        return phase, thickness
+
+    def reconstruct(self, hologram, reference, params, reference_key=None):
+        """Single-hologram convenience wrapper around reconstruct_batch."""
+        phase, thickness = self.reconstruct_batch(hologram, reference, params, reference_key)
+        return phase[0], thickness[0]
+
+    def reconstruct_into(self, hologram, reference, params, out, reference_key=None):
+        """Phase only, written into `out` (h, w float32), e.g. a row of a memory-mapped stack."""
+        hologram = self._stack(hologram, reference)[0]
+        with self.lock:
+            entry = self.prepare_reference(reference, params, reference_key)
+        return self._frame(hologram, entry, out)
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def bench(sizes, batch, repeat):
+    from microscopeAgent import HologramSource
+
+    params = parse_params({})
+    print(f"{'size':>6} {'baseline/s':>11} {'cached/s':>9} {'batch/s':>9} {'max|err| rad':>13}")
+    for size in sizes:
+        source = HologramSource(size, size)
+        reference = source.frame(0, with_object=False).astype(np.float32)
+        holograms = np.stack([source.frame(0.5 * i) for i in range(batch)]).astype(np.float32)
+        reconstructor = PhaseReconstructor()
+
+        t0 = time.perf_counter()
+        expected, _ = phase_difference(holograms[0], reference, params)
+        baseline = 1 / (time.perf_counter() - t0)
+
+        reconstructor.reconstruct(holograms[0], reference, params, reference_key="bench")  # warm the cache
+        t0 = time.perf_counter()
+        for i in range(repeat):
+            phase, _ = reconstructor.reconstruct(holograms[i % batch], reference, params, reference_key="bench")
+        cached = repeat / (time.perf_counter() - t0)
+        error = float(np.abs(reconstructor.reconstruct(holograms[0], reference, params, "bench")[0] - expected).max())
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            reconstructor.reconstruct_batch(holograms, reference, params, reference_key="bench")
+        batched = repeat * batch / (time.perf_counter() - t0)
+        print(f"{size:>6} {baseline:>11.2f} {cached:>9.2f} {batched:>9.2f} {error:>13.2e}")
+
+
+# -----------------------------
+# Parity with the baseline
+# -----------------------------
+def _window_mask(shape, peak, window):
+    """The bins `window` reads, as a filter_mask()-style boolean array in shifted coordinates."""
+    h, w = shape
+    dy, dx = window.offsets
+    mask = np.zeros(shape, bool)
+    mask[np.ix_(peak[0] + dy + h // 2, peak[1] + dx + w // 2)] = window.mask > 0
+    return mask
+
+
+def parity(width=640, height=480, filter_sizes=(51, 101, 301, 1000)):
+    """Compare PhaseReconstructor with phase_difference() over beams, filter types and sizes.
+
+    Peaks and filter masks must be identical. Phases are compared wrapped to (-π, π] and
+    with the background removed: the reconstructor takes the background median on a
+    subsampled grid (a constant offset, listed separately), and once the filter passes
+    most of the spectrum the phase is noise whose unwrapping flips 2π branches on float32
+    rounding. Returns the number of failing cases.
+    """
+    from microscopeAgent import HologramSource
+
+    source = HologramSource(width, height)
+    reference = source.frame(0, with_object=False).astype(np.float32)
+    hologram = source.frame(1.0).astype(np.float32)
+    spectrum = np.fft.fft2(reference - reference.mean())
+    reconstructor = PhaseReconstructor()
+    failures = 0
+    print(f"{'beams':<8} {'filter':<7} {'size':>5} {'peaks':<24} {'mask':<5} {'offset rad':>10} {'max|err| rad':>12}")
+    for beams in ("1 Beam", "2 Beams"):
+        for filter_type in ("circle", "square"):
+            for filter_size in filter_sizes:
+                params = parse_params({"beam_type": beams, "filter_type": filter_type, "filter_size": filter_size})
+                expected_peaks = carrier_peaks(spectrum, params["dc_remove"], beam_count(params), filter_size)
+                windows, _ = reconstructor.prepare_reference(reference, params)
+                peaks = _rfft_peaks(PhaseReconstructor._spectra(reference[None])[0], width, params["dc_remove"],
+                                    beam_count(params), filter_size)
+                same_mask = all(
+                    np.array_equal(_window_mask(reference.shape, peak, window),
+                                   filter_mask(reference.shape, (peak[0] + height // 2, peak[1] + width // 2),
+                                               filter_type, filter_size))
+                    for peak, window in zip(expected_peaks, windows))
+                expected, _ = phase_difference(hologram, reference, params)
+                phase, _ = reconstructor.reconstruct(hologram, reference, params)
+                difference = np.angle(np.exp(1j * (phase - expected)))
+                offset = float(np.median(difference))
+                error = float(np.abs(np.angle(np.exp(1j * (difference - offset)))).max())
+                ok = peaks == expected_peaks and same_mask and error < PARITY_TOLERANCE
+                failures += not ok
+                print(f"{beams:<8} {filter_type:<7} {filter_size:>5} {str(peaks):<24} {str(same_mask):<5} "
+                      f"{offset:>10.2e} {error:>12.2e}{'' if ok else '  FAIL'}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phase-difference reconstruction benchmark (holograms/s)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048], help="square image sizes")
+    parser.add_argument("--batch", type=int, default=4, help="holograms per batched call")
+    parser.add_argument("--repeat", type=int, default=5, help="timed iterations per size")
+    parser.add_argument("--parity", action="store_true", help="check against phase_difference() instead; exit 1 on a mismatch")
+    args = parser.parse_args()
+    print(f"FFT backend: {fft_backend.__name__}")
+    if args.parity:
+        raise SystemExit(1 if parity() else 0)
+    bench(args.sizes, args.batch, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import base64
+import io
+import math
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# -----------------------------
+# Configuration
+# -----------------------------
+PHASE_MAP_CACHE_SIZE = 4          # reconstructed maps kept per agent
+SURFACE_CACHE_SIZE = 8            # decimated 3D meshes kept per map
+ROI_PNG_CACHE_SIZE = 4            # encoded ROI crops kept per map
+
+
+# -----------------------------
+# Image helpers
+# -----------------------------
+def to_uint8(array):
+    lo, hi = float(np.min(array)), float(np.max(array))
+    scale = 255.0 / (hi - lo) if hi > lo else 0.0
+    return ((array - lo) * scale).astype(np.uint8)
+
+
+def png_base64(array):
+    buf = io.BytesIO()
+    Image.fromarray(to_uint8(array)).save(buf, format="PNG")
+    return base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def params_key(params):
+    return tuple(sorted(params.items()))
+
+
+# -----------------------------
+# Cached phase map
+# -----------------------------
+class PhaseMap:
+    """One reconstructed phase/thickness pair plus everything derived from it.
+
+    ROI crops are views into the cached arrays, 1D profiles are sampled straight from
+    them and 3D meshes are decimated on demand, so none of the ROI, point-picking or
+    plot requests go back through unwrapping or thickness conversion.
+    """
+
+    def __init__(self, key, phase, thickness, params):
+        self.key = key
+        self.phase = phase
+        self.thickness = thickness
+        self.params = params
+        self.pixel_um = params["pixel_size"] / params["magnification"]
+        self.roi = None           # (y1, y2, x1, x2) or None for the full frame
+        self._phase_png = None
+        self._roi_png = OrderedDict()
+        self._surfaces = OrderedDict()
+
+    @property
+    def shape(self):
+        return self.phase.shape
+
+    def phase_png(self):
+        if self._phase_png is None:
+            self._phase_png = png_base64(self.phase)
+        return self._phase_png
+
+    # ---- ROI ----
+    def set_roi(self, x1, y1, x2, y2):
+        """Clamp and store the ROI; returns its (y1, y2, x1, x2) bounds or None if too small."""
+        h, w = self.shape
+        x1, x2 = sorted((max(0, min(w, int(x1))), max(0, min(w, int(x2)))))
+        y1, y2 = sorted((max(0, min(h, int(y1))), max(0, min(h, int(y2)))))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return None
+        self.roi = (y1, y2, x1, x2)
+        return self.roi
+
+    def _crop(self, array):
+        if self.roi is None:
+            return array
+        y1, y2, x1, x2 = self.roi
+        return array[y1:y2, x1:x2]
+
+    def region(self):
+        """Thickness inside the current ROI (a view, never a copy)."""
+        return self._crop(self.thickness)
+
+    def roi_png(self):
+        if self.roi in self._roi_png:
+            self._roi_png.move_to_end(self.roi)
+            return self._roi_png[self.roi]
+        png = self._roi_png[self.roi] = png_base64(self._crop(self.phase))
+        while len(self._roi_png) > ROI_PNG_CACHE_SIZE:
+            self._roi_png.popitem(last=False)
+        return png
+
+    # ---- plots ----
+    def profile(self, x1, y1, x2, y2):
+        """Thickness along a line in ROI coordinates, bilinearly sampled about once per pixel."""
+        region = self.region()
+        h, w = region.shape
+        length = math.hypot(x2 - x1, y2 - y1)
+        n = max(2, int(length) + 1)
+        xs = np.clip(np.linspace(x1, x2, n), 0, w - 1)
+        ys = np.clip(np.linspace(y1, y2, n), 0, h - 1)
+        x0 = np.minimum(xs.astype(np.intp), w - 2)  # ROIs are at least 2x2
+        y0 = np.minimum(ys.astype(np.intp), h - 2)
+        fx, fy = xs - x0, ys - y0
+        top = region[y0, x0] * (1 - fx) + region[y0, x0 + 1] * fx
+        bottom = region[y0 + 1, x0] * (1 - fx) + region[y0 + 1, x0 + 1] * fx
+        values = top * (1 - fy) + bottom * fy
+        distance = np.linspace(0, length * self.pixel_um, n)
+        return distance, values
+
+    def surface(self, lod):
+        """ROI decimated by striding to at most `lod` samples per side, as x/y/z arrays; cached per (ROI, lod)."""
+        key = (self.roi, lod)
+        if key in self._surfaces:
+            self._surfaces.move_to_end(key)
+            return self._surfaces[key]
+        region = self.region()
+        step = max(1, math.ceil(max(region.shape) / lod))
+        z = region[::step, ::step]
+        px = self.pixel_um * step
+        mesh = {
+            "x": np.arange(z.shape[1]) * px,
+            "y": np.arange(z.shape[0]) * px,
+            "z": z,
+        }
+        self._surfaces[key] = mesh
+        while len(self._surfaces) > SURFACE_CACHE_SIZE:
+            self._surfaces.popitem(last=False)
+        return mesh
+
+
+class PhaseMapCache:
+    """LRU of PhaseMaps keyed by (object, reference, params), so re-running an unchanged
+    reconstruction is a lookup."""
+
+    def __init__(self, size=PHASE_MAP_CACHE_SIZE):
+        self.size = size
+        self.maps = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        phase_map = self.maps.get(key)
+        if phase_map is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.maps.move_to_end(key)
+        return phase_map
+
+    def put(self, phase_map):
+        self.maps[phase_map.key] = phase_map
+        self.maps.move_to_end(phase_map.key)
+        while len(self.maps) > self.size:
+            self.maps.popitem(last=False)
+        return phase_map
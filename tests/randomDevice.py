@@ -1,14 +1,16 @@
+import argparse
 import requests
 import random
 import string
 
+import dispatcherClient
+from manifest import provision
+
 # -----------------------------
 # Configuration
 # -----------------------------
-BROKER_URL = "http://localhost:3000"  # replace with your broker URL
-REGISTER_ENDPOINT = f"{BROKER_URL}/api/register_device"
-
 DEVICE_TYPES = ["microscope", "camera", "sensor", "robotic_arm"]
+REGISTER_ATTEMPTS = 5  # fresh IP+port tries before a collision counts as a failure
 
 # -----------------------------
 # Helper functions
@@ -28,32 +30,66 @@ def random_type():
 def random_name(length=6):
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
-# -----------------------------
-# Main function to add a device
-# -----------------------------
-def add_device():
-    payload = {
+def random_device_payload(is_public=False):
+    """Build a /api/register_device body with random metadata."""
+    return {
         "type": random_type(),
         "ip": random_ip(),
         "port": random_port(),
         "subnet": random_subnet(),
-        "public": False,
+        "is_public": is_public,
     }
 
+# -----------------------------
+# Main function to add a device
+# -----------------------------
+def add_device():
+    payload = random_device_payload()
+
     try:
-        response = requests.post(REGISTER_ENDPOINT, json=payload, timeout=5)
+        response = dispatcherClient.post("/api/register_device", json=payload)
         if response.status_code == 200:
             data = response.json()
-            print(f"[SUCCESS] Device added: ID={data['deviceId']}, Code={data['connectionCode']}")
+            print(f"[SUCCESS] Device added: ID={data['device_id']}, Code={data['connection_code']}")
         else:
             print(f"[FAILURE] Status {response.status_code}: {response.text}")
     except requests.exceptions.RequestException as e:
         print(f"[ERROR] Could not connect to broker: {e}")
 
+# -----------------------------
+# Batch provisioning
+# -----------------------------
+def register_with_retry(is_public=False):
+    """Register one random device, retrying IP+port collisions with fresh values.
+
+    Returns (device row or None, collisions retried, error or None).
+    """
+    collisions = 0
+    for _ in range(REGISTER_ATTEMPTS):
+        try:
+            response = dispatcherClient.post("/api/register_device", json=random_device_payload(is_public))
+        except requests.exceptions.RequestException as e:
+            return None, collisions, type(e).__name__
+        if response.status_code == 200:
+            try:
+                return response.json(), collisions, None
+            except ValueError:
+                return None, collisions, "HTTP 200 with a non-JSON body"
+        if response.status_code == 400 and "already exists" in response.text:
+            collisions += 1
+            continue
+        return None, collisions, f"HTTP {response.status_code}"
+    return None, collisions, "IP+port collisions exhausted retries"
+
+def provision_devices(count, parallel=16, manifest_path=None, public_ratio=0.0):
+    """Register `count` devices with bounded parallelism, streaming rows to a manifest."""
+    flags = (random.random() < public_ratio for _ in range(count))
+    return provision(register_with_retry, flags, count, "devices", parallel, manifest_path)
+
 # -----------------------------
 # Command-line interface
 # -----------------------------
-def main():
+def interactive():
     print("Random Device Adder (isolated, via API)")
     print("Press ENTER to add a new device or type 'exit' to quit.")
     while True:
@@ -62,5 +98,18 @@ def main():
             break
         add_device()
 
+def main():
+    parser = argparse.ArgumentParser(description="Register random devices with the dispatcher")
+    parser.add_argument("--batch", type=int, help="register this many devices and exit")
+    parser.add_argument("--parallel", type=int, default=16, help="concurrent registrations in batch mode")
+    parser.add_argument("--manifest", help="write device_id/connection_code rows here (.jsonl or .csv)")
+    parser.add_argument("--public-ratio", type=float, default=0.0, help="fraction of devices registered as public")
+    args = parser.parse_args()
+
+    if args.batch:
+        provision_devices(args.batch, args.parallel, args.manifest, args.public_ratio)
+    else:
+        interactive()
+
 if __name__ == "__main__":
     main()
@@ -1,17 +1,19 @@
-import requests
+import argparse
 import random
-import uuid
+
+import requests
+
+import dispatcherClient
+from manifest import provision, read_manifest
 
 # -----------------------------
 # Configuration
 # -----------------------------
-API_URL = "http://localhost:3000/api"
-ADMIN_URL = "http://localhost:3000/admin"
-
 # Sample names and email domains to generate random interfaces
 first_names = ["Alice", "Bob", "Charlie", "Dana", "Eve", "Frank"]
 last_names = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Miller"]
 domains = ["example.com", "mail.com", "test.org"]
+REGISTER_ATTEMPTS = 5  # fresh emails tried when email+device is already registered
 
 # -----------------------------
 # Helper functions
@@ -26,7 +28,7 @@ def generate_random_name_email():
 def get_devices():
     """Fetch all registered devices from the dispatcher."""
     try:
-        res = requests.get(f"{ADMIN_URL}/devices")
+        res = dispatcherClient.get("/admin/devices")
         res.raise_for_status()
         return res.json()
     except Exception as e:
@@ -41,17 +43,53 @@ def create_interface(name, email, device_code):
         "deviceCode": device_code
     }
     try:
-        res = requests.post(f"{API_URL}/register_interface", json=payload)
+        res = dispatcherClient.post("/api/register_interface", json=payload)
         res.raise_for_status()
         return res.json()
     except Exception as e:
         print("Error creating interface:", e)
         return None
 
+# -----------------------------
+# Batch provisioning
+# -----------------------------
+def create_interface_with_retry(device):
+    """Register one interface for `device`, retrying email+device duplicates with a new email.
+
+    Returns (manifest row or None, collisions retried, error or None).
+    """
+    collisions = 0
+    for _ in range(REGISTER_ATTEMPTS):
+        name, email = generate_random_name_email()
+        payload = {"name": name, "email": email, "deviceCode": device["connection_code"]}
+        try:
+            res = dispatcherClient.post("/api/register_interface", json=payload)
+        except requests.exceptions.RequestException as e:
+            return None, collisions, type(e).__name__
+        if res.status_code == 200:
+            try:
+                interface_id = res.json()["interface_id"]
+            except (ValueError, KeyError, TypeError):
+                return None, collisions, "HTTP 200 without an interface_id"
+            row = {"device_id": device.get("device_id"), "connection_code": device["connection_code"],
+                   "interface_id": interface_id, "email": email}
+            return row, collisions, None
+        if res.status_code == 400 and "already registered" in res.text:
+            collisions += 1
+            continue
+        return None, collisions, f"HTTP {res.status_code}"
+    return None, collisions, "duplicate emails exhausted retries"
+
+def provision_interfaces(count, devices, parallel=16, manifest_path=None):
+    """Register `count` interfaces, assigned round-robin over `devices` as they stream out."""
+    assignments = (devices[i % len(devices)] for i in range(count))
+    return provision(create_interface_with_retry, assignments, count, "interfaces", parallel, manifest_path,
+                     retried="duplicates")
+
 # -----------------------------
 # Main logic
 # -----------------------------
-def main():
+def register_one():
     devices = get_devices()
     if not devices:
         print("No devices found. Please register some devices first.")
@@ -71,5 +109,23 @@ def main():
     else:
         print("Failed to create interface.")
 
+def main():
+    parser = argparse.ArgumentParser(description="Register random interfaces with the dispatcher")
+    parser.add_argument("--batch", type=int, help="register this many interfaces and exit")
+    parser.add_argument("--devices", help="device manifest from randomDevice.py --manifest (default: fetch /admin/devices once)")
+    parser.add_argument("--parallel", type=int, default=16, help="concurrent registrations in batch mode")
+    parser.add_argument("--manifest", help="write device_id/connection_code/interface_id rows here (.jsonl or .csv)")
+    args = parser.parse_args()
+
+    if not args.batch:
+        register_one()
+        return
+
+    devices = read_manifest(args.devices) if args.devices else get_devices()
+    if not devices:
+        print("No devices found. Please register some devices first.")
+        return
+    provision_interfaces(args.batch, devices, args.parallel, args.manifest)
+
 if __name__ == "__main__":
     main()
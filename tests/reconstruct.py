@@ -0,0 +1,245 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from PIL import Image
+
+from phaseDifference import PhaseReconstructor, limit_fft_workers, parse_params
+
+# -----------------------------
+# Configuration
+# -----------------------------
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".npy")
+CHUNK_FRAMES = 64                 # frames per output .npy
+BATCH_FRAMES = 4                  # holograms per worker call
+PROGRESS_INTERVAL = 2.0           # s between progress lines
+MANIFEST = "manifest.json"
+
+# Offline reconstruction of a hologram directory against one reference:
+#
+#   python reconstruct.py holograms/ --reference ref.png --output out/ --filter-size 81
+#
+# Output is out/phase-00000.npy, phase-00001.npy, ... (float32, up to CHUNK_FRAMES x h x w)
+# with a phase-NNNNN.json next to each listing its source files and any that failed, and
+# out/manifest.json with the parameters. A chunk is written as phase-NNNNN.npy.part
+# through a memmap and renamed once complete, so re-running the same command after an
+# interruption skips the finished chunks. Workers read their own images and write their
+# own rows; the parent only holds file names and a bounded number of in-flight batches,
+# so memory stays at roughly workers x batch x frame size whatever the dataset size.
+
+
+def list_images(directory):
+    """Image paths under `directory` (not recursive), sorted by name."""
+    with os.scandir(directory) as entries:
+        names = sorted(e.name for e in entries if e.is_file() and e.name.lower().endswith(IMAGE_EXTENSIONS))
+    return [os.path.join(directory, n) for n in names]
+
+
+def load_image(path):
+    if path.lower().endswith(".npy"):
+        return np.load(path).astype(np.float32, copy=False)
+    with Image.open(path) as image:
+        return np.asarray(image.convert("L"), dtype=np.float32)
+
+
+def chunk_path(output, chunk, suffix=".npy"):
+    return os.path.join(output, f"phase-{chunk:05d}{suffix}")
+
+
+# -----------------------------
+# Worker processes
+# -----------------------------
+_worker = {}
+
+
+def _init_worker(reference_path, params):
+    limit_fft_workers()
+    _worker.update(reference=load_image(reference_path), params=params,
+                   reconstructor=PhaseReconstructor(cache_size=1))
+
+
+def _reconstruct_batch(part_path, offset, paths):
+    """Reconstruct `paths` into rows offset.. of the chunk file; returns {path: error} for failures."""
+    reference = _worker["reference"]
+    stack = np.load(part_path, mmap_mode="r+")
+    errors = {}
+    for i, path in enumerate(paths):
+        try:
+            image = load_image(path)
+            if image.shape != reference.shape:
+                raise ValueError(f"Image {image.shape} and reference {reference.shape} differ in size")
+        except Exception as e:
+            errors[path] = str(e)
+            continue
+        _worker["reconstructor"].reconstruct_into(image, reference, _worker["params"], stack[offset + i],
+                                                  reference_key="reference")
+    failed = [offset + i for i, path in enumerate(paths) if path in errors]
+    if failed:
+        stack[failed] = np.nan
+    stack.flush()
+    del stack
+    return errors
+
+
+# -----------------------------
+# Driver
+# -----------------------------
+class Progress:
+    def __init__(self, total, skipped, failed=0):
+        self.total = total
+        self.done = skipped
+        self.skipped = skipped
+        self.failed = failed
+        self.started = time.monotonic()
+        self.last = 0.0
+
+    def update(self, frames, failed, force=False):
+        self.done += frames
+        self.failed += failed
+        now = time.monotonic()
+        if not force and now - self.last < PROGRESS_INTERVAL:
+            return
+        self.last = now
+        elapsed = now - self.started
+        rate = (self.done - self.skipped) / elapsed if elapsed > 0 else 0.0
+        eta = f"{(self.total - self.done) / rate:.0f}s" if rate > 0 else "-"
+        print(f"[RECON] {self.done}/{self.total} frames ({100 * self.done / max(1, self.total):.1f}%) "
+              f"{rate:.1f} frames/s, {self.failed} failed, ETA {eta}", flush=True)
+
+
+def check_manifest(output, manifest):
+    """Write the manifest, or make sure an existing one describes the same job."""
+    path = os.path.join(output, MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            existing = json.load(f)
+        changed = [k for k in ("params", "reference", "files", "files_digest", "chunk") if existing.get(k) != manifest[k]]
+        if changed:
+            raise SystemExit(f"[RECON] {output} holds a different job ({', '.join(changed)} changed); "
+                             f"use a new --output or delete it")
+        return True
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return False
+
+
+def finish_chunk(output, chunk, paths, errors):
+    with open(chunk_path(output, chunk, ".json"), "w") as f:
+        json.dump({"files": [os.path.basename(p) for p in paths],
+                   "errors": {os.path.basename(p): e for p, e in errors.items()}}, f, indent=1)
+    os.replace(chunk_path(output, chunk, ".npy.part"), chunk_path(output, chunk))
+
+
+def finished_errors(output, chunks):
+    """Failures recorded by an earlier run in the .json of each chunk already on disk."""
+    failed = 0
+    for c, _ in chunks:
+        path = chunk_path(output, c, ".json")
+        if os.path.exists(chunk_path(output, c)) and os.path.exists(path):
+            with open(path) as f:
+                failed += len(json.load(f).get("errors", {}))
+    return failed
+
+
+def run(args):
+    params = parse_params(vars(args))
+    files = list_images(args.input)
+    if not files:
+        raise SystemExit(f"[RECON] no images in {args.input}")
+    shape = load_image(args.reference).shape
+    os.makedirs(args.output, exist_ok=True)
+    manifest = {
+        "input": os.path.abspath(args.input),
+        "reference": os.path.abspath(args.reference),
+        "params": params,
+        "shape": list(shape),
+        "chunk": args.chunk,
+        "files": len(files),
+        "files_digest": hashlib.blake2b("\n".join(os.path.basename(p) for p in files).encode(),
+                                        digest_size=16).hexdigest(),
+        "thickness_per_rad": params["wavelength"] / (2 * np.pi * params["delta_ri"]),
+    }
+    resumed = check_manifest(args.output, manifest)
+
+    chunks = [(c, files[start:start + args.chunk]) for c, start in enumerate(range(0, len(files), args.chunk))]
+    todo = [(c, paths) for c, paths in chunks if not os.path.exists(chunk_path(args.output, c))]
+    skipped = sum(len(paths) for c, paths in chunks) - sum(len(paths) for c, paths in todo)
+    skipped_failed = finished_errors(args.output, chunks)
+    workers = args.workers or os.cpu_count() or 1
+    print(f"[RECON] {len(files)} holograms {shape[1]}x{shape[0]} in {len(chunks)} chunks, "
+          f"{workers} workers, batch {args.batch}"
+          + (f"; resuming, {skipped} frames already done ({skipped_failed} failed)" if resumed else ""))
+
+    def batches():
+        """(chunk, part file, offset, paths) lazily, creating each chunk's file when first reached."""
+        for c, paths in todo:
+            part = chunk_path(args.output, c, ".npy.part")
+            np.lib.format.open_memmap(part, mode="w+", dtype=np.float32, shape=(len(paths),) + shape).flush()
+            for offset in range(0, len(paths), args.batch):
+                yield c, part, offset, paths[offset:offset + args.batch]
+
+    progress = Progress(len(files), skipped, skipped_failed)
+    todo_paths = dict(todo)
+    remaining = {c: len(paths) for c, paths in todo}
+    errors = {c: {} for c, _ in todo}
+    source = batches()
+    in_flight = {}
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(args.reference, params)) as pool:
+        while True:
+            # Keep two batches per worker queued so no core waits, and no more than that in memory
+            while len(in_flight) < 2 * workers:
+                item = next(source, None)
+                if item is None:
+                    break
+                c, part, offset, paths = item
+                in_flight[pool.submit(_reconstruct_batch, part, offset, paths)] = (c, len(paths))
+            if not in_flight:
+                break
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                c, count = in_flight.pop(future)
+                failed = future.result()
+                errors[c].update(failed)
+                remaining[c] -= count
+                if remaining[c] == 0:
+                    finish_chunk(args.output, c, todo_paths[c], errors.pop(c))
+                progress.update(count, len(failed))
+    progress.update(0, 0, force=True)
+    return progress
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruct a directory of holograms into chunked .npy phase stacks")
+    parser.add_argument("input", help="directory of holograms (png/jpg/tif/bmp/npy)")
+    parser.add_argument("--reference", required=True, help="empty-field reference image")
+    parser.add_argument("--output", required=True, help="output directory; re-run with the same one to resume")
+    parser.add_argument("--chunk", type=int, default=CHUNK_FRAMES, help="frames per output file")
+    parser.add_argument("--batch", type=int, default=BATCH_FRAMES, help="holograms per worker call")
+    parser.add_argument("--workers", type=int, default=None, help="default: one per core")
+    # Same parameter set as the UI's /run_phase_difference form
+    parser.add_argument("--wavelength", type=float, default=0.65)
+    parser.add_argument("--pixel-size", dest="pixel_size", type=float, default=1.0)
+    parser.add_argument("--magnification", type=float, default=10)
+    parser.add_argument("--delta-ri", dest="delta_ri", type=float, default=1)
+    parser.add_argument("--dc-remove", dest="dc_remove", type=int, default=20)
+    parser.add_argument("--filter-type", dest="filter_type", choices=("circle", "square"), default="circle")
+    parser.add_argument("--filter-size", dest="filter_size", type=int, default=101)
+    parser.add_argument("--beam-type", dest="beam_type", default="1 Beam", help='"1 Beam" or "2 Beams"')
+    args = parser.parse_args(argv)
+    if args.chunk < 1 or args.batch < 1:
+        parser.error("--chunk and --batch must be at least 1")
+    progress = run(args)
+    if progress.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
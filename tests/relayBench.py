@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import io
+import time
+
+import aiohttp
+import socketio
+from PIL import Image
+
+import dispatcherClient
+from deviceFleet import SimulatedDevice, percentile
+from microscopeAgent import HologramSource
+
+# -----------------------------
+# Configuration
+# -----------------------------
+BROKER_URL = dispatcherClient.BROKER_URL
+FRAME_POOL = 30                   # distinct pre-encoded frames cycled by every stream
+
+
+# -----------------------------
+# Relay endpoints
+# -----------------------------
+class RelayViewer:
+    """An interface socket linked to one device, timing every relayed frame."""
+
+    def __init__(self, index, http, socket_http, broker_url):
+        self.index = index
+        self.http = http
+        self.broker_url = broker_url
+        self.sio = socketio.AsyncClient(reconnection=False, http_session=socket_http, handle_sigint=False)
+        self.interface_id = None
+        self.latencies = []
+        self.frames = 0
+        self.bytes = 0
+        self.gaps = 0
+        self.last_seq = None
+        self.recording = False
+        self.sio.on("device_frame", self.on_frame)
+
+    async def on_frame(self, meta, frame):
+        if not self.recording:
+            return
+        self.latencies.append(time.time() - meta["ts"])
+        self.frames += 1
+        self.bytes += len(frame)
+        if self.last_seq is not None and meta["seq"] > self.last_seq + 1:
+            self.gaps += meta["seq"] - self.last_seq - 1
+        self.last_seq = meta["seq"]
+
+    async def link(self, device):
+        payload = {"name": f"relay-bench-{self.index}", "email": f"relay-bench-{self.index}@example.com",
+                   "deviceCode": device.connection_code}
+        async with self.http.post(f"{self.broker_url}/api/register_interface", json=payload) as res:
+            if res.status != 200:
+                raise RuntimeError(f"register_interface {res.status}: {await res.text()}")
+            self.interface_id = (await res.json())["interface_id"]
+        await self.sio.connect(self.broker_url, transports=["websocket"])
+        linked = asyncio.get_running_loop().create_future()
+        self.sio.on("interface_connect_to_device_response", lambda data: linked.done() or linked.set_result(data))
+        await self.sio.emit("interface_connect_to_device",
+                            {"interfaceId": self.interface_id, "connectionCode": device.connection_code})
+        response = await asyncio.wait_for(linked, 10)
+        if response.get("error"):
+            raise RuntimeError(f"interface_connect_to_device: {response.get('message')}")
+
+
+async def stream_frames(device, frames, fps, stats):
+    """Push frames at `fps` once the dispatcher says an interface is watching."""
+    started = asyncio.Event()
+    device.sio.on("relay_start", lambda data: started.set())
+    await started.wait()
+    interval = 1.0 / fps
+    next_tick = time.monotonic()
+    seq = 0
+    while device.sio.connected:
+        seq += 1
+        if device.send_backlog() > 1:
+            stats["skipped"] += 1
+        else:
+            meta = {"deviceId": device.device_id, "seq": seq, "ts": time.time()}
+            t0 = time.perf_counter()
+            await device.sio.emit("device_frame", (meta, frames[seq % len(frames)]))
+            stats["emit"].append(time.perf_counter() - t0)
+            stats["sent"] += 1
+        next_tick += interval
+        await asyncio.sleep(max(0.0, next_tick - time.monotonic()))
+
+
+def encode_pool(width, height, quality):
+    source = HologramSource(width, height)
+    frames = []
+    for i in range(FRAME_POOL):
+        buf = io.BytesIO()
+        Image.fromarray(source.frame(i / 15)).save(buf, format="JPEG", quality=quality)
+        frames.append(buf.getvalue())
+    return frames
+
+
+async def relay_stats(http, broker_url):
+    async with http.get(f"{broker_url}/admin/relay") as res:
+        return await res.json()
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+async def run(args):
+    frames = encode_pool(args.width, args.height, args.quality)
+    frame_kb = sum(map(len, frames)) / len(frames) / 1024
+    print(f"[RELAY] {args.streams} streams x {args.fps} fps, {args.width}x{args.height} JPEG ~{frame_kb:.0f} KB")
+
+    async with dispatcherClient.async_session(limit=64) as http, \
+            aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as socket_http:
+        devices = [SimulatedDevice(i, http, socket_http, args.broker) for i in range(args.streams)]
+        await asyncio.gather(*(d.start() for d in devices))
+        failed = [d.error for d in devices if d.error]
+        if failed:
+            raise SystemExit(f"[RELAY] {len(failed)} devices failed to come up: {failed[0]}")
+
+        stats = {"sent": 0, "skipped": 0, "emit": []}
+        pushers = [asyncio.create_task(stream_frames(d, frames, args.fps, stats)) for d in devices]
+        viewers = [RelayViewer(i, http, socket_http, args.broker) for i in range(args.streams)]
+        try:
+            await asyncio.gather(*(v.link(d) for v, d in zip(viewers, devices)))
+            await asyncio.sleep(args.warmup)
+
+            before = await relay_stats(http, args.broker)
+            stats.update(sent=0, skipped=0, emit=[])
+            for v in viewers:
+                v.recording = True
+            t0 = time.perf_counter()
+            await asyncio.sleep(args.duration)
+            elapsed = time.perf_counter() - t0
+            for v in viewers:
+                v.recording = False
+            after = await relay_stats(http, args.broker)
+        finally:
+            for task in pushers:
+                task.cancel()
+            await asyncio.gather(*(d.stop() for d in devices), return_exceptions=True)
+            await asyncio.sleep(0.5)  # let in-flight frames land before the viewers go
+            await asyncio.gather(*(v.sio.disconnect() for v in viewers if v.sio.connected), return_exceptions=True)
+            for v in viewers:
+                if v.interface_id:
+                    await http.delete(f"{args.broker}/api/delete_interface/{v.interface_id}")
+            for d in devices:
+                if d.device_id:
+                    await http.delete(f"{args.broker}/api/delete_device/{d.device_id}")
+
+    latencies = [x for v in viewers for x in v.latencies]
+    received = sum(v.frames for v in viewers)
+    mbit = sum(v.bytes for v in viewers) * 8 / elapsed / 1e6
+    print(f"[RELAY] sent {stats['sent']} frames, delivered {received} "
+          f"({received / elapsed / args.streams:.1f} fps/stream, {mbit:.1f} Mbit/s), "
+          f"skipped at device {stats['skipped']}, gaps at viewer {sum(v.gaps for v in viewers)}")
+    if latencies:
+        print(f"[RELAY] added latency p50={percentile(latencies, 50) * 1000:.1f}ms "
+              f"p99={percentile(latencies, 99) * 1000:.1f}ms max={max(latencies) * 1000:.1f}ms")
+    if stats["emit"]:
+        print(f"[RELAY] device emit p50={percentile(stats['emit'], 50) * 1000:.2f}ms "
+              f"p99={percentile(stats['emit'], 99) * 1000:.2f}ms")
+    broker_ms = after["processCpuMs"] - before["processCpuMs"]
+    relay_ms = after["relayCpuMs"] - before["relayCpuMs"]
+    dropped = sum(s["dropped"] for s in after["sessions"]) - sum(s["dropped"] for s in before["sessions"])
+    print(f"[RELAY] broker CPU {broker_ms / elapsed / 10:.1f}% total, "
+          f"{broker_ms / elapsed / args.streams:.2f} ms/s per stream "
+          f"(relay path {relay_ms / elapsed / args.streams:.2f} ms/s), dropped in broker {dropped}")
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Measure the dispatcher frame relay with simulated agents and viewers")
+    parser.add_argument("--streams", type=int, default=10, help="device -> interface streams")
+    parser.add_argument("--fps", type=float, default=15)
+    parser.add_argument("--duration", type=float, default=20, help="seconds measured")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds before measuring")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--broker", default=BROKER_URL, help="dispatcher base URL")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
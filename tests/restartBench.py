@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import time
+
+import aiohttp
+
+import dispatcherClient
+from deviceFleet import DeviceGateway, SimulatedDevice, percentile
+from manifest import read_manifest
+
+# -----------------------------
+# Configuration
+# -----------------------------
+BROKER_URL = dispatcherClient.BROKER_URL
+MILESTONES = (50, 90, 99, 100)   # % of devices back online
+
+
+# -----------------------------
+# Fleet bring-up
+# -----------------------------
+async def register_rows(http, socket_http, count, broker_url, concurrency):
+    """Register `count` devices over HTTP only; gateways announce them on their own sockets."""
+    limit = asyncio.Semaphore(concurrency)
+    devices = [SimulatedDevice(i, http, socket_http, broker_url, reconnect=False) for i in range(count)]
+
+    async def one(device):
+        async with limit:
+            await device.register()
+
+    await asyncio.gather(*(one(d) for d in devices))
+    return [{"device_id": d.device_id, "connection_code": d.connection_code} for d in devices]
+
+
+async def bring_up(args, http, socket_http, rows):
+    """Connect the fleet: one socket per device, or gateways of --per-socket devices each."""
+    if args.per_socket > 1:
+        sockets = [DeviceGateway(i, rows[start:start + args.per_socket], socket_http, args.broker)
+                   for i, start in enumerate(range(0, len(rows), args.per_socket))]
+    else:
+        sockets = [SimulatedDevice(i, http, socket_http, args.broker, row) for i, row in enumerate(rows)]
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(s):
+        async with limit:
+            await s.start()
+
+    await asyncio.gather(*(one(s) for s in sockets))
+    failed = [s.error for s in sockets if s.error]
+    if failed:
+        raise SystemExit(f"[RESTART] {len(failed)} sockets failed to come up: {failed[0]}")
+    await wait_online(sockets, args.timeout)
+    return sockets
+
+
+async def wait_online(sockets, timeout):
+    deadline = time.perf_counter() + timeout
+    while any(s.online_at is None for s in sockets) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    return all(s.online_at is not None for s in sockets)
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+async def trigger_restart(args, sockets):
+    """Run --restart-cmd, or wait for someone to restart the dispatcher by hand."""
+    if args.restart_cmd:
+        print(f"[RESTART] running: {args.restart_cmd}")
+        proc = await asyncio.create_subprocess_shell(args.restart_cmd)
+        await proc.wait()
+        deadline = time.perf_counter() + args.timeout
+    else:
+        print("[RESTART] fleet online; restart the dispatcher now")
+        deadline = float("inf")
+    while not any(s.disconnected_at for s in sockets):
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"[RESTART ERROR] no socket dropped within {args.timeout}s of the restart command")
+        await asyncio.sleep(0.01)
+
+
+async def run(args):
+    async with dispatcherClient.async_session(limit=args.concurrency) as http, \
+            aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as socket_http:
+        if args.manifest:
+            rows = [r for r in read_manifest(args.manifest) if r.get("device_id")][:args.devices]
+            owned = []
+        else:
+            rows = owned = await register_rows(http, socket_http, args.devices, args.broker, args.concurrency)
+        per_socket = max(1, args.per_socket)
+        print(f"[RESTART] {len(rows)} devices, {per_socket} per socket")
+        sockets = await bring_up(args, http, socket_http, rows)
+        try:
+            await trigger_restart(args, sockets)
+            down = min(s.disconnected_at for s in sockets if s.disconnected_at)
+            recovered = await wait_online(sockets, args.timeout)
+            weight = {s: len(s.device_ids) if isinstance(s, DeviceGateway) else 1 for s in sockets}
+            back = sorted(t for s in sockets if s.online_at for t in [s.online_at - down] * weight[s])
+            total = sum(weight.values())
+            for pct in MILESTONES:
+                needed = max(1, -(-total * pct // 100))
+                at = f"{back[needed - 1]:.2f}s" if len(back) >= needed else "not reached"
+                print(f"[RESTART] {pct:>3}% online after {at}")
+            attempts = sum(s.attempts for s in sockets)
+            reconnects = sum(s.reconnects for s in sockets)
+            print(f"[RESTART] {reconnects}/{len(sockets)} sockets reconnected, {attempts} connect attempts, "
+                  f"{attempts - reconnects} failed, attempts per socket p50={percentile([s.attempts for s in sockets], 50)} "
+                  f"max={max(s.attempts for s in sockets)}")
+            if not recovered:
+                print(f"[RESTART ERROR] {total - len(back)} devices still offline after {args.timeout}s")
+        finally:
+            await asyncio.gather(*(s.stop() for s in sockets), return_exceptions=True)
+            for row in owned:
+                await http.delete(f"{args.broker}/api/delete_device/{row['device_id']}")
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Time how long a device fleet takes to come back after a dispatcher restart")
+    parser.add_argument("-n", "--devices", type=int, default=1000)
+    parser.add_argument("--per-socket", type=int, default=1, help="devices announced per socket (>1 uses gateways)")
+    parser.add_argument("--restart-cmd", help="shell command that restarts the dispatcher (default: wait for a manual restart)")
+    parser.add_argument("--concurrency", type=int, default=100, help="max registrations/connects in flight")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for the fleet to come back")
+    parser.add_argument("--broker", default=BROKER_URL, help="dispatcher base URL")
+    parser.add_argument("--manifest", help="reuse devices from a randomDevice.py --manifest file instead of registering")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import argparse
+import base64
+import json
+import math
+import struct
+import time
+import zlib
+
+import numpy as np
+
+# -----------------------------
+# Binary result format
+# -----------------------------
+# Negotiated alternative to JSON + base64 PNG for /run_phase_difference, /compute_1d,
+# /compute_3d and /timelapse/frame. A client opts in with
+#   Accept: application/x-phase-result      (or ?format=binary)
+# and may add ?dtype=float32|uint16, ?compress=deflate, ?preview=N and ?tile=ROW,COL&tile_size=N.
+# Without it the endpoints answer exactly as before.
+#
+# Layout (little endian):
+#   "PHR1" | uint32 header length | header JSON (utf-8) | zero padding to 8 bytes | array payloads
+# The header is {"meta": {...}, "arrays": [{name, dtype, shape, offset, length, codec, ...}]}.
+# Payload offsets are from the start of the message and 8-byte aligned, so an uncompressed
+# array is a zero-copy Float32Array / Uint16Array view in the browser.
+#
+# uint16 arrays are quantized over [min, max]: value = min + q * scale, with q = 65535 for NaN.
+# Array entries' "offset"/"length" are byte positions of the payload, not value offsets.
+# "deflate" is zlib level 1 over a byte-shuffled copy (all first bytes, then all second
+# bytes, ...), which is what makes float data compress; the browser inflates it with
+# DecompressionStream("deflate") and unshuffles.
+
+MAGIC = b"PHR1"
+CONTENT_TYPE = "application/x-phase-result"
+DTYPES = ("float32", "uint16")
+QUANT_MAX = 65534                 # uint16 codes for values; 65535 marks NaN
+NAN_CODE = 65535
+DEFLATE_LEVEL = 1                 # fastest zlib level; float payloads gain little from more
+
+
+def wants_binary(request):
+    """True when the client asked for the binary format (Accept header or ?format=binary)."""
+    return request.query.get("format") == "binary" or CONTENT_TYPE in request.headers.get("Accept", "")
+
+
+def options(query):
+    """Encoding options from the query string; raises ValueError on bad values."""
+    dtype = query.get("dtype", "float32")
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(DTYPES)}")
+    compress = query.get("compress", "none")
+    if compress not in ("none", "deflate"):
+        raise ValueError("compress must be none or deflate")
+    preview = int(query["preview"]) if query.get("preview") else None
+    tile = None
+    if query.get("tile"):
+        row, col = (int(v) for v in query["tile"].split(","))
+        tile = (row, col, int(query.get("tile_size", 256)))
+    return {"dtype": dtype, "compress": compress, "preview": preview, "tile": tile}
+
+
+# -----------------------------
+# Previews and tiles
+# -----------------------------
+def preview(array, size):
+    """Block-mean downsample of a 2D array to at most `size` samples per side."""
+    step = max(1, math.ceil(max(array.shape) / size))
+    if step == 1:
+        return array, 1
+    h, w = (array.shape[0] // step) * step, (array.shape[1] // step) * step
+    blocks = array[:h, :w].reshape(h // step, step, w // step, step)
+    return blocks.mean(axis=(1, 3), dtype=np.float32), step
+
+
+def tile(array, row, col, size):
+    """Full-resolution tile (row, col) of a 2D array on a `size` grid, plus its (y, x) origin."""
+    y, x = row * size, col * size
+    if not (0 <= y < array.shape[0] and 0 <= x < array.shape[1]):
+        raise ValueError(f"tile {row},{col} is outside {array.shape[0]}x{array.shape[1]}")
+    return array[y:y + size, x:x + size], (y, x)
+
+
+# -----------------------------
+# Encode / decode
+# -----------------------------
+def _shuffle(data, itemsize):
+    return np.frombuffer(data, np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def _unshuffle(data, itemsize):
+    return np.frombuffer(data, np.uint8).reshape(itemsize, -1).T.tobytes()
+
+
+def _encode_array(name, array, dtype, compress):
+    array = np.asarray(array, dtype=np.float32)
+    finite = array[np.isfinite(array)]
+    lo, hi = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 0.0)
+    entry = {"name": name, "shape": list(array.shape), "min": lo, "max": hi}
+    if dtype == "uint16":
+        scale = (hi - lo) / QUANT_MAX if hi > lo else 1.0
+        quantized = np.rint((array - lo) * np.float32(1 / scale))
+        quantized = np.nan_to_num(quantized, nan=NAN_CODE, posinf=QUANT_MAX, neginf=0)
+        data = np.clip(quantized, 0, NAN_CODE).astype("<u2")
+        entry.update(dtype="uint16", scale=scale, nan=NAN_CODE)
+    else:
+        data = array.astype("<f4", copy=False)
+        entry["dtype"] = "float32"
+    raw = np.ascontiguousarray(data).tobytes()
+    if compress == "deflate":
+        raw = zlib.compress(_shuffle(raw, data.itemsize), DEFLATE_LEVEL)
+        entry.update(codec="deflate", shuffle=data.itemsize)
+    else:
+        entry["codec"] = "none"
+    return entry, raw
+
+
+def encode(arrays, meta=None, dtype="float32", compress="none"):
+    """One message holding `arrays` (name -> ndarray) and a JSON-able `meta` dict."""
+    entries, payloads = [], []
+    for name, array in arrays.items():
+        entry, raw = _encode_array(name, array, dtype if np.ndim(array) > 1 else "float32", compress)
+        entries.append(entry)
+        payloads.append(raw)
+
+    # Offsets depend on the header length, which depends on the offsets: fix the header
+    # size by writing it with placeholder offsets first, then pad it to that size.
+    def header(start):
+        offset = start
+        for entry, raw in zip(entries, payloads):
+            entry["offset"] = offset
+            entry["length"] = len(raw)
+            offset += -(-len(raw) // 8) * 8
+        return json.dumps({"meta": meta or {}, "arrays": entries}, separators=(",", ":")).encode()
+
+    size = len(header(10 ** 12)) + 8
+    start = -(-size // 8) * 8
+    text = header(start).ljust(start - 8)
+    out = bytearray(MAGIC + struct.pack("<I", len(text)) + text)
+    for raw in payloads:
+        out += raw
+        out += bytes(-len(raw) % 8)
+    return bytes(out)
+
+
+def encode_result(arrays, meta, opts, image=None):
+    """encode() with the request's options; ?preview / ?tile replace the 2D `image` array."""
+    arrays, meta = dict(arrays), dict(meta)
+    if image is not None and opts["tile"] is not None:
+        arrays[image], meta["origin"] = tile(arrays[image], *opts["tile"])
+    elif image is not None and opts["preview"]:
+        arrays[image], meta["step"] = preview(arrays[image], opts["preview"])
+    return encode(arrays, meta, opts["dtype"], opts["compress"])
+
+
+def decode(message):
+    """(meta, {name: float32 ndarray}); uint16 arrays come back dequantized with NaNs restored."""
+    if message[:4] != MAGIC:
+        raise ValueError("Not a phase result message")
+    (length,) = struct.unpack_from("<I", message, 4)
+    header = json.loads(bytes(message[8:8 + length]))
+    arrays = {}
+    for entry in header["arrays"]:
+        raw = message[entry["offset"]:entry["offset"] + entry["length"]]
+        dtype = np.dtype("<u2" if entry["dtype"] == "uint16" else "<f4")
+        if entry["codec"] == "deflate":
+            raw = _unshuffle(zlib.decompress(raw), entry["shuffle"])
+        data = np.frombuffer(raw, dtype).reshape(entry["shape"])
+        if entry["dtype"] == "uint16":
+            values = data.astype(np.float32) * np.float32(entry["scale"]) + np.float32(entry["min"])
+            values[data == entry["nan"]] = np.nan
+            data = values
+        arrays[entry["name"]] = data
+    return header["meta"], arrays
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def _json_png(phase):
+    from phaseMap import png_base64
+
+    return json.dumps({"phase_image": png_base64(phase), "shape": list(phase.shape),
+                       "min": float(phase.min()), "max": float(phase.max())}).encode()
+
+
+def _json_png_decode(body):
+    import io
+
+    from PIL import Image
+
+    data = json.loads(body)
+    return np.asarray(Image.open(io.BytesIO(base64.b64decode(data["phase_image"]))))
+
+
+def _timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench(sizes, repeat, write=None):
+    from microscopeAgent import HologramSource
+    from phaseDifference import PhaseReconstructor, parse_params
+
+    print(f"{'size':>6} {'format':<22} {'bytes':>10} {'vs json':>8} {'encode ms':>10} {'decode ms':>10} {'max|err|':>9}")
+    for size in sizes:
+        source = HologramSource(size, size)
+        phase, _ = PhaseReconstructor().reconstruct(source.frame(1.0), source.frame(0, with_object=False),
+                                                    parse_params({}))
+        meta = {"shape": list(phase.shape)}
+        variants = [("json+png (8-bit)", lambda: _json_png(phase), _json_png_decode)]
+        for dtype in DTYPES:
+            for compress in ("none", "deflate"):
+                variants.append((f"{dtype}/{compress}",
+                                 lambda d=dtype, c=compress: encode({"phase": phase}, meta, d, c),
+                                 lambda body: decode(body)[1]["phase"]))
+        variants.append(("uint16/deflate preview", lambda: encode({"phase": preview(phase, 256)[0]}, meta,
+                                                                    "uint16", "deflate"),
+                         lambda body: decode(body)[1]["phase"]))
+        baseline = None
+        for label, encoder, decoder in variants:
+            encode_s, body = _timed(encoder, repeat)
+            decode_s, decoded = _timed(lambda: decoder(body), repeat)
+            baseline = baseline or len(body)
+            if label.startswith("json"):
+                span = float(phase.max() - phase.min())
+                error = float(np.abs(decoded / 255.0 * span + phase.min() - phase).max())
+            elif "preview" in label:
+                error = float("nan")
+            else:
+                error = float(np.abs(decoded - phase).max())
+            print(f"{size:>6} {label:<22} {len(body):>10} {len(body) / baseline:>7.2f}x "
+                  f"{encode_s * 1000:>10.2f} {decode_s * 1000:>10.2f} {error:>9.2e}")
+            if write and not label.startswith("json"):
+                with open(f"{write}/phase-{size}-{label.replace('/', '-').replace(' ', '-')}.bin", "wb") as f:
+                    f.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Result payload size and encode/decode time: JSON+PNG vs binary")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--write", default=None, help="directory to save binary payloads for the JS decoder bench")
+    args = parser.parse_args()
+    bench(args.sizes, args.repeat, args.write)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import threading
+import time
+
+import dispatcherClient
+
+# -----------------------------
+# Configuration
+# -----------------------------
+RESYNC_INTERVAL = 120  # seconds between fallback resyncs
+PAGE_SIZE = 1000       # rows per page on a full load
+TABLES = (             # kind, admin path, key column
+    ("device", "/admin/devices", "device_id"),
+    ("interface", "/admin/interfaces", "interface_id"),
+    ("session", "/admin/sessions", "device_id"),
+)
+
+
+class SessionCache:
+    """In-memory mirror of the dispatcher's devices, interfaces and sessions.
+
+    Loads the three admin tables once in pages, then follows the broadcast socket
+    events; later reloads only ask for changes since the last version seen.
+    `on_change(kind, key, row)` is called once per row that actually changed,
+    with `row=None` for removals; kind is "device", "interface" or "session".
+    `by_code` indexes device rows by connection code.
+    """
+
+    def __init__(self, sio, on_change=None, resync_interval=RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self.on_change = on_change or (lambda kind, key, row: None)
+        self.devices = {}     # device_id -> device row
+        self.interfaces = {}  # interface_id -> interface row
+        self.sessions = {}    # device_id -> session row
+        self.by_code = {}     # connection_code -> device row
+        self.versions = {}    # kind -> version token of the last load
+        self.lock = threading.RLock()
+        self._bind(sio)
+
+    # -----------------------------
+    # Full (re)load
+    # -----------------------------
+    def _fetch(self, path, **kwargs):
+        res = dispatcherClient.get(path, timeout=10, **kwargs)
+        if res.status_code not in (304, 410):
+            res.raise_for_status()
+        return res
+
+    def _fetch_all(self, path):
+        """Walk the keyset pages; returns (rows, version at the first page)."""
+        rows, cursor, version = [], "", None
+        while True:
+            data = self._fetch(path, params={"cursor": cursor, "limit": PAGE_SIZE}).json()
+            rows.extend(data["rows"])
+            version = version or data["version"]
+            cursor = data["next"]
+            if cursor is None:
+                return rows, version
+
+    def load(self):
+        """Bring all three tables up to date: deltas when possible, a paged full load otherwise."""
+        for kind, path, key in TABLES:
+            version = self.versions.get(kind)
+            if version is not None and self._load_delta(kind, path, version):
+                continue
+            rows, version = self._fetch_all(path)
+            fresh = {row[key]: row for row in rows if row.get(key)}
+            with self.lock:
+                self._replace(kind, self._table(kind), fresh)
+                self.versions[kind] = version
+
+    def _load_delta(self, kind, path, version):
+        res = self._fetch(path, params={"since": version}, headers={"If-None-Match": f'W/"{version}"'})
+        if res.status_code == 304:
+            return True
+        if res.status_code == 410:  # dispatcher restarted or we fell too far behind
+            return False
+        data = res.json()
+        table = self._table(kind)
+        with self.lock:
+            for change in data["changes"]:
+                if change["row"] is None:
+                    self._drop(kind, table, change["key"])
+                else:
+                    self._set(kind, table, change["key"], change["row"])
+            self.versions[kind] = data["version"]
+        return True
+
+    def _table(self, kind):
+        return {"device": self.devices, "interface": self.interfaces, "session": self.sessions}[kind]
+
+    def _replace(self, kind, table, fresh):
+        for key in [k for k in table if k not in fresh]:
+            self._drop(kind, table, key)
+        for key, row in fresh.items():
+            self._set(kind, table, key, row)
+
+    def _resync_loop(self):
+        while True:
+            time.sleep(self.resync_interval)
+            try:
+                self.load()
+            except Exception as e:
+                print(f"[CACHE] Resync failed: {e}")
+
+    def start_resync(self):
+        threading.Thread(target=self._resync_loop, daemon=True).start()
+
+    # -----------------------------
+    # Incremental updates
+    # -----------------------------
+    def _set(self, kind, table, key, row):
+        if table.get(key) != row:
+            old = table.get(key)
+            table[key] = row
+            if kind == "device":
+                if old is not None:
+                    self.by_code.pop(old.get("connection_code"), None)
+                self.by_code[row.get("connection_code")] = row
+            self.on_change(kind, key, row)
+
+    def _drop(self, kind, table, key):
+        old = table.pop(key, None)
+        if old is not None:
+            if kind == "device":
+                self.by_code.pop(old.get("connection_code"), None)
+            self.on_change(kind, key, None)
+
+    def forget_session(self, device_id):
+        """Drop a session locally without waiting for device_disconnected."""
+        with self.lock:
+            self._drop("session", self.sessions, device_id)
+
+    def unlink_interface(self, interface_id):
+        """Clear `interface_id` from whichever session it is linked to."""
+        with self.lock:
+            for device_id, session in list(self.sessions.items()):
+                if session.get("interface_id") == interface_id:
+                    self._set("session", self.sessions, device_id, {**session, "interface_id": None})
+
+    def _bind(self, sio):
+        @sio.on("device_registered")
+        def device_registered(row):
+            with self.lock:
+                self._set("device", self.devices, row["device_id"], row)
+
+        @sio.on("device_deleted")
+        def device_deleted(data):
+            with self.lock:
+                self._drop("session", self.sessions, data["deviceId"])
+                self._drop("device", self.devices, data["deviceId"])
+
+        @sio.on("device_connected")
+        def device_connected(data):
+            with self.lock:
+                device_id = data["deviceId"]
+                if device_id not in self.sessions:
+                    self._set("session", self.sessions, device_id, {"device_id": device_id, "interface_id": None})
+
+        @sio.on("devices_connected")
+        def devices_connected(data):
+            with self.lock:
+                for device_id in data["deviceIds"]:
+                    if device_id not in self.sessions:
+                        self._set("session", self.sessions, device_id, {"device_id": device_id, "interface_id": None})
+
+        @sio.on("device_disconnected")
+        def device_disconnected(data):
+            with self.lock:
+                self._drop("session", self.sessions, data["deviceId"])
+
+        @sio.on("interface_registered")
+        def interface_registered(row):
+            with self.lock:
+                self._set("interface", self.interfaces, row["interface_id"], row)
+
+        @sio.on("interface_deleted")
+        def interface_deleted(data):
+            with self.lock:
+                self.unlink_interface(data["interfaceId"])
+                self._drop("interface", self.interfaces, data["interfaceId"])
+
+        @sio.on("interface_connected")
+        def interface_connected(data):
+            with self.lock:
+                session = self.sessions.get(data["deviceId"])
+                if session is not None:
+                    self._set("session", self.sessions, data["deviceId"], {**session, "interface_id": data["interfaceId"]})
+
+        @sio.on("interface_disconnected")
+        def interface_disconnected(data):
+            self.unlink_interface(data["interfaceId"])
@@ -0,0 +1,489 @@
+import argparse
+import asyncio
+import collections
+import csv
+import itertools
+import math
+import signal
+import statistics
+import sys
+import time
+import uuid
+
+import aiohttp
+import socketio
+
+import dispatcherClient
+from deviceFleet import SimulatedDevice
+from loadTest import LatencyHistogram
+from randomInterface import generate_random_name_email
+
+# -----------------------------
+# Configuration
+# -----------------------------
+BROKER_URL = dispatcherClient.BROKER_URL
+STEPS = ("register", "connect", "link", "unlink", "disconnect", "delete")
+RESPONSE_TIMEOUT = 10     # s to wait for interface_connect_to_device_response / acks
+WINDOWS = 5               # post-warmup samples are split into this many windows for the growth check
+SETTLE_SECONDS = 30       # s the final audit waits for the write-behind and socket closes
+RECENT_DELETED = 200      # deleted device ids kept for the final lookup check
+ERROR_KINDS = 50          # distinct error messages counted separately
+
+# Series checked for growth, as (relative, absolute, per device) margins: a series fails when
+# its window medians rise in every window and by more than max(relative x first window,
+# absolute + per device x --devices). The per-device term covers cycles in flight, each of
+# which holds up to two sockets, one session and a few index entries at any moment.
+GROWTH = {
+    "rss_bytes": (0.10, 16 * 2 ** 20, 0),
+    "heap_bytes": (0.10, 8 * 2 ** 20, 0),
+    "open_fds": (0, 4, 2),
+    "handles": (0, 4, 2),
+    "sockets": (0, 4, 2),
+    "sessions": (0, 4, 1),
+    "session_rows": (0, 4, 1),
+    "device_rows": (0, 4, 1),
+    "interface_rows": (0, 4, 1),
+    "cycle_p99_ms": (0.5, 20, 0),
+}
+INDEX_GROWTH = (0, 4, 2)  # every index_entries series except the journals, which are capped
+
+# Session churn against a live dispatcher (and its database), for hours:
+#
+#   python soak.py --devices 20 --duration 4h --csv soak.csv
+#
+# Each of --devices slots loops register -> connect -> link an interface
+# (interface_connect_to_device) -> unlink it -> disconnect -> delete the interface and the
+# device, the same events device.py's start_socket_thread(), disconnect_interface() and
+# disconnect() send. Even cycles send device_disconnect_from_dispatcher before closing the
+# socket; odd ones just drop it, so the dispatcher's "disconnect" handler is churned too.
+# Every --sample-interval the dispatcher's /metrics and /admin/audit are sampled. After
+# --warmup, any series that keeps rising fails the run, as does a session whose socket is
+# gone seen in two audits running. At the end the row counts and index sizes must be back
+# at their values from before the first cycle, so point it at a dispatcher nothing else uses.
+
+
+def parse_duration(text):
+    """Seconds from "90", "90s", "15m" or "4h"."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def parse_metrics(text):
+    """{series: value} from Prometheus text; labelled series are also summed under the bare name."""
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        try:
+            value = float(value)
+        except ValueError:
+            continue
+        values[series] = value
+        name = series.split("{", 1)[0]
+        if name != series:
+            values[name] = values.get(name, 0.0) + value
+    return values
+
+
+# -----------------------------
+# Lifecycle cycles
+# -----------------------------
+class CycleStats:
+    """Cycle latencies per sample interval and in total, plus errors by message."""
+
+    def __init__(self):
+        self.cycles = 0
+        self.errors = collections.Counter()
+        self.total = LatencyHistogram()
+        self.steps = {step: LatencyHistogram() for step in STEPS}
+        self.interval = LatencyHistogram()
+        self.deleted = collections.deque(maxlen=RECENT_DELETED)
+
+    def record(self, seconds, timings):
+        self.cycles += 1
+        self.total.record(seconds)
+        self.interval.record(seconds)
+        for step, value in timings.items():
+            self.steps[step].record(value)
+
+    def fail(self, error):
+        # Messages can carry ids; past ERROR_KINDS distinct ones they share a bucket, so hours
+        # of failures don't grow the soak's own memory
+        if error not in self.errors and len(self.errors) >= ERROR_KINDS:
+            error = "(other errors)"
+        self.errors[error] += 1
+
+    def take_interval(self):
+        interval, self.interval = self.interval, LatencyHistogram()
+        return interval
+
+
+class Churner:
+    """One simulated device slot cycling through the whole session lifecycle."""
+
+    def __init__(self, index, http, socket_http, broker_url, stats):
+        self.index = index
+        self.http = http
+        self.socket_http = socket_http
+        self.broker_url = broker_url
+        self.stats = stats
+
+    async def _json(self, method, path, **kwargs):
+        async with self.http.request(method, f"{self.broker_url}{path}", **kwargs) as res:
+            if res.status != 200:
+                raise RuntimeError(f"{method} {dispatcherClient.endpoint_label(path)} {res.status}: {await res.text()}")
+            return await res.json()
+
+    async def register_interface(self, device_code):
+        name, _ = generate_random_name_email()
+        row = await self._json("POST", "/api/register_interface",
+                               json={"name": name, "email": f"soak-{uuid.uuid4().hex[:12]}@example.com",
+                                     "deviceCode": device_code})
+        return row["interface_id"]
+
+    async def link(self, interface, interface_id, connection_code):
+        """Connect the interface socket and link it; raises on an error response."""
+        response = asyncio.get_running_loop().create_future()
+        interface.on("interface_connect_to_device_response",
+                     lambda data: response.done() or response.set_result(data))
+        await interface.connect(self.broker_url, transports=["websocket"])
+        await interface.emit("interface_connect_to_device",
+                             {"interfaceId": interface_id, "connectionCode": connection_code})
+        data = await asyncio.wait_for(response, RESPONSE_TIMEOUT)
+        if data.get("error"):
+            raise RuntimeError(f"interface_connect_to_device: {data.get('message')}")
+
+    async def cycle(self, number):
+        """One register .. delete pass; per-step seconds. Whatever it created is torn down on failure."""
+        device = SimulatedDevice(self.index, self.http, self.socket_http, self.broker_url, reconnect=False)
+        interface = socketio.AsyncClient(reconnection=False, http_session=self.socket_http, handle_sigint=False)
+        interface_id = None
+        timings = {}
+        mark = time.perf_counter()
+
+        def lap(step):
+            nonlocal mark
+            now = time.perf_counter()
+            timings[step] = now - mark
+            mark = now
+
+        try:
+            await device.register()
+            lap("register")
+            await device.connect()
+            lap("connect")
+            interface_id = await self.register_interface(device.connection_code)
+            await self.link(interface, interface_id, device.connection_code)
+            lap("link")
+            # Sent over the device socket, as device.py's disconnect_interface() does
+            await device.sio.call("interface_disconnect_from_dispatcher", {"interfaceId": interface_id},
+                                  timeout=RESPONSE_TIMEOUT)
+            await interface.disconnect()
+            lap("unlink")
+            if number % 2 == 0:
+                await device.sio.emit("device_disconnect_from_dispatcher", {"deviceId": device.device_id})
+            await device.stop()
+            lap("disconnect")
+            await self._json("DELETE", f"/api/delete_interface/{interface_id}")
+            interface_id = None
+            await self._json("DELETE", f"/api/delete_device/{device.device_id}")
+            self.stats.deleted.append(device.device_id)
+            device.device_id = None
+            lap("delete")
+            return timings
+        finally:
+            if interface.connected:
+                await interface.disconnect()
+            await device.stop()
+            for path in ([f"/api/delete_interface/{interface_id}"] if interface_id else []) + \
+                        ([f"/api/delete_device/{device.device_id}"] if device.device_id else []):
+                try:
+                    await self._json("DELETE", path)
+                except Exception as e:
+                    print(f"[SOAK] cleanup of {path} failed, the audit will count it: {e}")
+
+    async def run(self, stop, pause):
+        for number in itertools.count():
+            if stop.is_set():
+                return
+            started = time.perf_counter()
+            try:
+                timings = await self.cycle(number)
+                self.stats.record(time.perf_counter() - started, timings)
+            except Exception as e:
+                self.stats.fail(f"{type(e).__name__}: {e}")
+            if pause:
+                await asyncio.sleep(pause)
+
+
+# -----------------------------
+# Sampling
+# -----------------------------
+async def fetch_audit(http, broker_url):
+    async with http.get(f"{broker_url}/admin/audit") as res:
+        return await res.json() if res.status == 200 else None
+
+
+async def take_sample(http, broker_url, stats, started):
+    """One row of dispatcher and cycle figures; None for anything the dispatcher doesn't export."""
+    async with http.get(f"{broker_url}/metrics") as res:
+        m = parse_metrics(await res.text())
+    audit = await fetch_audit(http, broker_url) or {}
+    rows = audit.get("rows", {})
+    interval = stats.take_interval()
+    p50, p99 = interval.percentile(50), interval.percentile(99)
+    sample = {
+        "elapsed_s": round(time.monotonic() - started, 1),
+        "cycles": stats.cycles,
+        "errors": sum(stats.errors.values()),
+        "cycle_p50_ms": p50 * 1000 if p50 is not None else None,
+        "cycle_p99_ms": p99 * 1000 if p99 is not None else None,
+        "rss_bytes": m.get("process_resident_memory_bytes"),
+        "heap_bytes": m.get("nodejs_heap_used_bytes"),
+        "open_fds": m.get("process_open_fds"),
+        "handles": m.get("nodejs_active_resources"),
+        "sockets": m.get("socket_connections"),
+        "sessions": m.get("device_sessions"),
+        "pending_writes": m.get("routing_pending_writes"),
+        "session_rows": rows.get("sessions"),
+        "device_rows": rows.get("devices"),
+        "interface_rows": rows.get("interfaces"),
+        "orphan_sessions": audit.get("orphans", {}).get("sessionsWithoutSocket"),
+        "orphan_rows": rows.get("sessions_without_device"),
+    }
+    for series, value in m.items():
+        if series.startswith('index_entries{index="'):
+            sample["index:" + series[len('index_entries{index="'):-2]] = value
+    return sample, audit
+
+
+def megabytes(value):
+    return f"{value / 2 ** 20:.1f}MB" if value is not None else "-"
+
+
+def amount(series, value):
+    return megabytes(value) if series.endswith("_bytes") else f"{value:.0f}"
+
+
+def print_sample(s, previous):
+    rate = (s["cycles"] - previous["cycles"]) / max(1e-9, s["elapsed_s"] - previous["elapsed_s"]) if previous else 0.0
+    fmt = lambda v: "-" if v is None else (f"{v:.0f}" if isinstance(v, float) else str(v))
+    print(f"[SOAK] {time.strftime('%H:%M:%S', time.gmtime(s['elapsed_s']))} cycles={s['cycles']} ({rate:.1f}/s) "
+          f"err={s['errors']} p50={fmt(s['cycle_p50_ms'])}ms p99={fmt(s['cycle_p99_ms'])}ms "
+          f"rss={megabytes(s['rss_bytes'])} heap={megabytes(s['heap_bytes'])} fds={fmt(s['open_fds'])} "
+          f"sockets={fmt(s['sockets'])} sessions={fmt(s['sessions'])}/{fmt(s['session_rows'])} rows "
+          f"orphans={fmt(s['orphan_sessions'])}", flush=True)
+
+
+# -----------------------------
+# Leak checks
+# -----------------------------
+def rising(values, windows=WINDOWS):
+    """(first, last) window medians when each window's median is above the one before, else None."""
+    values = [v for v in values if v is not None and math.isfinite(v)]
+    if len(values) < 2 * windows:
+        return None
+    size = len(values) // windows
+    medians = [statistics.median(values[i * size:(i + 1) * size]) for i in range(windows)]
+    if all(b > a for a, b in zip(medians, medians[1:])):
+        return medians[0], medians[-1]
+    return None
+
+
+def slope_per_hour(samples, series):
+    points = [(s["elapsed_s"], s[series]) for s in samples
+              if s.get(series) is not None and math.isfinite(s[series])]
+    if len(points) < 3 or len({t for t, _ in points}) < 2:
+        return None
+    return statistics.linear_regression(*zip(*points)).slope * 3600
+
+
+def growth_failures(samples, warmup, devices):
+    """Series still climbing after warmup, as messages."""
+    steady = [s for s in samples if s["elapsed_s"] >= warmup]
+    if len(steady) < 2 * WINDOWS:
+        print(f"[SOAK] only {len(steady)} samples after warmup; growth needs {2 * WINDOWS}, skipped")
+        return []
+    failures = []
+    for series in sorted({k for s in steady for k in s}):
+        if series in GROWTH:
+            margins = GROWTH[series]
+        elif series.startswith("index:") and not series.startswith("index:journal."):
+            margins = INDEX_GROWTH
+        else:
+            continue
+        values = [s.get(series) for s in steady]
+        if all(v is None for v in values):
+            print(f"[SOAK] {series} not exported by the dispatcher, not checked")
+            continue
+        window = rising(values)
+        if window is None:
+            continue
+        first, last = window
+        relative, absolute, per_device = margins
+        if last - first > max(relative * abs(first), absolute + per_device * devices):
+            slope = slope_per_hour(steady, series)
+            failures.append(f"{series} rose in every window: {amount(series, first)} -> {amount(series, last)}"
+                            + (f" ({amount(series, slope)}/h)" if slope is not None else ""))
+    return failures
+
+
+async def settle(http, broker_url, baseline):
+    """Audit once the write-behind is empty and the indexes are back at baseline, or after SETTLE_SECONDS."""
+    deadline = time.monotonic() + SETTLE_SECONDS
+    while True:
+        audit = await fetch_audit(http, broker_url)
+        settled = audit is not None and audit["routing"]["pending"] == 0 and all(
+            audit["indexes"].get(k) == v for k, v in baseline["indexes"].items() if not k.startswith("journal."))
+        if settled or time.monotonic() >= deadline:
+            await asyncio.sleep(1)  # a flush taken off the dirty map may still be writing
+            return await fetch_audit(http, broker_url)
+        await asyncio.sleep(1)
+
+
+async def final_failures(http, broker_url, baseline, deleted):
+    """Anything the churn left behind once everything it created has been deleted."""
+    audit = await settle(http, broker_url, baseline)
+    if audit is None:
+        return ["/admin/audit stopped answering; nothing could be checked after the run"]
+    failures = []
+    for table in ("devices", "interfaces", "sessions", "sessions_without_device", "interfaces_without_device"):
+        before, after = baseline["rows"][table], audit["rows"][table]
+        if after != before:
+            failures.append(f"{table} rows {before} before the run, {after} after")
+    for index, before in baseline["indexes"].items():
+        after = audit["indexes"].get(index)
+        if not index.startswith("journal.") and after != before:
+            failures.append(f"index {index} held {before} entries before the run, {after} after")
+    before, after = baseline["orphans"]["sessionsWithoutSocket"], audit["orphans"]["sessionsWithoutSocket"]
+    if after > before:
+        new = [d for d in audit["orphans"]["deviceIds"] if d not in baseline["orphans"]["deviceIds"]]
+        failures.append(f"{after - before} more sessions on closed sockets than before the run, e.g. {new[:5]}")
+    lingering = []
+    for device_id in deleted:
+        async with http.get(f"{broker_url}/admin/session/{device_id}") as res:
+            if res.status != 404:
+                lingering.append(device_id)
+    if lingering:
+        failures.append(f"{len(lingering)}/{len(deleted)} recently deleted devices still have a session, "
+                        f"e.g. {lingering[:5]}")
+    return failures
+
+
+# -----------------------------
+# Soak runner
+# -----------------------------
+async def soak(devices, duration, warmup, interval, pause, max_error_rate, broker_url=BROKER_URL, csv_path=None):
+    """Churn for `duration` seconds; returns the list of failures (empty when clean)."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows: Ctrl+C ends the run without the final audit
+            pass
+
+    socket_connector = aiohttp.TCPConnector(limit=0)
+    async with dispatcherClient.async_session(limit=devices * 2 + 4) as http, \
+            aiohttp.ClientSession(connector=socket_connector) as socket_http:
+        baseline = await fetch_audit(http, broker_url)
+        if baseline is None:
+            raise SystemExit(f"[SOAK] {broker_url}/admin/audit is not available; the soak needs it for row counts")
+        print(f"[SOAK] baseline: {baseline['rows']}, {baseline['routing']['sessions']} sessions, "
+              f"{baseline['sockets']} sockets")
+
+        stats = CycleStats()
+        workers = [asyncio.create_task(Churner(i, http, socket_http, broker_url, stats).run(stop, pause))
+                   for i in range(devices)]
+        started = time.monotonic()
+        samples, failures = [], []
+        suspects = set()     # sessions on closed sockets in the previous audit
+        reported = set()
+        writer = out = None
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=interval)
+                except asyncio.TimeoutError:
+                    pass
+                if time.monotonic() - started >= duration:
+                    stop.set()
+                try:
+                    sample, audit = await take_sample(http, broker_url, stats, started)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    print(f"[SOAK] sample failed: {type(e).__name__}: {e}")
+                    continue
+                print_sample(sample, samples[-1] if samples else None)
+                samples.append(sample)
+                if csv_path:
+                    if writer is None:
+                        out = open(csv_path, "w", newline="")
+                        writer = csv.DictWriter(out, fieldnames=list(sample), extrasaction="ignore")
+                        writer.writeheader()
+                    writer.writerow(sample)
+                    out.flush()
+                orphans = set(audit.get("orphans", {}).get("deviceIds", []))
+                for device_id in sorted((orphans & suspects) - reported):
+                    failures.append(f"session for {device_id} outlived its socket across two audits")
+                    print(f"[SOAK] orphaned session {device_id}")
+                    reported.add(device_id)
+                suspects = orphans
+        finally:
+            stop.set()
+            await asyncio.gather(*workers, return_exceptions=True)
+            if out is not None:
+                out.close()
+
+        print(f"[SOAK] {stats.cycles} cycles in {time.monotonic() - started:.0f}s, "
+              f"{sum(stats.errors.values())} failed")
+        for step, histogram in [("cycle", stats.total)] + list(stats.steps.items()):
+            if histogram.count:
+                print(f"[SOAK] {step:<10} p50={histogram.percentile(50) * 1000:.1f}ms "
+                      f"p99={histogram.percentile(99) * 1000:.1f}ms max={histogram.max * 1000:.1f}ms")
+        for error, n in stats.errors.most_common(10):
+            print(f"[SOAK ERROR] x{n} {error}")
+        for series in ("rss_bytes", "heap_bytes", "open_fds", "sockets", "session_rows"):
+            slope = slope_per_hour([s for s in samples if s["elapsed_s"] >= warmup], series)
+            if slope is not None:
+                print(f"[SOAK] {series:<14} trend {'+' if slope >= 0 else ''}{amount(series, slope)}/h")
+
+        errors = sum(stats.errors.values())
+        if errors > max_error_rate * (stats.cycles + errors):
+            failures.append(f"{errors} of {stats.cycles + errors} cycles failed")
+        failures += growth_failures(samples, warmup, devices)
+        failures += await final_failures(http, broker_url, baseline, list(stats.deleted))
+        return failures
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Session-churn soak test with leak and orphan detection")
+    parser.add_argument("-n", "--devices", type=int, default=10, help="simulated devices cycling at the same time")
+    parser.add_argument("--duration", type=parse_duration, default="2h", help="run time: seconds, or 90s/15m/4h")
+    parser.add_argument("--warmup", type=parse_duration, default="10m",
+                        help="left out of the growth check while caches and pools fill")
+    parser.add_argument("--sample-interval", type=parse_duration, default="15s", help="time between samples")
+    parser.add_argument("--pause", type=float, default=0, help="seconds each device waits between cycles")
+    parser.add_argument("--max-error-rate", type=float, default=0.001, help="failed cycles allowed, as a fraction")
+    parser.add_argument("--csv", help="write every sample to this file")
+    parser.add_argument("--broker", default=BROKER_URL, help="dispatcher base URL")
+    args = parser.parse_args(argv)
+
+    print(f"[SOAK] {args.devices} devices for {args.duration:.0f}s against {args.broker}, "
+          f"sampling every {args.sample_interval:.0f}s after {args.warmup:.0f}s warmup")
+    failures = asyncio.run(soak(args.devices, args.duration, args.warmup, args.sample_interval, args.pause,
+                                args.max_error_rate, args.broker, args.csv))
+    for failure in failures:
+        print(f"[SOAK FAIL] {failure}")
+    if failures:
+        sys.exit(1)
+    print("[SOAK] no growth or orphaned sessions found")
+
+
+if __name__ == "__main__":
+    main()
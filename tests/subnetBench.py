@@ -0,0 +1,141 @@
+import argparse
+import random
+import time
+
+import dispatcherClient
+from deviceFleet import percentile
+from subnetIndex import SubnetIndex, is_public, overlaps, parse_cidr
+
+# -----------------------------
+# Configuration
+# -----------------------------
+PREFIX_LENGTHS = (16, 24, 24, 24, 24, 28)   # mostly /24 like random_subnet(), some wider and narrower
+
+
+# -----------------------------
+# Synthetic fleet
+# -----------------------------
+def random_subnets(count, rng):
+    """`count` distinct subnets packed into a few /8s so that many of them nest or overlap."""
+    subnets = set()
+    while len(subnets) < count:
+        length = rng.choice(PREFIX_LENGTHS)
+        address = f"{rng.randint(10, 13)}.{rng.randint(0, 15)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+        subnets.add(f"{address}/{length}")
+    return sorted(subnets)
+
+
+def random_rows(count, subnets, public_fraction, rng):
+    return [{"device_id": f"dev-{i}", "connection_code": f"C{i:07d}", "type": "microscope",
+             "subnet": rng.choice(subnets), "is_public": rng.random() < public_fraction}
+            for i in range(count)]
+
+
+def scan_visible(parsed, subnet):
+    """The full-table filter the index replaces, over (row, parsed subnet, public) tuples."""
+    client = parse_cidr(subnet)
+    return [row for row, cidr, public in parsed if public or overlaps(client, cidr)]
+
+
+def client_subnets(subnets, count, rng):
+    """Mix of registered subnets and single client addresses inside them."""
+    out = []
+    for _ in range(count):
+        subnet = rng.choice(subnets)
+        if rng.random() < 0.5:
+            out.append(subnet)
+        else:
+            address, length = parse_cidr(subnet)
+            host = address + rng.randrange(2 ** (32 - length))
+            out.append(".".join(str((host >> s) & 255) for s in (24, 16, 8, 0)))
+    return out
+
+
+# -----------------------------
+# Benchmark
+# -----------------------------
+def run_local(args):
+    rng = random.Random(args.seed)
+    subnets = random_subnets(args.subnets, rng)
+    print(f"[SUBNET] {args.subnets} subnets, {args.queries} lookups per size, "
+          f"{args.public * 100:.1f}% public")
+    for count in args.devices:
+        rows = random_rows(count, subnets, args.public, rng)
+        index = SubnetIndex()
+        t0 = time.perf_counter()
+        for row in rows:
+            index.add(row)
+        build = time.perf_counter() - t0
+
+        parsed = [(r, parse_cidr(r["subnet"]), is_public(r["is_public"])) for r in rows]
+        clients = client_subnets(subnets, args.queries, rng)
+        indexed, scanned, results = [], [], []
+        for i, client in enumerate(clients):
+            t0 = time.perf_counter()
+            visible = index.visible(client)
+            indexed.append(time.perf_counter() - t0)
+            results.append(len(visible))
+            if i < args.verify:
+                t0 = time.perf_counter()
+                expected = scan_visible(parsed, client)
+                scanned.append(time.perf_counter() - t0)
+                if {r["device_id"] for r in visible} != {r["device_id"] for r in expected}:
+                    raise SystemExit(f"[SUBNET ERROR] index and scan disagree for {client}")
+
+        # Incremental churn: delete and re-register 1% of the fleet
+        churn = rng.sample(rows, max(1, count // 100))
+        t0 = time.perf_counter()
+        for row in churn:
+            index.remove(row["device_id"])
+        for row in churn:
+            index.add(dict(row, subnet=rng.choice(subnets)))
+        update = (time.perf_counter() - t0) / (2 * len(churn))
+
+        per_result = sum(indexed) / max(1, sum(results))
+        print(f"[SUBNET] {count:>7} devices  build {build * 1000:7.1f}ms  {index.nodes} nodes  "
+              f"results p50={percentile(results, 50)}  "
+              f"index p50={percentile(indexed, 50) * 1000:.3f}ms p99={percentile(indexed, 99) * 1000:.3f}ms "
+              f"({per_result * 1e6:.2f}us/result)  "
+              f"scan p50={percentile(scanned, 50) * 1000:.2f}ms  update {update * 1e6:.1f}us")
+
+
+def run_broker(args):
+    """Time /api/visible_devices for random client subnets against a running dispatcher."""
+    rng = random.Random(args.seed)
+    rows = dispatcherClient.get("/admin/devices", timeout=30).json()
+    subnets = sorted({r["subnet"] for r in rows if parse_cidr(r.get("subnet"))})
+    if not subnets:
+        raise SystemExit("[SUBNET] no devices with CIDR subnets registered")
+    latencies, results = [], []
+    for client in client_subnets(subnets, args.queries, rng):
+        t0 = time.perf_counter()
+        res = dispatcherClient.get("/api/visible_devices", params={"subnet": client}, endpoint="/api/visible_devices")
+        latencies.append(time.perf_counter() - t0)
+        res.raise_for_status()
+        results.append(res.json()["count"])
+    print(f"[SUBNET] broker with {len(rows)} devices in {len(subnets)} subnets: "
+          f"results p50={percentile(results, 50)} latency p50={percentile(latencies, 50) * 1000:.2f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.2f}ms")
+
+
+# -----------------------------
+# Command-line interface
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Subnet visibility lookups: prefix-trie index vs full scan")
+    parser.add_argument("--devices", type=int, nargs="+", default=[10000, 50000, 100000], help="fleet sizes to build")
+    parser.add_argument("--subnets", type=int, default=5000)
+    parser.add_argument("--public", type=float, default=0.005, help="fraction of public devices")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--verify", type=int, default=50, help="lookups also run as a full scan and compared")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--broker", action="store_true", help="query /api/visible_devices on the dispatcher instead")
+    args = parser.parse_args()
+    if args.broker:
+        run_broker(args)
+    else:
+        run_local(args)
+
+
+if __name__ == "__main__":
+    main()
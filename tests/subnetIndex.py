@@ -0,0 +1,144 @@
+import ipaddress
+
+# -----------------------------
+# Subnet visibility index
+# -----------------------------
+# Python twin of dispatcher/src/subnets.js, for the simulators and benchmarks. A client
+# sees a device when their subnets overlap or the device is public. Device subnets sit in
+# a binary prefix trie over the IPv4 bits, so a lookup visits the path down to the
+# client's prefix plus the client's own subtree, never the whole device table.
+
+
+def parse_cidr(text):
+    """(address as int, prefix length) for an IPv4 CIDR or address, else None."""
+    try:
+        net = ipaddress.IPv4Network(str(text).strip(), strict=False)
+    except (ipaddress.AddressValueError, ipaddress.NetmaskValueError, ValueError):
+        return None
+    return int(net.network_address), net.prefixlen
+
+
+def is_public(value):
+    return value is True or str(value).lower() == "true"
+
+
+def overlaps(a, b):
+    """True when two parsed CIDRs share addresses (one contains the other)."""
+    length = min(a[1], b[1])
+    shift = 32 - length
+    return a[0] >> shift == b[0] >> shift
+
+
+class _Node:
+    __slots__ = ("parent", "children", "devices")
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.children = [None, None]
+        self.devices = None  # set of device ids registered with exactly this prefix
+
+
+class SubnetIndex:
+    """Prefix trie of device subnets plus a public-device set, updated one row at a time."""
+
+    def __init__(self):
+        self.root = _Node()
+        self.devices = {}   # device_id -> (row, node or None)
+        self.public = set()
+        self.unparsed = {}  # raw subnet string -> set of device ids
+        self.nodes = 1
+
+    def add(self, row):
+        device_id = row["device_id"]
+        if device_id in self.devices:
+            self.remove(device_id)
+        node = None
+        cidr = parse_cidr(row.get("subnet"))
+        if cidr:
+            address, length = cidr
+            node = self.root
+            for depth in range(length):
+                bit = (address >> (31 - depth)) & 1
+                if node.children[bit] is None:
+                    node.children[bit] = _Node(node)
+                    self.nodes += 1
+                node = node.children[bit]
+            if node.devices is None:
+                node.devices = set()
+            node.devices.add(device_id)
+        elif row.get("subnet"):
+            self.unparsed.setdefault(row["subnet"], set()).add(device_id)
+        if is_public(row.get("is_public")):
+            self.public.add(device_id)
+        self.devices[device_id] = (row, node)
+
+    def remove(self, device_id):
+        entry = self.devices.pop(device_id, None)
+        if entry is None:
+            return False
+        row, node = entry
+        self.public.discard(device_id)
+        if node is not None:
+            node.devices.discard(device_id)
+            if not node.devices:
+                node.devices = None
+            # Prune empty branches so subtree walks only visit nodes that lead to devices
+            while node.parent is not None and node.devices is None and node.children == [None, None]:
+                parent = node.parent
+                parent.children[0 if parent.children[0] is node else 1] = None
+                self.nodes -= 1
+                node = parent
+        elif row.get("subnet") in self.unparsed:
+            ids = self.unparsed[row["subnet"]]
+            ids.discard(device_id)
+            if not ids:
+                del self.unparsed[row["subnet"]]
+        return True
+
+    def matching(self, subnet):
+        """Device ids whose subnet overlaps `subnet` (public devices not added)."""
+        cidr = parse_cidr(subnet)
+        if cidr is None:
+            return list(self.unparsed.get(subnet, ()))
+        address, length = cidr
+        out = []
+        node = self.root
+        for depth in range(length):
+            if node.devices:
+                out.extend(node.devices)
+            node = node.children[(address >> (31 - depth)) & 1]
+            if node is None:
+                return out
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.devices:
+                out.extend(n.devices)
+            for child in n.children:
+                if child is not None:
+                    stack.append(child)
+        return out
+
+    def visible(self, subnet, include_public=True):
+        """Rows visible from `subnet`: overlapping subnets, then the other public devices."""
+        ids = self.matching(subnet)
+        rows = [self.devices[i][0] for i in ids]
+        if include_public:
+            seen = set(ids)
+            rows.extend(self.devices[i][0] for i in self.public if i not in seen)
+        return rows
+
+    def can_see(self, subnet, device_id):
+        entry = self.devices.get(device_id)
+        if entry is None:
+            return False
+        if device_id in self.public:
+            return True
+        client, device = parse_cidr(subnet), parse_cidr(entry[0].get("subnet"))
+        if client is None or device is None:
+            return subnet == entry[0].get("subnet")
+        return overlaps(client, device)
+
+    def stats(self):
+        return {"devices": len(self.devices), "public": len(self.public),
+                "nodes": self.nodes, "unparsed": len(self.unparsed)}
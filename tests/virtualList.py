@@ -0,0 +1,175 @@
+import bisect
+import tkinter as tk
+
+# -----------------------------
+# Virtualized list widget
+# -----------------------------
+# A Tk Listbox holding every row of a large fleet costs a Tcl call per insert and a full
+# relayout per change, and clearing and refilling it freezes the main loop. VirtualList
+# keeps the rows in a keyed model with a sorted, filtered view, and the Listbox only ever
+# holds the rows that fit on screen; the scrollbar moves a window over the view.
+# Main-thread only, like every other Tk call.
+
+
+class VirtualList(tk.Frame):
+    """Keyed, sorted, filterable list that materializes only the visible rows.
+
+    `set(key, text, row)` inserts or updates a row, `remove(key)` drops it; rows are
+    ordered by text. `set_filter(predicate)` shows only rows where `predicate(row)` is
+    true. Changes are drawn on the next `render()` (scheduled automatically when idle).
+    """
+
+    def __init__(self, master, height=10, on_select=None, **listbox_options):
+        super().__init__(master)
+        self.height = height
+        self.on_select = on_select
+        self.items = {}       # key -> (text, row)
+        self.view = []        # sorted (text, key) for rows passing the filter
+        self.predicate = None
+        self.top = 0          # index in view of the first materialized row
+        self.selected = None  # key of the selected row, kept while it scrolls out of view
+        self.shown = []       # keys currently materialized, top to bottom
+        self._pending = False
+
+        self.listbox = tk.Listbox(self, height=height, exportselection=False, **listbox_options)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self._yview)
+        self.listbox.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+
+        self.listbox.bind("<<ListboxSelect>>", self._on_listbox_select)
+        self.listbox.bind("<MouseWheel>", lambda e: self._scroll(-1 if e.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda e: self._scroll(-1))
+        self.listbox.bind("<Button-5>", lambda e: self._scroll(1))
+        self.listbox.bind("<Up>", lambda e: self._step(-1))
+        self.listbox.bind("<Down>", lambda e: self._step(1))
+        self.listbox.bind("<Prior>", lambda e: self._scroll(-self.height))
+        self.listbox.bind("<Next>", lambda e: self._scroll(self.height))
+
+    # -----------------------------
+    # Model
+    # -----------------------------
+    def set(self, key, text, row=None):
+        old = self.items.get(key)
+        if old is not None and old == (text, row):
+            return
+        if old is not None:
+            self._unview(old[0], key)
+        self.items[key] = (text, row)
+        if self.predicate is None or self.predicate(row):
+            bisect.insort(self.view, (text, key))
+        elif key == self.selected:
+            self.selected = None  # never act on a row the filter hides
+        self._schedule()
+
+    def remove(self, key):
+        old = self.items.pop(key, None)
+        if old is None:
+            return
+        self._unview(old[0], key)
+        if key == self.selected:
+            self.selected = None
+        self._schedule()
+
+    def _unview(self, text, key):
+        i = bisect.bisect_left(self.view, (text, key))
+        if i < len(self.view) and self.view[i] == (text, key):
+            del self.view[i]
+
+    def set_filter(self, predicate=None):
+        """Show only rows where `predicate(row)` is true (None shows everything)."""
+        self.predicate = predicate
+        self.view = sorted((text, key) for key, (text, row) in self.items.items()
+                           if predicate is None or predicate(row))
+        if self.selected in self.items and not (predicate is None or predicate(self.items[self.selected][1])):
+            self.selected = None
+        self.top = 0
+        self._schedule()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def row(self, key):
+        item = self.items.get(key)
+        return item[1] if item else None
+
+    def selected_key(self):
+        return self.selected if self.selected in self.items else None
+
+    # -----------------------------
+    # Rendering
+    # -----------------------------
+    def _schedule(self):
+        if not self._pending:
+            self._pending = True
+            self.after_idle(self.render)
+
+    def render(self):
+        """Redraw the visible window; only rows whose text changed touch the Listbox."""
+        self._pending = False
+        total = len(self.view)
+        self.top = max(0, min(self.top, total - self.height))
+        window = self.view[self.top:self.top + self.height]
+        keys = [key for _, key in window]
+        for i, (text, _) in enumerate(window):
+            if i >= self.listbox.size():
+                self.listbox.insert(tk.END, text)
+            elif self.listbox.get(i) != text:
+                self.listbox.delete(i)
+                self.listbox.insert(i, text)
+        if self.listbox.size() > len(window):
+            self.listbox.delete(len(window), tk.END)
+        self.shown = keys
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected in keys:
+            self.listbox.selection_set(keys.index(self.selected))
+        if total > self.height:
+            self.scrollbar.set(self.top / total, (self.top + len(window)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _yview(self, *args):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", n, "units" | "pages")."""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.view))
+            self.render()
+        elif args[0] == "scroll":
+            self._scroll(int(args[1]) * (self.height if args[2] == "pages" else 1))
+
+    def _scroll(self, rows):
+        self.top += rows
+        self.render()
+        return "break"
+
+    def _step(self, rows):
+        """Arrow keys move the selection through the whole view, scrolling as needed."""
+        if not self.view:
+            return "break"
+        item = self.items.get(self.selected)
+        index = self.top
+        if item is not None:
+            i = bisect.bisect_left(self.view, (item[0], self.selected))
+            if i < len(self.view) and self.view[i][1] == self.selected:
+                index = i + rows
+        index = max(0, min(index, len(self.view) - 1))
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self.height:
+            self.top = index - self.height + 1
+        self.selected = self.view[index][1]
+        self.render()
+        if self.on_select:
+            self.on_select(self.selected)
+        return "break"
+
+    def _on_listbox_select(self, event):
+        sel = self.listbox.curselection()
+        if not sel or sel[0] >= len(self.shown):
+            return
+        self.selected = self.shown[sel[0]]
+        if self.on_select:
+            self.on_select(self.selected)